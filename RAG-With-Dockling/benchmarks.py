@@ -0,0 +1,223 @@
+"""Offline benchmarks for the Excel RAG ingestion and retrieval helpers.
+
+Usage:
+    python benchmarks.py tabular [--rows N] [--queries Q] [--top-k K] [--embed-model NAME] [--skip-docling]
+    python benchmarks.py hybrid [--rows N] [--queries Q] [--top-k K] [--embed-model NAME] [--budget-ms MS]
+    python benchmarks.py embed [--rows N] [--models NAME ...] [--backends NAME ...]
+"""
+import argparse
+import io
+import multiprocessing
+import random
+import resource
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from llama_index.core import Document, VectorStoreIndex
+from llama_index.core.node_parser import SentenceSplitter
+
+from conversion_cache import ConversionCache
+from keyword_index import BM25Index, HybridRetriever
+from sheet_reader import workbook_nodes
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+PRODUCTS = ["Laptop", "Monitor", "Keyboard", "Mouse", "Docking station", "Headset", "Webcam", "Tablet"]
+
+
+def synthetic_orders(num_rows: int, seed: int = 0) -> pd.DataFrame:
+    """An order log: one rectangular sheet with a unique id per row, like most of our workbooks."""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "Order ID": [f"ORD-{i:07d}" for i in range(num_rows)],
+        "Customer": [f"Customer {rng.randrange(5000):04d}" for _ in range(num_rows)],
+        "Region": [rng.choice(REGIONS) for _ in range(num_rows)],
+        "Product": [rng.choice(PRODUCTS) for _ in range(num_rows)],
+        "Quantity": [rng.randint(1, 50) for _ in range(num_rows)],
+        "Unit Price": [round(rng.uniform(10, 2000), 2) for _ in range(num_rows)],
+    })
+
+
+def to_xlsx(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False, sheet_name="Orders")
+    return buffer.getvalue()
+
+
+def docling_nodes(file_bytes: bytes):
+    """The original path: Docling markdown, then SentenceSplitter(512, 50) as in app.py."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        docs = ConversionCache(cache_dir, workers=1).convert([("orders.xlsx", file_bytes)])[0]
+    return SentenceSplitter(chunk_size=512, chunk_overlap=50).get_nodes_from_documents(docs)
+
+
+def hit_rate(retrieve, questions: list[tuple[str, str]]) -> tuple[float, list[float]]:
+    """Share of questions whose order id appears in a retrieved text, and ms per question."""
+    hits, latencies = 0, []
+    for question, order_id in questions:
+        started = time.perf_counter()
+        texts = retrieve(question)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += any(order_id in text for text in texts)
+    return hits / len(questions), latencies
+
+
+def order_questions(df: pd.DataFrame, num_questions: int) -> list[tuple[str, str]]:
+    """Questions that each name one order id, paired with that id."""
+    rng = random.Random(1)
+    questions = []
+    for row in df.sample(num_questions, random_state=1).itertuples(index=False):
+        template = rng.choice(["How many units of {product} were in order {order}?",
+                               "Which customer placed order {order}?",
+                               "What was the unit price on order {order} in the {region} region?"])
+        questions.append((template.format(product=row[3], order=row[0], region=row[2]), row[0]))
+    return questions
+
+
+def bench_tabular(args) -> None:
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    df = synthetic_orders(args.rows)
+    file_bytes = to_xlsx(df)
+    questions = order_questions(df, args.queries)
+
+    embed_model = HuggingFaceEmbedding(model_name=args.embed_model, embed_batch_size=args.embed_batch_size)
+    paths = [("sheet rows", lambda: workbook_nodes("orders.xlsx", file_bytes, rows_per_node=args.rows_per_node))]
+    if not args.skip_docling:
+        paths.append(("docling + SentenceSplitter", lambda: docling_nodes(file_bytes)))
+
+    print(f"{args.rows} rows, {len(file_bytes) / 2**20:.1f} MB xlsx, {args.queries} questions, top-{args.top_k}")
+    print(f"{'path':28} {'nodes':>8} {'parse s':>9} {'embed s':>9} {'total s':>9} {f'hit@{args.top_k}':>7}")
+    for name, parse in paths:
+        started = time.perf_counter()
+        nodes = parse()
+        parsed = time.perf_counter()
+        index = VectorStoreIndex(nodes=nodes, embed_model=embed_model)
+        embedded = time.perf_counter()
+        retriever = index.as_retriever(similarity_top_k=args.top_k)
+        hits, _ = hit_rate(lambda q: [r.node.get_content() for r in retriever.retrieve(q)], questions)
+        print(f"{name:28} {len(nodes):8d} {parsed - started:9.1f} {embedded - parsed:9.1f} "
+              f"{embedded - started:9.1f} {hits:7.2f}")
+
+
+def bench_hybrid(args) -> None:
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    df = synthetic_orders(args.rows)
+    nodes = workbook_nodes("orders.xlsx", to_xlsx(df))
+    questions = order_questions(df, args.queries)
+
+    embed_model = HuggingFaceEmbedding(model_name=args.embed_model, embed_batch_size=args.embed_batch_size)
+    index = VectorStoreIndex(nodes=nodes, embed_model=embed_model)
+    started = time.perf_counter()
+    keyword_index = BM25Index(nodes)
+    build_seconds = time.perf_counter() - started
+
+    vector = index.as_retriever(similarity_top_k=args.top_k)
+    hybrid = HybridRetriever(index, keyword_index, similarity_top_k=args.top_k,
+                             candidates=args.candidates, budget_ms=args.budget_ms)
+    variants = [
+        ("vector", lambda q: [r.node.get_content() for r in vector.retrieve(q)]),
+        ("bm25", lambda q: [keyword_index.nodes[i].get_content()
+                            for i, _ in keyword_index.search(q, args.top_k, args.budget_ms)]),
+        ("hybrid (rrf)", lambda q: [r.node.get_content() for r in hybrid.retrieve(q)]),
+    ]
+    print(f"{len(nodes)} row nodes, {args.queries} id-style questions, BM25 built in {build_seconds:.1f}s")
+    print(f"{'retriever':14} {f'hit@{args.top_k}':>7} {'ms p50':>8} {'ms p95':>8}")
+    for name, retrieve in variants:
+        hits, latencies = hit_rate(retrieve, questions)
+        print(f"{name:14} {hits:7.2f} {np.percentile(latencies, 50):8.2f} {np.percentile(latencies, 95):8.2f}")
+
+
+def embed_texts(num_rows: int) -> list[str]:
+    """What ingestion embeds: one short text per sheet row, plus 512-token chunks of the same rows."""
+    texts = [node.get_content() for node in workbook_nodes("orders.xlsx", to_xlsx(synthetic_orders(num_rows)))]
+    splitter = SentenceSplitter(chunk_size=512, chunk_overlap=50)
+    return texts + [node.get_content() for node in splitter.get_nodes_from_documents([Document(text="\n\n".join(texts))])]
+
+
+def _embed_run(model_name: str, setup: str, texts: list[str], max_batch_tokens: int, cache_dir: str) -> dict:
+    """Runs in a fresh process, so peak RSS covers this model and backend only."""
+    started = time.perf_counter()
+    if setup == "current":
+        # What the apps did before: a plain HuggingFaceEmbedding with app.py's batches of 10
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        embed_model = HuggingFaceEmbedding(model_name=model_name, embed_batch_size=10)
+    else:
+        from embedding_models import get_embedding_model
+        embed_model = get_embedding_model(model_name, setup, max_batch_tokens=max_batch_tokens, cache_dir=cache_dir)
+    loaded = time.perf_counter()
+    embeddings = embed_model.get_text_embedding_batch(texts)
+    embedded = time.perf_counter()
+    return {
+        "load_s": loaded - started,
+        "docs_per_s": len(texts) / (embedded - loaded),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KiB on Linux
+        "embeddings": np.asarray(embeddings[:200], dtype=np.float32),
+    }
+
+
+def bench_embed(args) -> None:
+    from embedding_models import resolve_backend
+
+    texts = embed_texts(args.rows)
+    context = multiprocessing.get_context("spawn")
+    print(f"{len(texts)} texts ({args.rows} sheet rows + their 512-token chunks)")
+    print(f"{'model':40} {'setup':10} {'load s':>7} {'docs/s':>8} {'peak RSS MB':>12} {'cos vs current':>15}")
+    for model_name in args.models:
+        baseline = None
+        for setup in ["current", *args.backends]:
+            if setup != "current" and resolve_backend(setup) != setup:
+                print(f"{model_name:40} {setup:10} skipped: onnxruntime/optimum not installed")
+                continue
+            with context.Pool(1) as pool:
+                result = pool.apply(_embed_run, (model_name, setup, texts, args.max_batch_tokens, args.cache_dir))
+            if baseline is None:
+                baseline = result["embeddings"]
+            # Both sides are normalized, so the row-wise dot product is the cosine similarity
+            cosine = float(np.mean(np.sum(baseline * result["embeddings"], axis=1)))
+            print(f"{model_name:40} {setup:10} {result['load_s']:7.1f} {result['docs_per_s']:8.1f} "
+                  f"{result['peak_rss_mb']:12.0f} {cosine:15.4f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tabular = subparsers.add_parser("tabular", help="ingestion time and hit rate: sheet rows vs Docling")
+    tabular.add_argument("--rows", type=int, default=100_000)
+    tabular.add_argument("--rows-per-node", type=int, default=1)
+    tabular.add_argument("--queries", type=int, default=100)
+    tabular.add_argument("--top-k", type=int, default=3, help="app.py retrieves 3 nodes per question")
+    tabular.add_argument("--embed-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    tabular.add_argument("--embed-batch-size", type=int, default=64)
+    tabular.add_argument("--skip-docling", action="store_true", help="only time the sheet-row path")
+    tabular.set_defaults(func=bench_tabular)
+
+    hybrid = subparsers.add_parser("hybrid", help="hit rate of vector, BM25 and fused retrieval on id lookups")
+    hybrid.add_argument("--rows", type=int, default=100_000)
+    hybrid.add_argument("--queries", type=int, default=200)
+    hybrid.add_argument("--top-k", type=int, default=3)
+    hybrid.add_argument("--candidates", type=int, default=20, help="nodes proposed by each retriever before fusion")
+    hybrid.add_argument("--budget-ms", type=float, default=3.0, help="BM25 scoring budget per query")
+    hybrid.add_argument("--embed-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    hybrid.add_argument("--embed-batch-size", type=int, default=64)
+    hybrid.set_defaults(func=bench_hybrid)
+
+    embed = subparsers.add_parser("embed", help="docs/sec and peak RSS per embedding model and backend")
+    embed.add_argument("--rows", type=int, default=5_000)
+    embed.add_argument("--models", nargs="+",
+                       default=["sentence-transformers/all-MiniLM-L6-v2", "BAAI/bge-large-en-v1.5"])
+    embed.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx-int8"],
+                       help="compared against the current setup: HuggingFaceEmbedding with batches of 10")
+    embed.add_argument("--max-batch-tokens", type=int, default=16384)
+    embed.add_argument("--cache-dir", default="embedding_models", help="where int8 ONNX exports are kept")
+    embed.set_defaults(func=bench_embed)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
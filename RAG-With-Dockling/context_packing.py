@@ -0,0 +1,124 @@
+import logging
+from typing import Any, Generator, Optional, Sequence, cast
+
+import tiktoken
+from llama_index.core.response_synthesizers import SimpleSummarize
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.types import RESPONSE_TEXT_TYPE
+
+logger = logging.getLogger(__name__)
+
+# Chat-template tokens (begin-of-text, role headers, end-of-turn) when the tokenizer cannot measure them
+DEFAULT_PROMPT_OVERHEAD = 32
+
+
+class PackedSynthesizer(SimpleSummarize):
+    """Answers from one prompt holding the best chunks that fit, with exactly one LLM call.
+
+    CompactAndRefine sends a refine call per overflow, each waiting on the
+    previous answer. Instead, every chunk is counted with a real tokenizer and
+    chunks are packed by retrieval score until the prompt would exceed the
+    model's context window minus its output tokens and the tokens its chat
+    template and system prompt add around the prompt; lower-scored chunks that
+    do not fit are dropped, and only a single chunk larger than the whole
+    budget gets truncated. The budget split is logged and attached to the
+    response metadata under `context_packing`.
+
+    Tokens are counted with `tokenizer`, a Hugging Face tokenizer of the
+    answering model, whose chat template then also measures the overhead. Without
+    one they are counted with the tiktoken `encoding`, the overhead is
+    `prompt_overhead` (default `DEFAULT_PROMPT_OVERHEAD`) plus the system prompt,
+    and `safety_margin` keeps that fraction of the budget free to absorb the
+    difference between cl100k and the model's tokenizer.
+    """
+
+    def __init__(self, *args: Any, context_window: Optional[int] = None, num_output: Optional[int] = None,
+                 encoding: str = "cl100k_base", tokenizer: Optional[Any] = None, safety_margin: float = 0.0,
+                 prompt_overhead: Optional[int] = None, separator: str = "\n\n", **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        metadata = self._llm.metadata
+        self.context_window = context_window or metadata.context_window
+        self.num_output = num_output if num_output is not None else max(metadata.num_output, 0)
+        self.safety_margin = safety_margin
+        self.separator = separator
+        self._tokenizer = tokenizer
+        self._encoding = None if tokenizer is not None else tiktoken.get_encoding(encoding)
+        self.prompt_overhead = prompt_overhead if prompt_overhead is not None else self._chat_overhead()
+
+    def _chat_overhead(self) -> int:
+        """Tokens the chat template and the LLM's system prompt add around the prompt."""
+        system_prompt = getattr(self._llm, "system_prompt", None) or ""
+        if self._tokenizer is not None and getattr(self._tokenizer, "chat_template", None):
+            messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+            return len(self._tokenizer.apply_chat_template(messages + [{"role": "user", "content": ""}],
+                                                           tokenize=True, add_generation_prompt=True,
+                                                           return_dict=False))
+        return DEFAULT_PROMPT_OVERHEAD + self.count_tokens(system_prompt)
+
+    def _encode(self, text: str) -> list[int]:
+        if self._tokenizer is not None:
+            return self._tokenizer.encode(text, add_special_tokens=False)
+        return self._encoding.encode(text, disallowed_special=())
+
+    def _decode(self, tokens: list[int]) -> str:
+        return (self._tokenizer or self._encoding).decode(tokens)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._encode(text))
+
+    def pack(self, query_str: str, nodes: Sequence[NodeWithScore]) -> tuple[list[NodeWithScore], dict]:
+        """The highest-scoring nodes whose text fits the prompt budget, plus packing stats."""
+        template = self._text_qa_template.partial_format(query_str=query_str)
+        budget = (int((self.context_window - self.num_output) * (1 - self.safety_margin))
+                  - self.prompt_overhead - self.count_tokens(template.format(context_str="")))
+        # Tokens can re-merge where texts are joined; one token of slack per chunk covers it
+        separator_tokens = self.count_tokens(self.separator) + 1
+
+        packed, used, dropped_tokens = [], 0, 0
+        for node in sorted(nodes, key=lambda n: n.score or 0.0, reverse=True):
+            text = node.node.get_content(metadata_mode=MetadataMode.LLM)
+            tokens = self.count_tokens(text) + (separator_tokens if packed else 1)
+            if used + tokens <= budget:
+                packed.append(node)
+                used += tokens
+            elif not packed and budget > 0:
+                # Even the best chunk alone overflows: keep its head rather than answering blind
+                raw_tokens = self._encode(node.node.get_content(metadata_mode=MetadataMode.NONE))
+                keep = budget - (tokens - len(raw_tokens))  # Metadata lines stay whole, slack included
+                while True:
+                    head = node.node.model_copy(update={"text": self._decode(raw_tokens[:max(keep, 0)])})
+                    used = self.count_tokens(head.get_content(metadata_mode=MetadataMode.LLM)) + 1
+                    if used <= budget or keep <= 0:
+                        break
+                    keep -= used - budget  # Re-encoding at the cut can merge or split a token
+                packed.append(NodeWithScore(node=head, score=node.score))
+                dropped_tokens += tokens - used
+            else:
+                dropped_tokens += tokens
+
+        stats = {
+            "budget_tokens": budget,
+            "packed_chunks": len(packed),
+            "packed_tokens": used,
+            "dropped_chunks": len(nodes) - len(packed),
+            "dropped_tokens": dropped_tokens,
+        }
+        logger.info("Context packing: %(packed_chunks)d chunks / %(packed_tokens)d tokens packed, "
+                    "%(dropped_chunks)d chunks / %(dropped_tokens)d tokens dropped, "
+                    "budget %(budget_tokens)d tokens", stats)
+        return packed, stats
+
+    def synthesize(self, query, nodes: list[NodeWithScore], additional_source_nodes=None, **response_kwargs: Any):
+        query_str = query.query_str if isinstance(query, QueryBundle) else query
+        packed, stats = self.pack(query_str, nodes)
+        response = super().synthesize(query, packed, additional_source_nodes, **response_kwargs)
+        response.metadata = {**(response.metadata or {}), "context_packing": stats}
+        return response
+
+    def get_response(self, query_str: str, text_chunks: Sequence[str], **kwargs: Any) -> RESPONSE_TEXT_TYPE:
+        # Chunks were packed to fit in synthesize(): one call, no further truncation or refining
+        text_qa_template = self._text_qa_template.partial_format(query_str=query_str)
+        context_str = self.separator.join(text_chunks)
+        if self._streaming:
+            return cast(Generator, self._llm.stream(text_qa_template, context_str=context_str, **kwargs))
+        return self._llm.predict(text_qa_template, context_str=context_str, **kwargs) or "Empty Response"
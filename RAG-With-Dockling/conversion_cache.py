@@ -0,0 +1,112 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+
+from llama_index.core import Document
+
+from index_store import file_digest
+
+# DoclingReader of a pool worker, created once: building a DocumentConverter loads its models
+_reader = None
+_reader_export_type = None
+
+
+def converter_version() -> str:
+    """Version of the installed Docling converter; a new version invalidates cached conversions."""
+    try:
+        return version("docling")
+    except PackageNotFoundError:
+        return "unknown"
+
+
+def _get_reader(export_type: str):
+    global _reader, _reader_export_type
+    if _reader is None or _reader_export_type != export_type:
+        from llama_index.readers.docling import DoclingReader
+        _reader = DoclingReader(export_type=export_type)
+        _reader_export_type = export_type
+    return _reader
+
+
+def _convert_file(file_path: str, export_type: str) -> list[str]:
+    """Runs Docling on one file in a pool worker and returns the exported texts."""
+    return [doc.text for doc in _get_reader(export_type).load_data(file_path)]
+
+
+class ConversionCache:
+    """Docling conversions on disk, keyed by file hash, converter version and export type.
+
+    Conversion is the slowest step before embedding, and its output does not
+    depend on chunking or the embedding model, so re-chunking or switching
+    models reuses it. Files missing from the cache are converted in a shared
+    pool of `workers` processes, each keeping its own Docling converter, so
+    a batch of files (or several threads calling `convert` at once) converts
+    in parallel.
+    """
+
+    def __init__(self, root: str = "conversion_cache", export_type: str = "markdown", workers: int | None = None):
+        self.root = root
+        self.export_type = export_type
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.version = converter_version()
+        self._lock = threading.Lock()
+        self._pool = None
+        os.makedirs(root, exist_ok=True)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Started on first use and kept, so workers load Docling's models once for the whole process
+        with self._lock:
+            if self._pool is None:
+                mp_context = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context)
+            return self._pool
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, f"{digest}-{self.version}-{self.export_type}.json")
+
+    def get(self, digest: str) -> list[str] | None:
+        try:
+            with open(self._path(digest)) as f:
+                return json.load(f)["texts"]
+        except FileNotFoundError:
+            return None
+
+    def put(self, digest: str, texts: list[str]) -> None:
+        tmp_path = f"{self._path(digest)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"converter": self.version, "export_type": self.export_type, "texts": texts}, f)
+        os.replace(tmp_path, self._path(digest))
+
+    def convert(self, files: list[tuple[str, bytes]]) -> list[list[Document]]:
+        """Returns LlamaIndex documents for each `(file_name, file_bytes)`, converting only cache misses."""
+        digests = [file_digest(data) for _, data in files]
+        texts = [self.get(digest) for digest in digests]
+        misses = [i for i, cached in enumerate(texts) if cached is None]
+        if misses:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                paths = {}
+                for i in misses:
+                    name, data = files[i]
+                    # Keep the original name (Docling picks the format from the extension)
+                    paths[i] = os.path.join(temp_dir, str(i), name)
+                    os.makedirs(os.path.dirname(paths[i]))
+                    with open(paths[i], "wb") as f:
+                        f.write(data)
+
+                pool = self._get_pool()
+                futures = {i: pool.submit(_convert_file, paths[i], self.export_type) for i in misses}
+                for i, future in futures.items():
+                    texts[i] = future.result()
+            for i in misses:
+                self.put(digests[i], texts[i])
+
+        return [
+            [Document(doc_id=f"{digest}-{n}", text=text, metadata={"file_name": name})
+             for n, text in enumerate(file_texts)]
+            for (name, _), digest, file_texts in zip(files, digests, texts)
+        ]
@@ -0,0 +1,136 @@
+import glob
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.embeddings.huggingface.utils import get_query_instruct_for_model_name
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Process-wide: every session and both retrieval paths share one loaded copy per model/backend
+_models: dict[tuple, Future] = {}
+_lock = threading.Lock()
+_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-load")
+
+
+def resolve_backend(backend: str) -> str:
+    """The requested backend, or "torch" when onnxruntime/optimum are not installed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    if backend != "torch":
+        try:
+            import onnxruntime  # noqa: F401
+            import optimum.onnxruntime  # noqa: F401
+        except ImportError: # Missing, or an optimum release that does not match transformers
+            return "torch"
+    return backend
+
+
+class AdaptiveBatchEmbedding(HuggingFaceEmbedding):
+    """HuggingFaceEmbedding whose batches are sized by token count instead of a fixed number of texts.
+
+    Texts are sorted by tokenized length and grouped so that each batch pads to at
+    most `max_batch_tokens` tokens: one-line sheet rows go through hundreds at a
+    time, while full 512-token chunks go through a few dozen. Set a large
+    `embed_batch_size` so each call has enough texts to group.
+    """
+
+    def __init__(self, *args, max_batch_tokens: int = 16384, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._max_batch_tokens = max_batch_tokens
+
+    def _batches(self, texts: List[str]) -> List[List[int]]:
+        lengths = self._model.tokenizer(texts, truncation=True, max_length=self.max_length,
+                                        return_length=True)["length"]
+        order = sorted(range(len(texts)), key=lambda i: lengths[i], reverse=True)
+        batches, batch = [], []
+        for i in order:
+            # Sorted longest first, so the batch's first text sets the padded length
+            if batch and (len(batch) + 1) * lengths[batch[0]] > self._max_batch_tokens:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        return batches + [batch] if batch else batches
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        embeddings: List[List[float]] = [[] for _ in texts]
+        for batch in self._batches(texts):
+            vectors = self._model.encode([texts[i] for i in batch], batch_size=len(batch), prompt_name="text",
+                                         normalize_embeddings=self.normalize)
+            for i, vector in zip(batch, vectors.tolist()):
+                embeddings[i] = vector
+        return embeddings
+
+
+def _quantized_model(model_name: str, cache_dir: str, int8_config: str, trust_remote_code: bool) -> tuple[str, str]:
+    """Local folder and file name of an int8 ONNX export of `model_name`, quantizing it on first use."""
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    path = os.path.join(cache_dir, f"{model_name.replace('/', '__')}-int8-{int8_config}")
+    if not glob.glob(os.path.join(path, "onnx", f"*int8_{int8_config}.onnx")):
+        tmp_path = os.path.join(cache_dir, f".tmp-{uuid.uuid4().hex}")
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu", trust_remote_code=trust_remote_code)
+        model.save(tmp_path)
+        export_dynamic_quantized_onnx_model(model, int8_config, tmp_path)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    # Named model_qint8_<config> or model_quint8_<config> depending on the config's weight type
+    return path, os.path.relpath(glob.glob(os.path.join(path, "onnx", f"*int8_{int8_config}.onnx"))[0], path)
+
+
+def _load(model_name: str, backend: str, max_batch_tokens: int, embed_batch_size: int, cache_dir: str,
+          int8_config: str, trust_remote_code: bool) -> AdaptiveBatchEmbedding:
+    kwargs = dict(max_batch_tokens=max_batch_tokens, embed_batch_size=embed_batch_size,
+                  trust_remote_code=trust_remote_code)
+    if backend == "torch":
+        embed_model = AdaptiveBatchEmbedding(model_name=model_name, **kwargs)
+    elif backend == "onnx":
+        embed_model = AdaptiveBatchEmbedding(model_name=model_name, device="cpu", backend="onnx", **kwargs)
+    else:
+        path, file_name = _quantized_model(model_name, cache_dir, int8_config, trust_remote_code)
+        # Loaded from a local folder, so pass the query instruction (BGE) the model name would have picked
+        embed_model = AdaptiveBatchEmbedding(model_name=path, device="cpu", backend="onnx",
+                                             model_kwargs={"file_name": file_name},
+                                             query_instruction=get_query_instruct_for_model_name(model_name),
+                                             **kwargs)
+    # Warm up: the first batches pay for graph setup and memory allocation, not the first user
+    embed_model.get_text_embedding_batch(["warm up"] * 8)
+    embed_model.get_query_embedding("warm up")
+    return embed_model
+
+
+def _model_key(model_name: str, backend: str = "torch", max_batch_tokens: int = 16384,
+               embed_batch_size: int = 1024, cache_dir: str = "embedding_models", int8_config: str = "avx2",
+               trust_remote_code: bool = False) -> tuple:
+    return (model_name, backend, max_batch_tokens, embed_batch_size, cache_dir, int8_config, trust_remote_code)
+
+
+def preload_embedding_model(model_name: str, backend: str = "torch", **options) -> Future:
+    """Starts loading a model in the background, once per process, and returns its future.
+
+    `options` are max_batch_tokens, embed_batch_size, cache_dir (int8 exports),
+    int8_config (a sentence-transformers quantization config such as "avx2",
+    "avx512_vnni" or "arm64") and trust_remote_code.
+    """
+    key = _model_key(model_name, backend, **options)
+    with _lock:
+        if key not in _models:
+            _models[key] = _loader.submit(_load, *key)
+        return _models[key]
+
+
+def get_embedding_model(model_name: str, backend: str = "torch", **options) -> AdaptiveBatchEmbedding:
+    """The shared, warmed-up embedding model, waiting for it if it is still loading."""
+    key = _model_key(model_name, backend, **options)
+    future = preload_embedding_model(model_name, backend, **options)
+    try:
+        return future.result()
+    except Exception:
+        with _lock: # Let the next call retry instead of re-raising a stale failure forever
+            if _models.get(key) is future:
+                del _models[key]
+        raise
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+from llama_index.core import StorageContext, VectorStoreIndex, load_index_from_storage
+
+LAST_USED_FILE = "last_used"
+
+
+def file_digest(data: bytes) -> str:
+    """Content hash of an uploaded file; renamed copies of the same workbook share it."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def index_key(digest: str, config: dict) -> str:
+    """Storage key for a file indexed with a given reader/chunking/embedding config."""
+    payload = json.dumps({"file": digest, "config": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class IndexStorage:
+    """Persisted LlamaIndex indexes on local disk, shared by every session.
+
+    Each index lives in `root/<key>/`, where the key hashes the file content
+    together with the chunking and embedding config, so changing either one
+    builds a new index instead of reusing a stale one. Indexes are only read
+    from disk when a session asks for them. Each load or save stamps the
+    entry's `last_used` file, and once the entries exceed `max_bytes` the least
+    recently used ones are deleted.
+    """
+
+    def __init__(self, root: str = "index_storage", max_bytes: int = 2 * 1024**3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.isdir(self._path(key))
+
+    def _touch(self, key: str) -> None:
+        with open(os.path.join(self._path(key), LAST_USED_FILE), "w") as f:
+            f.write(str(time.time()))
+
+    def load(self, key: str, embed_model=None) -> VectorStoreIndex | None:
+        """Loads a persisted index, or returns None if it was never built (or was evicted)."""
+        with self._lock:
+            if key not in self:
+                return None
+            self._touch(key)
+            storage_context = StorageContext.from_defaults(persist_dir=self._path(key))
+        return load_index_from_storage(storage_context, embed_model=embed_model)
+
+    def save(self, key: str, index: VectorStoreIndex) -> None:
+        """Persists an index under `key`, then evicts least recently used entries over budget."""
+        # Persist to a private folder and rename it into place, so readers never see a partial index
+        tmp_path = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        index.storage_context.persist(persist_dir=tmp_path)
+        with self._lock:
+            if key in self:
+                shutil.rmtree(tmp_path) # Another session built the same index first
+            else:
+                os.replace(tmp_path, self._path(key))
+            self._touch(key)
+            self._evict(keep=key)
+
+    def _entry_size(self, key: str) -> int:
+        return sum(os.path.getsize(os.path.join(folder, name))
+                   for folder, _, names in os.walk(self._path(key)) for name in names)
+
+    def _last_used(self, key: str) -> float:
+        try:
+            return os.path.getmtime(os.path.join(self._path(key), LAST_USED_FILE))
+        except FileNotFoundError:
+            return 0.0
+
+    def _evict(self, keep: str) -> None:
+        entries = [(self._last_used(key), key, self._entry_size(key))
+                   for key in os.listdir(self.root) if not key.startswith(".") and key in self]
+        total = sum(size for _, _, size in entries)
+        for _, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue # Never evict the index that was just saved
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
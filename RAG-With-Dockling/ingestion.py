@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from llama_index.core import VectorStoreIndex
+
+from keyword_index import BM25Index, tokenize
+
+
+@dataclass
+class FileJob:
+    name: str
+    key: str
+    status: str = "queued"  # queued -> indexing | loading -> ready | failed
+    nodes: int = 0
+    tables: int = 0
+    table_names: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+    error: str = ""
+
+
+class IngestionManager:
+    """Indexes uploaded workbooks on background threads and merges them into one index.
+
+    Each file is loaded from `storage` when it was indexed before, or built with
+    `build_index(file_name, file_bytes)` and saved. As soon as a file is ready
+    its nodes, with their stored embeddings, join a merged index that replaces
+    the previous one in a single assignment, so a query running against the
+    old index is never disturbed. `version` changes with every merge, letting
+    the app rebuild its query engine only when new files became queryable.
+    A BM25 index over the same nodes is rebuilt alongside it, from token counts
+    computed once per file. With a `sheet_db`, plain sheets are also loaded as
+    SQL tables. A failed file can be submitted again, and `retain` drops files
+    that are no longer uploaded from the indexes, the tables and `progress`.
+    """
+
+    def __init__(self, storage, build_index, embed_model, workers: int = 2, sheet_db=None):
+        self.storage = storage
+        self.build_index = build_index
+        self.embed_model = embed_model
+        self.sheet_db = sheet_db
+        self.jobs: dict[str, FileJob] = {}
+        self.version = 0
+        self._index: VectorStoreIndex | None = None
+        self._files: dict[str, tuple[list, list[Counter]]] = {}  # key -> (nodes, token counts)
+        self._keyword_index: BM25Index | None = None
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+
+    def submit(self, file_name: str, file_bytes: bytes, key: str) -> bool:
+        """Queues a file for indexing; returns False if the same content was already submitted.
+
+        Content whose earlier job failed is queued again, so re-uploading a file retries it.
+        """
+        with self._lock:
+            previous = self.jobs.get(key)
+            if previous is not None and previous.status != "failed":
+                return False
+            job = self.jobs[key] = FileJob(file_name, key)
+        if previous is not None:
+            self._drop_tables(previous)
+        self._pool.submit(self._ingest, job, file_bytes)
+        return True
+
+    def retain(self, keys) -> None:
+        """Drops every file whose key is not in `keys`, e.g. after it was removed from the uploader."""
+        with self._lock:
+            removed = [job for key, job in self.jobs.items() if key not in keys]
+            for job in removed:
+                del self.jobs[job.key]
+            merged = [self._files.pop(job.key, None) is not None for job in removed]
+            if any(merged):
+                self._rebuild()
+        for job in removed:
+            self._drop_tables(job)
+
+    def _ingest(self, job: FileJob, file_bytes: bytes) -> None:
+        start = time.perf_counter()
+        try:
+            if self.sheet_db is not None:
+                table_names = self.sheet_db.add_workbook(job.name, file_bytes)
+                with self._lock:
+                    job.table_names = table_names
+                job.tables = len(table_names)
+            job.status = "loading"
+            index = self.storage.load(job.key, embed_model=self.embed_model)
+            if index is None:
+                job.status = "indexing"
+                index = self.build_index(job.name, file_bytes)
+                self.storage.save(job.key, index)
+            nodes = list(index.docstore.docs.values())
+            for node in nodes:
+                node.embedding = index.vector_store.get(node.node_id)
+            self._merge(job, nodes, [Counter(tokenize(node.get_content())) for node in nodes])
+            job.nodes = len(nodes)
+            job.status = "ready"
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+        job.seconds = time.perf_counter() - start
+        if self.jobs.get(job.key) is not job:
+            # Removed or resubmitted while it was running: its tables must not outlive it
+            self._drop_tables(job)
+
+    def _merge(self, job: FileJob, nodes, token_counts: list[Counter]) -> None:
+        with self._lock:
+            if self.jobs.get(job.key) is not job:
+                return
+            self._files[job.key] = (nodes, token_counts)
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        # Called with the lock held
+        nodes = [node for file_nodes, _ in self._files.values() for node in file_nodes]
+        token_counts = [counts for _, file_counts in self._files.values() for counts in file_counts]
+        if nodes:
+            # Every node already carries its embedding, so building the merged index embeds nothing
+            self._index = VectorStoreIndex(nodes=nodes, embed_model=self.embed_model)
+            self._keyword_index = BM25Index(nodes, token_counts)
+        else:
+            self._index, self._keyword_index = None, None
+        self.version += 1
+
+    def _drop_tables(self, job: FileJob) -> None:
+        # Swapped under the lock so a job's tables are dropped once, whichever thread gets here first
+        with self._lock:
+            table_names, job.table_names = job.table_names, []
+        if table_names and self.sheet_db is not None:
+            self.sheet_db.remove_tables(table_names)
+
+    def snapshot(self) -> tuple[int, VectorStoreIndex | None, BM25Index | None]:
+        """The merged vector and keyword indexes of every ready file, with their version."""
+        with self._lock:
+            return self.version, self._index, self._keyword_index
+
+    def pending(self) -> int:
+        return sum(job.status not in ("ready", "failed") for job in self.jobs.values())
+
+    def progress(self) -> list[dict]:
+        return [{"file": job.name, "status": job.status, "nodes": job.nodes, "tables": job.tables,
+                 "seconds": round(job.seconds, 1), "error": job.error}
+                for job in self.jobs.values()]
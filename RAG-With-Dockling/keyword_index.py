@@ -0,0 +1,117 @@
+import re
+import time
+from collections import Counter
+
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+# Codes such as ORD-0012345, INV/2024/07 or A1.B2 stay whole, and their parts are indexed too
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or the to was were what when where which who with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in re.split(r"[-_./]", token) if part)
+    return tokens
+
+
+class BM25Index:
+    """In-memory BM25 over node texts, with postings as numpy arrays.
+
+    A query only touches the postings of its own terms, so it costs about a
+    millisecond on 100k rows. Terms are scored rarest first and scoring stops
+    once `budget_ms` is spent, which can only drop the most common terms:
+    the ones that barely change the ranking. Terms found in more than
+    `max_df` of the nodes, such as column headers, are skipped outright. The
+    index is immutable; it is rebuilt from cached token counts whenever files
+    are added.
+    """
+
+    def __init__(self, nodes, token_counts: list[Counter] | None = None, k1: float = 1.2, b: float = 0.75,
+                 max_df: float = 0.5):
+        self.nodes = list(nodes)
+        self.max_df = max_df
+        if token_counts is None:
+            token_counts = [Counter(tokenize(node.get_content())) for node in self.nodes]
+        self.k1 = k1
+        self.b = b
+        lengths = np.array([sum(counts.values()) for counts in token_counts], dtype=np.float32)
+        self._norm = k1 * (1 - b + b * lengths / max(float(lengths.mean()) if len(lengths) else 1.0, 1.0))
+
+        postings: dict[str, tuple[list[int], list[int]]] = {}
+        for doc_id, counts in enumerate(token_counts):
+            for term, tf in counts.items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(doc_id)
+                tfs.append(tf)
+        self._postings = {term: (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32))
+                          for term, (ids, tfs) in postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def search(self, query: str, top_k: int = 10, budget_ms: float | None = None) -> list[tuple[int, float]]:
+        """Top `top_k` (node position, score) pairs for `query`."""
+        started = time.perf_counter()
+        terms = sorted((term for term in set(tokenize(query)) if term in self._postings),
+                       key=lambda term: len(self._postings[term][0]))
+        # Terms in most nodes (a header repeated on every row) add ~0 idf but cost a full pass
+        common = int(self.max_df * len(self.nodes))
+        terms = [term for term in terms if len(self._postings[term][0]) <= common] or terms[:1]
+
+        scores = np.zeros(len(self.nodes), dtype=np.float32)
+        for i, term in enumerate(terms):
+            if i and budget_ms is not None and (time.perf_counter() - started) * 1000 > budget_ms:
+                break
+            ids, tfs = self._postings[term]
+            idf = np.log(1 + (len(self.nodes) - len(ids) + 0.5) / (len(ids) + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[ids])
+        # Rank only the nodes that matched a term
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        top = candidates[np.argsort(-scores[candidates])]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+class HybridRetriever(BaseRetriever):
+    """Vector and BM25 results merged with reciprocal-rank fusion.
+
+    Dense embeddings are good at paraphrase but poor at exact codes such as
+    SKUs or invoice numbers, which BM25 matches directly. Each retriever
+    proposes `candidates` nodes; a node scores the sum of 1 / (rrf_k + rank)
+    over the lists it appears in, so no score scales need to be calibrated.
+    """
+
+    def __init__(self, vector_index, keyword_index: BM25Index, similarity_top_k: int = 3,
+                 candidates: int = 20, rrf_k: int = 60, budget_ms: float = 3.0):
+        super().__init__()
+        self._vector_retriever = vector_index.as_retriever(similarity_top_k=candidates)
+        self._keyword_index = keyword_index
+        self._similarity_top_k = similarity_top_k
+        self._candidates = candidates
+        self._rrf_k = rrf_k
+        self._budget_ms = budget_ms
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        fused: dict[str, float] = {}
+        nodes = {}
+        dense = [result.node for result in self._vector_retriever.retrieve(query_bundle)]
+        sparse = [self._keyword_index.nodes[i]
+                  for i, _ in self._keyword_index.search(query_bundle.query_str, self._candidates, self._budget_ms)]
+        for ranking in (dense, sparse):
+            for rank, node in enumerate(ranking):
+                nodes[node.node_id] = node
+                fused[node.node_id] = fused.get(node.node_id, 0.0) + 1 / (self._rrf_k + rank + 1)
+        best = sorted(fused, key=fused.get, reverse=True)[:self._similarity_top_k]
+        return [NodeWithScore(node=nodes[node_id], score=fused[node_id]) for node_id in best]
@@ -1,115 +1,266 @@
 import os
 
 import gc
-import tempfile
 import uuid
 import pandas as pd
 
 from llama_index.core import Settings
 from llama_index.llms.ollama import Ollama
 from llama_index.core import PromptTemplate
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
-from llama_index.readers.docling import DoclingReader
+from llama_index.core import VectorStoreIndex
+from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.core.node_parser import MarkdownNodeParser
+from index_store import IndexStorage, file_digest, index_key
+from conversion_cache import ConversionCache, converter_version
+from ingestion import IngestionManager
+from sheet_reader import workbook_nodes
+from sheet_cache import SheetCache
+from sql_store import SheetDatabase, SQLFallbackQueryEngine, is_aggregate_question
+from keyword_index import HybridRetriever
+from context_packing import PackedSynthesizer
+from embedding_models import get_embedding_model, preload_embedding_model, resolve_backend
 
 import streamlit as st
 
 if "id" not in st.session_state:
     st.session_state.id = uuid.uuid4()
-    st.session_state.file_cache = {}
 
 session_id = st.session_state.id
 client = None
 
+# Indexes persisted on disk and shared by every session, keyed by file content + this config
+index_storage_dir = "index_storage"
+index_storage_budget_mb = 2048  # Least recently used indexes are evicted beyond this
+# Docling output per file hash and converter version, reused when chunking or the embedding model changes
+conversion_cache_dir = "conversion_cache"
+conversion_workers = 4  # Processes converting workbooks in parallel
+ingestion_workers = 2  # Files converted, chunked and embedded concurrently per session
+# Parsed sheets stored as Parquet per file hash, for the paged sidebar preview
+sheet_cache_dir = "sheet_cache"
+preview_page_size = 50  # Rows per preview page
+# Hybrid retrieval: vector and BM25 candidates fused with reciprocal-rank fusion
+hybrid_candidates = 20  # Nodes proposed by each retriever before fusion
+keyword_budget_ms = 3.0  # BM25 stops scoring common query terms beyond this
+# Context packing counts tokens with the answering model's own tokenizer (the same across Qwen3 sizes)
+llm_tokenizer = "Qwen/Qwen3-8B"
+# Without it (e.g. offline), cl100k counts run low: Qwen splits numbers into single digits
+cl100k_safety_margin = 0.3
+# Embedding model loaded once per process, warmed up and shared by every session
+embedding_backend = resolve_backend("torch")  # Or "onnx" / "onnx-int8"; torch without onnxruntime
+embedding_options = {
+    "max_batch_tokens": 16384,  # Padded tokens per batch: short rows batch by hundreds, long chunks by dozens
+    "cache_dir": "embedding_models",  # int8 ONNX exports
+    "trust_remote_code": True,
+}
+index_config = {
+    "reader": "sheet_rows+docling",
+    "rows_per_node": 1,  # Rows per node for plain sheets
+    "converter": converter_version(),
+    "node_parser": "MarkdownNodeParser",
+    "embed_model": "BAAI/bge-large-en-v1.5",
+}
+if embedding_backend != "torch":
+    index_config["embed_backend"] = embedding_backend  # ONNX/int8 vectors differ slightly from torch ones
+# Start loading now, so the first upload does not wait for the model
+preload_embedding_model(index_config["embed_model"], embedding_backend, **embedding_options)
+
 @st.cache_resource
 def load_llm():
     llm = Ollama(model="qwen3", request_timeout=120.0)
     return llm
 
+@st.cache_resource
+def load_llm_tokenizer():
+    """Qwen3's tokenizer for context packing, or None when it cannot be loaded."""
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(llm_tokenizer)
+    except Exception:
+        return None
+
+def load_embedding_model():
+    return get_embedding_model(index_config["embed_model"], embedding_backend, **embedding_options)
+
+@st.cache_resource
+def get_index_storage():
+    return IndexStorage(index_storage_dir, max_bytes=index_storage_budget_mb * 1024 * 1024)
+
+@st.cache_resource
+def get_sheet_cache():
+    return SheetCache(sheet_cache_dir)
+
+@st.cache_resource
+def get_conversion_cache():
+    return ConversionCache(conversion_cache_dir, workers=conversion_workers)
+
+
+def build_index(file_name, file_bytes, conversion_cache):
+    """Indexes plain sheets one node per row group; other workbooks go through Docling."""
+    nodes = workbook_nodes(file_name, file_bytes, rows_per_node=index_config["rows_per_node"])
+    if nodes is not None:
+        # Rectangular sheets: whole rows with their headers, no conversion and no splitting
+        return VectorStoreIndex(nodes=nodes, show_progress=True)
+
+    # Complex layouts (merged cells, title rows, several tables per sheet) fall back to Docling
+    docs = conversion_cache.convert([(file_name, file_bytes)])[0]
+
+    node_parser = MarkdownNodeParser()
+    return VectorStoreIndex.from_documents(documents=docs, transformations=[node_parser], show_progress=True)
+
+
+def build_query_engine(index, keyword_index):
+    # Vector and BM25 retrieval fused, so exact codes and ids are found too
+    retriever = HybridRetriever(index, keyword_index, similarity_top_k=2,
+                                candidates=hybrid_candidates, budget_ms=keyword_budget_ms)
+    # One LLM call per question, packed under the context window in Qwen3 tokens
+    tokenizer = load_llm_tokenizer()
+    response_synthesizer = PackedSynthesizer(streaming=True, tokenizer=tokenizer,
+                                             safety_margin=0.0 if tokenizer is not None else cl100k_safety_margin)
+    query_engine = RetrieverQueryEngine(retriever=retriever, response_synthesizer=response_synthesizer)
+
+    # ====== Customise prompt template ======
+    qa_prompt_tmpl_str = (
+    "Context information is below.\n"
+    "---------------------\n"
+    "{context_str}\n"
+    "---------------------\n"
+    "Given the context information above I want you to think step by step to answer the query in a highly precise and crisp manner focused on the final answer, incase case you don't know the answer say 'I don't know!'.\n"
+    "Query: {query_str}\n"
+    "/no_think"
+    "Answer: "
+    )
+    qa_prompt_tmpl = PromptTemplate(qa_prompt_tmpl_str)
+
+    query_engine.update_prompts(
+        {"response_synthesizer:text_qa_template": qa_prompt_tmpl}
+    )
+    return query_engine
+
+
+def get_ingestion():
+    """This session's background ingestion; uploaded files keep indexing across reruns."""
+    if "ingestion" not in st.session_state:
+        # Resolve shared resources here: the worker threads run outside the Streamlit script
+        conversion_cache = get_conversion_cache()
+        st.session_state.ingestion = IngestionManager(
+            get_index_storage(),
+            lambda file_name, file_bytes: build_index(file_name, file_bytes, conversion_cache),
+            Settings.embed_model,
+            workers=ingestion_workers,
+            sheet_db=SheetDatabase(),
+        )
+    return st.session_state.ingestion
+
+
+def current_query_engine():
+    """Query engine over every file indexed so far, rebuilt whenever another file is merged in."""
+    if "ingestion" not in st.session_state:
+        return None
+    version, index, keyword_index = st.session_state.ingestion.snapshot()
+    if index is None:
+        return None
+    if st.session_state.get("engine_version") != version:
+        st.session_state.query_engine = build_query_engine(index, keyword_index)
+        st.session_state.engine_version = version
+    return st.session_state.query_engine
+
+
+def current_sql_engine():
+    """Text-to-SQL engine over every sheet loaded so far, rebuilt whenever new tables arrive."""
+    if "ingestion" not in st.session_state:
+        return None
+    sheet_db = st.session_state.ingestion.sheet_db
+    if st.session_state.get("sql_engine_version") != sheet_db.version:
+        st.session_state.sql_engine = sheet_db.query_engine(Settings.llm)
+        st.session_state.sql_engine_version = sheet_db.version
+    return st.session_state.sql_engine
+
+
+def route_query_engine(question):
+    """Aggregate and filter questions are answered with SQL over every row, the rest by retrieval.
+
+    SQL that fails or finds no rows falls back to retrieval, so a misrouted lookup still gets an answer.
+    """
+    if is_aggregate_question(question):
+        sql_engine = current_sql_engine()
+        if sql_engine is not None:
+            return SQLFallbackQueryEngine(sql_engine, current_query_engine())
+    return current_query_engine()
+
+
+@st.fragment(run_every=1.0)
+def show_ingestion_progress():
+    jobs = get_ingestion().progress()
+    done = sum(job["status"] in ("ready", "failed") for job in jobs)
+    st.progress(done / len(jobs), text=f"Indexed {done} of {len(jobs)} files")
+    st.dataframe(pd.DataFrame(jobs), hide_index=True)
+    if any(job["status"] == "ready" for job in jobs):
+        st.success("Ready to Chat!")
+
+
 def reset_chat():
     st.session_state.messages = []
     st.session_state.context = None
     gc.collect()
 
 
+def upload_digest(uploaded_file):
+    """Content hash of an upload, computed once per upload instead of on every rerun."""
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = file_digest(uploaded_file.getvalue())
+    return digests[uploaded_file.file_id]
+
+
 def display_excel(file):
     st.markdown("### Excel Preview")
-    # Read the Excel file
-    df = pd.read_excel(file)
-    # Display the dataframe
+    digest = upload_digest(file)
+    # Sheets are parsed once per workbook and kept as Parquet; a rerun only reads the visible page
+    sheet_cache = get_sheet_cache()
+    sheets = sheet_cache.sheets(digest, file.getvalue)
+    sheet = st.selectbox("Sheet", sheets, format_func=lambda s: s["name"], key=f"preview_sheet_{digest}")
+    num_pages = max(1, (sheet["rows"] + preview_page_size - 1) // preview_page_size)
+    page = 1
+    if num_pages > 1:
+        page = st.number_input("Page", min_value=1, max_value=num_pages, step=1,
+                               key=f"preview_page_{digest}_{sheet['file']}")
+    start = (page - 1) * preview_page_size
+    df = sheet_cache.page(digest, sheet, start, preview_page_size)
+    st.caption(f"Rows {start + 1}-{start + len(df)} of {sheet['rows']}" if len(df) else "Empty sheet")
     st.dataframe(df)
 
 
 with st.sidebar:
     st.header(f"Add your documents!")
     
-    uploaded_file = st.file_uploader("Choose your `.xlsx` file", type=["xlsx", "xls"])
+    uploaded_files = st.file_uploader("Choose your `.xlsx` files", type=["xlsx", "xls"], accept_multiple_files=True)
 
-    if uploaded_file:
+    if uploaded_files:
         try:
-            with tempfile.TemporaryDirectory() as temp_dir:
-                file_path = os.path.join(temp_dir, uploaded_file.name)
-                
-                with open(file_path, "wb") as f:
-                    f.write(uploaded_file.getvalue())
-                
-                file_key = f"{session_id}-{uploaded_file.name}"
-                st.write("Indexing your document...")
-
-                if file_key not in st.session_state.get('file_cache', {}):
-
-                    if os.path.exists(temp_dir):
-                            reader = DoclingReader()
-                            loader = SimpleDirectoryReader(
-                                input_dir=temp_dir,
-                                file_extractor={".xlsx": reader},
-                            )
-                    else:    
-                        st.error('Could not find the file you uploaded, please check again...')
-                        st.stop()
-                    
-                    docs = loader.load_data()
-
-                    # setup llm & embedding model
-                    llm=load_llm()
-                    embed_model = HuggingFaceEmbedding( model_name="BAAI/bge-large-en-v1.5", trust_remote_code=True)
-                    # Creating an index over loaded data
-                    Settings.embed_model = embed_model
-                    node_parser = MarkdownNodeParser()
-                    index = VectorStoreIndex.from_documents(documents=docs, transformations=[node_parser], show_progress=True)
-
-                    # Create the query engine, where we use a cohere reranker on the fetched nodes
-                    Settings.llm = llm
-                    query_engine = index.as_query_engine(streaming=True)
-
-                    # ====== Customise prompt template ======
-                    qa_prompt_tmpl_str = (
-                    "Context information is below.\n"
-                    "---------------------\n"
-                    "{context_str}\n"
-                    "---------------------\n"
-                    "Given the context information above I want you to think step by step to answer the query in a highly precise and crisp manner focused on the final answer, incase case you don't know the answer say 'I don't know!'.\n"
-                    "Query: {query_str}\n"
-                    "/no_think"
-                    "Answer: "
-                    )
-                    qa_prompt_tmpl = PromptTemplate(qa_prompt_tmpl_str)
-
-                    query_engine.update_prompts(
-                        {"response_synthesizer:text_qa_template": qa_prompt_tmpl}
-                    )
-                    
-                    st.session_state.file_cache[file_key] = query_engine
-                else:
-                    query_engine = st.session_state.file_cache[file_key]
-
-                # Inform the user that the file is processed and Display the PDF uploaded
-                st.success("Ready to Chat!")
-                display_excel(uploaded_file)
+            # setup llm & embedding model
+            Settings.llm = load_llm()
+            Settings.embed_model = load_embedding_model()
+
+            ingestion = get_ingestion()
+            file_keys = set()
+            for uploaded_file in uploaded_files:
+                # Keyed by content and config: renamed copies and new sessions reuse the stored index
+                file_key = index_key(upload_digest(uploaded_file), index_config)
+                ingestion.submit(uploaded_file.name, uploaded_file.getvalue(), file_key)
+                file_keys.add(file_key)
+            # Files removed from the uploader leave the index, the SQL tables and the progress table
+            ingestion.retain(file_keys)
+
+            # Files index on background threads; the chat below works with whichever are ready
+            show_ingestion_progress()
+
+            preview = st.selectbox("Preview", uploaded_files, format_func=lambda f: f.name)
+            display_excel(preview)
         except Exception as e:
             st.error(f"An error occurred: {e}")
             st.stop()     
+    elif "ingestion" in st.session_state:
+        st.session_state.ingestion.retain(set())
 
 col1, col2 = st.columns([6, 1])
 
@@ -143,18 +294,33 @@ if prompt := st.chat_input("What's up?"):
         message_placeholder = st.empty()
         full_response = ""
         
-        # Simulate stream of response with milliseconds delay
-        streaming_response = query_engine.query(prompt)
-        
-        for chunk in streaming_response.response_gen:
-            if "<think>" in chunk or "</think>" in chunk:
-                continue
-            full_response += chunk
-            message_placeholder.markdown(full_response + "▌")
+        query_engine = route_query_engine(prompt)
+        if query_engine is None:
+            full_response = "No file has finished indexing yet. Please ask again in a moment."
+        else:
+            # Simulate stream of response with milliseconds delay
+            streaming_response = query_engine.query(prompt)
+
+            for chunk in streaming_response.response_gen:
+                if "<think>" in chunk or "</think>" in chunk:
+                    continue
+                full_response += chunk
+                message_placeholder.markdown(full_response + "▌")
 
         # full_response = query_engine.query(prompt)
 
         message_placeholder.markdown(full_response)
+
+        # How much retrieved context fit in the prompt
+        if query_engine is not None and streaming_response.metadata and "context_packing" in streaming_response.metadata:
+            packing = streaming_response.metadata["context_packing"]
+            st.caption(f"Context: {packing['packed_chunks']} chunks / {packing['packed_tokens']} tokens packed, "
+                       f"{packing['dropped_chunks']} dropped ({packing['dropped_tokens']} tokens)")
+
+        # Show the generated SQL behind answers computed over the whole sheet
+        if query_engine is not None and streaming_response.metadata and "sql_query" in streaming_response.metadata:
+            with st.expander("SQL"):
+                st.code(streaming_response.metadata["sql_query"], language="sql")
         # st.session_state.context = ctx
 
     # Add assistant response to chat history
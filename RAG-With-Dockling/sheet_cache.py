@@ -0,0 +1,79 @@
+import io
+import json
+import os
+import threading
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from sheet_reader import EXCEL_ENGINE
+
+MANIFEST_FILE = "sheets.json"
+
+
+class SheetCache:
+    """Parsed workbook sheets stored as Parquet under `root/<file digest>/`.
+
+    A workbook is parsed once, whichever session uploads it first. After that,
+    a preview page opens the sheet's Parquet file and reads only the row groups
+    covering the requested rows. Reruns therefore cost the same for a 100-row
+    sheet and a 1M-row one. Each sheet is written in groups of
+    `row_group_size` rows, which should be a multiple of the preview page size.
+    """
+
+    def __init__(self, root: str = "sheet_cache", row_group_size: int = 1000):
+        self.root = root
+        self.row_group_size = row_group_size
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str, name: str = "") -> str:
+        return os.path.join(self.root, digest, name)
+
+    def sheets(self, digest: str, read_bytes) -> list[dict]:
+        """`{"name", "rows", "file"}` per sheet; `read_bytes()` is only called to parse a new workbook."""
+        try:
+            with open(self._path(digest, MANIFEST_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            if os.path.exists(self._path(digest, MANIFEST_FILE)):
+                return self.sheets(digest, read_bytes) # Parsed by another session meanwhile
+            return self._store(digest, read_bytes())
+
+    def _store(self, digest: str, file_bytes: bytes) -> list[dict]:
+        # Write into a private folder and rename it into place, so readers never see half a workbook
+        tmp_path = os.path.join(self.root, f".tmp-{uuid.uuid4().hex}")
+        os.makedirs(tmp_path)
+        manifest = []
+        frames = pd.read_excel(io.BytesIO(file_bytes), sheet_name=None, engine=EXCEL_ENGINE)
+        for i, (name, df) in enumerate(frames.items()):
+            df.columns = [str(column) for column in df.columns]
+            for column in df.columns[df.dtypes == object]:
+                df[column] = df[column].astype("string") # Mixed-type cells: Parquet needs one type
+            file_name = f"{i}.parquet"
+            pq.write_table(pa.Table.from_pandas(df, preserve_index=False), os.path.join(tmp_path, file_name),
+                           row_group_size=self.row_group_size)
+            manifest.append({"name": str(name), "rows": len(df), "file": file_name})
+        with open(os.path.join(tmp_path, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(self.root, digest))
+        return manifest
+
+    def page(self, digest: str, sheet: dict, start: int, num_rows: int) -> pd.DataFrame:
+        """Rows `start` to `start + num_rows` of one sheet, read from the row groups that hold them."""
+        parquet_file = pq.ParquetFile(self._path(digest, sheet["file"]))
+        empty = parquet_file.schema_arrow.empty_table().to_pandas()
+        if sheet["rows"] == 0 or not parquet_file.schema_arrow.names:
+            return empty # An empty sheet still gets row groups of column-less rows
+        first = start // self.row_group_size
+        last = min((start + num_rows - 1) // self.row_group_size, parquet_file.num_row_groups - 1)
+        if parquet_file.num_row_groups == 0 or first > last:
+            return empty
+        table = parquet_file.read_row_groups(list(range(first, last + 1)))
+        df = table.slice(start - first * self.row_group_size, num_rows).to_pandas()
+        df.index = range(start + 2, start + 2 + len(df)) # Excel row numbers: the header is row 1
+        return df
@@ -0,0 +1,158 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+from llama_index.core import SQLDatabase
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.query_engine import NLSQLTableQueryEngine
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import StaticPool
+
+from sheet_reader import read_tables
+
+logger = logging.getLogger(__name__)
+
+# Wording that asks for a computation over many rows rather than for a passage of text. Words just as
+# common in lookups ("per", "most", "above", "number of") are left out or only count next to a figure
+AGGREGATE_PATTERN = re.compile(
+    r"\b(how many|count of|(the|total) number of|total(?! row)|sum of|summed|average|avg|mean of|median"
+    r"|group(ed)? by|broken down by|for each|for every|by each"
+    r"|highest|lowest|largest|smallest|maximum|minimum|(top|bottom) \d+"
+    r"|(more|less|greater|fewer|higher|lower) than \$?\d+|(above|below|over|under|exceeding) \$?\d+"
+    r"|between \$?[\d,.]+ and \$?\d+|at (least|most) \$?\d+"
+    r"|percentage of|share of|proportion of)\b",
+    re.IGNORECASE,
+)
+
+
+# Statements generated SQL may run: reads, plus the PRAGMAs SQLAlchemy uses to inspect tables
+READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+INTROSPECTION_PRAGMAS = {"table_info", "table_xinfo", "index_list", "index_info", "index_xinfo", "foreign_key_list"}
+
+
+def _read_only(action, arg1, arg2, db_name, trigger) -> int:
+    """sqlite3 authorizer that denies everything but reading and table introspection."""
+    if action in READ_ACTIONS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg1.lower() in INTROSPECTION_PRAGMAS and arg2 is not None:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def is_aggregate_question(question: str) -> bool:
+    """Routes aggregate and filter questions to SQL; narrative and lookup ones stay on retrieval."""
+    return AGGREGATE_PATTERN.search(question) is not None
+
+
+def table_name(file_name: str, sheet: str) -> str:
+    name = re.sub(r"\W+", "_", f"{os.path.splitext(file_name)[0]}_{sheet}").strip("_").lower()
+    return name if name[:1].isalpha() else f"t_{name}"
+
+
+class SheetDatabase:
+    """Uploaded sheets as tables of an in-memory SQLite database.
+
+    Questions like "total sales per region" need every row, which top-k
+    retrieval never shows the LLM. Each plain sheet (see `sheet_reader`) is
+    loaded once as a table; `query_engine` turns a question into SQL over
+    those tables and streams an answer from the exact result. Workbooks are
+    loaded through a writer connection; generated SQL runs on `engine`, a
+    second connection to the same in-memory database whose authorizer
+    rejects writes, ATTACH and setting PRAGMAs, so a prompt-injected cell or
+    question cannot change the tables, even in the middle of a load.
+    """
+
+    def __init__(self):
+        # Shared-cache in-memory database: lives as long as the writer connection stays open
+        url = f"sqlite:///file:sheets-{uuid.uuid4().hex}?mode=memory&cache=shared&uri=true"
+        connect_args = {"check_same_thread": False}
+        self._writer = create_engine(url, poolclass=StaticPool, connect_args=connect_args)
+        self._writer.connect().close() # Creates the database before any reader attaches to it
+        self.engine = create_engine(url, poolclass=StaticPool, connect_args=connect_args)
+        event.listen(self.engine, "connect", self._connect_reader)
+        self.tables: dict[str, str] = {}  # table name -> "file / sheet"
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _connect_reader(dbapi_connection, connection_record) -> None:
+        # Read the committed tables without waiting on table locks held by a load in progress
+        dbapi_connection.execute("PRAGMA read_uncommitted = ON")
+        dbapi_connection.set_authorizer(_read_only)
+
+    def add_workbook(self, file_name: str, file_bytes: bytes) -> list[str]:
+        """Loads every sheet of a plain workbook; complex layouts are left to vector retrieval."""
+        sheets = read_tables(file_bytes)
+        if sheets is None:
+            return []
+        added = []
+        with self._lock:
+            with self._writer.begin() as conn:
+                for sheet, df in sheets.items():
+                    name = base = table_name(file_name, sheet)
+                    suffix = 2
+                    while name in self.tables or name in added:
+                        name, suffix = f"{base}_{suffix}", suffix + 1
+                    df.to_sql(name, conn, index=False)
+                    added.append(name)
+            self.tables.update({name: f"{file_name} / {sheet}" for name, sheet in zip(added, sheets)})
+            self.version += 1
+        return added
+
+    def remove_tables(self, names: list[str]) -> None:
+        """Drops tables loaded by `add_workbook`, e.g. once their workbook is removed."""
+        with self._lock:
+            with self._writer.begin() as conn:
+                for name in names:
+                    conn.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            for name in names:
+                self.tables.pop(name, None)
+            self.version += 1
+
+    def query_engine(self, llm, **kwargs) -> NLSQLTableQueryEngine | None:
+        """Text-to-SQL engine over every table loaded so far, or None if there are none."""
+        with self._lock:
+            tables = list(self.tables)
+        if not tables:
+            return None
+        sql_database = SQLDatabase(self.engine, include_tables=tables, sample_rows_in_table_info=3)
+        # SQL errors are raised rather than answered from, so `SQLFallbackQueryEngine` can fall back
+        return NLSQLTableQueryEngine(sql_database, tables=tables, llm=llm, streaming=True,
+                                     handle_sql_errors=False, **kwargs)
+
+
+class SQLFallbackQueryEngine(BaseQueryEngine):
+    """Answers with text-to-SQL, or with `fallback` when the SQL fails or returns no rows.
+
+    The keyword router only guesses that a question needs every row; a lookup
+    it misroutes usually produces invalid SQL or an empty result, and is then
+    answered by retrieval as if it had never been routed. Without a `fallback`
+    (no file indexed yet) the SQL answer is returned as is.
+    """
+
+    def __init__(self, sql_engine: BaseQueryEngine, fallback: BaseQueryEngine | None):
+        self.sql_engine = sql_engine
+        self.fallback = fallback
+        super().__init__(callback_manager=sql_engine.callback_manager)
+
+    def _get_prompt_modules(self) -> dict:
+        return {"sql_engine": self.sql_engine}
+
+    def _query(self, query_bundle):
+        try:
+            response = self.sql_engine.query(query_bundle)
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            logger.info("SQL answer failed, falling back to retrieval: %s", e)
+            return self.fallback.query(query_bundle)
+        if self.fallback is not None and not (response.metadata or {}).get("result"):
+            logger.info("SQL returned no rows, falling back to retrieval: %s", response.metadata.get("sql_query"))
+            return self.fallback.query(query_bundle)
+        return response
+
+    async def _aquery(self, query_bundle):
+        return self._query(query_bundle)
@@ -0,0 +1,65 @@
+import pytest
+from llama_index.core.llms import MockLLM
+from llama_index.core.schema import MetadataMode, NodeWithScore, TextNode
+
+from context_packing import PackedSynthesizer
+
+
+class DigitTokenizer:
+    """Stand-in for a Hugging Face tokenizer that splits numbers into single digits, like Qwen's."""
+
+    def encode(self, text, add_special_tokens=True):
+        return [ord(c) for c in text if not c.isspace()]
+
+    def decode(self, tokens):
+        return "".join(map(chr, tokens))
+
+
+def nodes(count: int) -> list[NodeWithScore]:
+    return [NodeWithScore(node=TextNode(text="1234567890 " * 10), score=1.0 - i / 100) for i in range(count)]
+
+
+def test_packs_by_the_given_tokenizer():
+    tokenizer = DigitTokenizer()
+    synthesizer = PackedSynthesizer(llm=MockLLM(), context_window=1000, num_output=0, tokenizer=tokenizer)
+    packed, stats = synthesizer.pack("total?", nodes(20))
+    # 100 digit tokens per chunk: cl100k's three-digit groups would have let far more through
+    assert stats["packed_tokens"] <= stats["budget_tokens"]
+    assert len(packed) == stats["budget_tokens"] // 101
+
+
+def test_safety_margin_shrinks_the_budget():
+    full = PackedSynthesizer(llm=MockLLM(), context_window=1000, num_output=0)
+    reserved = PackedSynthesizer(llm=MockLLM(), context_window=1000, num_output=0, safety_margin=0.3)
+    assert full.pack("total?", nodes(1))[1]["budget_tokens"] - reserved.pack("total?", nodes(1))[1]["budget_tokens"] \
+        == 300
+
+
+class ChatTokenizer(DigitTokenizer):
+    """Adds a chat template, so the packer can measure what the template wraps around the prompt."""
+
+    chat_template = "<|user|>{content}<|end|><|assistant|>"
+
+    def render(self, messages):
+        return "".join(f"<|{m['role']}|>{m['content']}<|end|>" for m in messages) + "<|assistant|>"
+
+    def apply_chat_template(self, messages, tokenize=True, add_generation_prompt=True, return_dict=False):
+        return self.encode(self.render(messages))
+
+
+@pytest.mark.parametrize("chunk_text", ["1234567890 " * 10, "9" * 5000])
+def test_packed_prompt_at_the_limit_fits_the_window(chunk_text):
+    tokenizer = ChatTokenizer()
+    llm = MockLLM(system_prompt="You answer questions about spreadsheets.")
+    synthesizer = PackedSynthesizer(llm=llm, context_window=1000, num_output=200, tokenizer=tokenizer)
+    chunks = [NodeWithScore(node=TextNode(text=chunk_text), score=1.0 - i / 100) for i in range(20)]
+    packed, stats = synthesizer.pack("total?", chunks)
+    assert stats["dropped_chunks"] > 0  # Packing stopped at the limit
+
+    # The request the LLM actually receives: the filled template inside the chat template
+    context_str = synthesizer.separator.join(n.node.get_content(metadata_mode=MetadataMode.LLM) for n in packed)
+    prompt = synthesizer._text_qa_template.format(context_str=context_str, query_str="total?")
+    messages = [{"role": "system", "content": llm.system_prompt}, {"role": "user", "content": prompt}]
+    prompt_tokens = len(tokenizer.apply_chat_template(messages))
+    assert prompt_tokens <= synthesizer.context_window - synthesizer.num_output
+    assert prompt_tokens + 100 > synthesizer.context_window - synthesizer.num_output  # Nothing more would fit
@@ -0,0 +1,70 @@
+import io
+
+import pandas as pd
+from llama_index.core import Document, MockEmbedding, VectorStoreIndex
+
+from ingestion import IngestionManager
+from sql_store import SheetDatabase
+
+embed_model = MockEmbedding(embed_dim=8)
+
+
+class NoStorage:
+    def load(self, key, embed_model=None):
+        return None
+
+    def save(self, key, index):
+        pass
+
+
+def workbook() -> bytes:
+    buffer = io.BytesIO()
+    pd.DataFrame({"qty": [1, 2], "region": ["N", "S"]}).to_excel(buffer, index=False, sheet_name="Sheet1")
+    return buffer.getvalue()
+
+
+def finish(ingestion: IngestionManager) -> None:
+    ingestion._pool.submit(lambda: None).result()
+
+
+def test_failed_file_can_be_resubmitted():
+    attempts = []
+
+    def build_index(file_name, file_bytes):
+        attempts.append(file_name)
+        if len(attempts) == 1:
+            raise RuntimeError("conversion failed")
+        return VectorStoreIndex.from_documents([Document(text="north sold 1")], embed_model=embed_model)
+
+    ingestion = IngestionManager(NoStorage(), build_index, embed_model, workers=1, sheet_db=SheetDatabase())
+    assert ingestion.submit("orders.xlsx", workbook(), "k1")
+    finish(ingestion)
+    assert ingestion.jobs["k1"].status == "failed"
+
+    assert ingestion.submit("orders.xlsx", workbook(), "k1")
+    finish(ingestion)
+    assert ingestion.jobs["k1"].status == "ready"
+    assert not ingestion.submit("orders.xlsx", workbook(), "k1")
+    # The failed attempt's tables were dropped, not kept next to the retry's
+    assert list(ingestion.sheet_db.tables) == ["orders_sheet1"]
+
+
+def test_retain_drops_removed_files():
+    def build_index(file_name, file_bytes):
+        return VectorStoreIndex.from_documents([Document(text=file_name)], embed_model=embed_model)
+
+    ingestion = IngestionManager(NoStorage(), build_index, embed_model, workers=1, sheet_db=SheetDatabase())
+    ingestion.submit("north.xlsx", workbook(), "k1")
+    ingestion.submit("south.xlsx", workbook(), "k2")
+    finish(ingestion)
+
+    ingestion.retain({"k2"})
+    _, index, keyword_index = ingestion.snapshot()
+    assert [job["file"] for job in ingestion.progress()] == ["south.xlsx"]
+    assert [node.get_content() for node in index.docstore.docs.values()] == ["south.xlsx"]
+    assert len(keyword_index.nodes) == 1
+    assert list(ingestion.sheet_db.tables) == ["south_sheet1"]
+
+    ingestion.retain(set())
+    assert ingestion.snapshot()[1:] == (None, None)
+    assert ingestion.progress() == [] and ingestion.sheet_db.tables == {}
@@ -0,0 +1,30 @@
+import io
+
+import pandas as pd
+import pytest
+
+from sheet_cache import SheetCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer) as writer:
+        pd.DataFrame({"row": range(10)}).to_excel(writer, sheet_name="data", index=False)
+        pd.DataFrame().to_excel(writer, sheet_name="empty", index=False)
+    cache = SheetCache(str(tmp_path), row_group_size=4)
+    return cache, cache.sheets("digest", buffer.getvalue)
+
+
+def test_empty_sheet_has_no_rows(cache):
+    cache, sheets = cache
+    assert sheets[1] == {"name": "empty", "rows": 0, "file": "1.parquet"}
+    assert cache.page("digest", sheets[1], 0, 50).empty
+
+
+def test_page_across_row_groups(cache):
+    cache, sheets = cache
+    df = cache.page("digest", sheets[0], 3, 4)
+    assert df["row"].tolist() == [3, 4, 5, 6]
+    assert df.index.tolist() == [5, 6, 7, 8]  # Excel row numbers
+    assert cache.page("digest", sheets[0], 8, 4)["row"].tolist() == [8, 9]
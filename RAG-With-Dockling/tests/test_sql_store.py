@@ -0,0 +1,117 @@
+import io
+
+import pandas as pd
+import pytest
+from llama_index.core import SQLDatabase
+from llama_index.core.base.response.schema import Response
+from sqlalchemy.exc import DatabaseError
+
+from sql_store import SheetDatabase, SQLFallbackQueryEngine, is_aggregate_question
+
+
+def workbook(df: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False, sheet_name="Sheet1")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def sql_database():
+    db = SheetDatabase()
+    assert db.add_workbook("orders.xlsx", workbook(pd.DataFrame({"qty": [1, 2, 3], "region": ["N", "S", "N"]}))) \
+        == ["orders_sheet1"]
+    # What NLSQLTableQueryEngine runs generated SQL through
+    return SQLDatabase(db.engine, include_tables=list(db.tables))
+
+
+def test_generated_sql_can_read(sql_database):
+    assert "qty" in sql_database.get_single_table_info("orders_sheet1")
+    _, result = sql_database.run_sql("SELECT region, SUM(qty) FROM orders_sheet1 GROUP BY region ORDER BY region")
+    assert result["result"] == [("N", 4), ("S", 2)]
+
+
+@pytest.mark.parametrize("statement", [
+    "PRAGMA query_only = OFF",
+    "DELETE FROM orders_sheet1",
+    "DROP TABLE orders_sheet1",
+    "INSERT INTO orders_sheet1 VALUES (4, 'W')",
+    "CREATE TABLE notes (text TEXT)",
+    "ATTACH DATABASE ':memory:' AS other",
+])
+def test_generated_sql_cannot_modify(sql_database, statement):
+    with pytest.raises(DatabaseError, match="not authorized"):
+        sql_database.run_sql(statement)
+    _, result = sql_database.run_sql("SELECT COUNT(*) FROM orders_sheet1")
+    assert result["result"] == [(3,)]
+
+
+def test_pragma_then_delete_is_rejected(sql_database):
+    for statement in ("PRAGMA query_only = OFF", "DELETE FROM orders_sheet1"):
+        with pytest.raises(DatabaseError):
+            sql_database.run_sql(statement)
+    _, result = sql_database.run_sql("SELECT COUNT(*) FROM orders_sheet1")
+    assert result["result"] == [(3,)]
+
+
+@pytest.mark.parametrize("question", [
+    "What is the total revenue per region?",
+    "How many orders were shipped in March?",
+    "Average order value by customer",
+    "Top 5 products by sales",
+    "List the orders with a quantity greater than 100",
+    "Which orders cost between 1,000 and 2,000?",
+    "Orders above $500 in the North",
+    "What share of orders came from the South?",
+    "Count of records for each category",
+    "Which customer has the highest balance?",
+])
+def test_aggregate_questions_go_to_sql(question):
+    assert is_aggregate_question(question)
+
+
+@pytest.mark.parametrize("question", [
+    "What is the phone number of Customer 0042?",
+    "Explain the note above the totals",
+    "What is the most recent order of customer 7?",
+    "Which products are listed below the header?",
+    "What is the unique id of order 12?",
+    "Summarize the comments between the two tables",
+    "What does the sheet say per the return policy?",
+    "What is in the total row?",
+    "List all contacts at Acme",
+])
+def test_lookup_questions_stay_on_retrieval(question):
+    assert not is_aggregate_question(question)
+
+
+class FakeEngine:
+    callback_manager = None
+
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+        self.questions = []
+
+    def query(self, query_bundle):
+        self.questions.append(query_bundle.query_str)
+        if self.error is not None:
+            raise self.error
+        return self.response
+
+
+@pytest.mark.parametrize("sql_engine", [
+    FakeEngine(error=DatabaseError("SELECT phone", None, Exception("no such column: phone"))),
+    FakeEngine(Response("none", metadata={"sql_query": "SELECT 1 WHERE 0", "result": []})),
+])
+def test_failed_or_empty_sql_falls_back_to_retrieval(sql_engine):
+    retrieval = FakeEngine(Response("from the sheet"))
+    response = SQLFallbackQueryEngine(sql_engine, retrieval).query("Orders above 100 for Customer 0042")
+    assert response.response == "from the sheet"
+    assert sql_engine.questions == retrieval.questions == ["Orders above 100 for Customer 0042"]
+
+
+def test_sql_rows_are_answered_from_sql():
+    sql_engine = FakeEngine(Response("4", metadata={"sql_query": "SELECT SUM(qty)", "result": [(4,)]}))
+    retrieval = FakeEngine(Response("from the sheet"))
+    assert SQLFallbackQueryEngine(sql_engine, retrieval).query("total qty").response == "4"
+    assert retrieval.questions == []
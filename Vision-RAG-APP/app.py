@@ -1,16 +1,27 @@
-import requests
 import os
 import io
-import base64
-import PIL
-from PIL import Image
+import logging
+import time
 import tqdm
 import numpy as np
 import streamlit as st
 import cohere
+from PIL import Image
 # use chatgroq from langchain_groq
 from langchain_groq import ChatGroq
-import fitz # PyMuPDF
+from corpus_index import CorpusIndex, UploadIndex, select_new_paths
+from dedup import DuplicateDetector, page_fingerprint
+from downloader import Downloader
+from embedding_engine import BatchEmbedder
+from embedding_store import EmbeddingStore, content_key
+from image_utils import base64_from_bytes
+from render_pipeline import PdfIngestPipeline
+from telemetry import LatencyRecorder
+from query_cache import EmbeddingCache, QueryEmbeddingCache
+from thumbnails import ThumbnailCache
+from vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
 
 # --- Streamlit App Configuration ---
 st.set_page_config(layout="wide", page_title="Vision RAG with Cohere Embed-4")
@@ -35,11 +46,19 @@ with st.sidebar:
 # --- Initialize API Clients ---
 co = None
 groq_client = None
-# Initialize Session State for embeddings and paths
+# Initialize Session State for paths (embeddings live in the session's search index, see get_search_index)
 if 'image_paths' not in st.session_state:
     st.session_state.image_paths = []
-if 'doc_embeddings' not in st.session_state:
-    st.session_state.doc_embeddings = None
+if 'removed_paths' not in st.session_state:
+    st.session_state.removed_paths = set() # Removed by the user: not re-added until they add the file again
+if 'upload_file_ids' not in st.session_state:
+    st.session_state.upload_file_ids = set() # Uploader entries already seen, to tell re-uploads from reruns
+if 'image_keys' not in st.session_state:
+    st.session_state.image_keys = {} # Image path -> embedding store key, to rescore binary search hits
+if 'thumbnail_paths' not in st.session_state:
+    st.session_state.thumbnail_paths = {} # Image path -> gallery thumbnail path
+if 'embed_calls_saved' not in st.session_state:
+    st.session_state.embed_calls_saved = 0 # Embedding calls skipped thanks to duplicate detection
 
 if cohere_api_key and groq_api_key:
     try:
@@ -80,65 +99,103 @@ with st.expander("ℹ️ About the models used"):
     """)
 
 # --- Helper functions ---
-# Some helper functions to resize images and to convert them to base64 format
-max_pixels = 1568*1568  #Max resolution for images
-
-# Resize too large images
-def resize_image(pil_image: PIL.Image.Image) -> None:
-    """Resizes the image in-place if it exceeds max_pixels."""
-    org_width, org_height = pil_image.size
-
-    # Resize image if too large
-    if org_width * org_height > max_pixels:
-        scale_factor = (max_pixels / (org_width * org_height)) ** 0.5
-        new_width = int(org_width * scale_factor)
-        new_height = int(org_height * scale_factor)
-        pil_image.thumbnail((new_width, new_height))
-
-# Convert images to a base64 string before sending it to the API
-def base64_from_image(img_path: str) -> str:
-    """Converts an image file to a base64 encoded string."""
-    pil_image = PIL.Image.open(img_path)
-    img_format = pil_image.format if pil_image.format else "PNG"
-
-    resize_image(pil_image)
-
-    with io.BytesIO() as img_buffer:
-        pil_image.save(img_buffer, format=img_format)
-        img_buffer.seek(0)
-        img_data = f"data:image/{img_format.lower()};base64,"+base64.b64encode(img_buffer.read()).decode("utf-8")
-
-    return img_data
-
-# Convert PIL image to base64 string
-def pil_to_base64(pil_image: PIL.Image.Image) -> str:
-    """Converts a PIL image to a base64 encoded string."""
-    if pil_image.format is None:
-        img_format = "PNG"
-    else:
-        img_format = pil_image.format
-    
-    resize_image(pil_image)
-
-    with io.BytesIO() as img_buffer:
-        pil_image.save(img_buffer, format=img_format)
-        img_buffer.seek(0)
-        img_data = f"data:image/{img_format.lower()};base64,"+base64.b64encode(img_buffer.read()).decode("utf-8")
-
-    return img_data
+# Image resizing / base64 helpers live in image_utils.py so ingestion workers can import them
+embed_batch_size = 8  # Images per Cohere embed request during PDF ingestion
+embed_max_in_flight = 4  # Concurrent embed requests during PDF ingestion
+render_workers = max(1, (os.cpu_count() or 2) - 1)  # Processes rasterizing PDF pages
+render_memory_budget_mb = 512  # Cap on rendered-but-not-yet-embedded pages held in memory
+page_image_format = "PNG"  # Page payload/on-disk format: "PNG", or "JPEG"/"WEBP" for smaller uploads
+search_top_k = 3  # Ranked hits returned by search
+# Search index storage: "binary" keeps 1 bit per dimension in memory and rescores its Hamming
+# shortlist from the embedding store's memmap; "float16" or "int8" keep full vectors in memory
+index_dtype = "binary"
+index_ivf_threshold = 50_000  # Corpus size at which the index switches from exhaustive scan to IVF
+query_cache_size = 1024  # Query embeddings kept in the shared LRU cache
+query_cache_ttl = 3600  # Seconds before a cached query embedding expires
+image_cache_size = 4096  # Image embeddings kept in memory (LRU), keyed by content digest
+image_cache_ttl = 3600  # Seconds before a cached image embedding expires
+download_workers = 8  # Concurrent sample image downloads
+download_per_host_limit = 4  # Concurrent downloads against any single host
+answer_streaming = True  # Stream answer tokens into the page (falls back to a blocking call on failure)
+answer_render_interval = 0.1  # Minimum seconds between re-renders while streaming
+corpus_index_path = "corpus_index.json"  # Corpus built offline by indexer.py, loaded into each new session
+thumbnail_dir = "thumbnails"  # Gallery thumbnails (WebP, content-addressed), written at ingest time
+gallery_page_size = 20  # Thumbnails shown per gallery page
+gallery_columns = 5  # Thumbnails per gallery row
+telemetry_max_events = 10_000  # Latency samples kept per session for the sidebar panel and export
+
+# Embeddings persisted on disk, keyed by image content and shared by every session
+@st.cache_resource
+def get_embedding_store() -> EmbeddingStore:
+    """Opens the on-disk embedding store once per process."""
+    return EmbeddingStore("embedding_store")
+
+# Query embeddings shared by every session, so repeated questions skip the network
+@st.cache_resource
+def get_query_cache() -> QueryEmbeddingCache:
+    """Creates the process-wide query embedding cache once."""
+    return QueryEmbeddingCache(max_entries=query_cache_size, ttl_seconds=query_cache_ttl)
+
+# Image embeddings shared by every session, keyed by the content digest computed at upload/render time
+@st.cache_resource
+def get_image_embedding_cache() -> EmbeddingCache:
+    """Creates the process-wide, bounded image embedding cache once."""
+    return EmbeddingCache(max_entries=image_cache_size, ttl_seconds=image_cache_ttl)
+
+# Fingerprints of embedded images, used to skip exact and near-duplicate pages
+@st.cache_resource
+def get_duplicate_detector() -> DuplicateDetector:
+    """Creates the process-wide duplicate detector once; it pairs with the embedding store."""
+    return DuplicateDetector()
+
+# Per-session latency samples for each stage of the request path (see the sidebar panel)
+def get_telemetry() -> LatencyRecorder:
+    """Returns the session's latency recorder, creating it on first use."""
+    if 'telemetry' not in st.session_state:
+        st.session_state.telemetry = LatencyRecorder(max_events=telemetry_max_events)
+    return st.session_state.telemetry
+
+# Uploads by content digest, so re-uploading identical bytes (under any name) costs nothing
+@st.cache_resource
+def get_upload_index() -> UploadIndex:
+    """Opens the on-disk upload index once per process."""
+    return UploadIndex("upload_index.json")
+
+# Gallery thumbnails shared by every session
+@st.cache_resource
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Opens the on-disk thumbnail cache once per process."""
+    return ThumbnailCache(thumbnail_dir)
+
+def thumbnail_for(image_path: str) -> str:
+    """Thumbnail for a loaded image; images not thumbnailed at ingest are done once, on first view."""
+    if image_path not in st.session_state.thumbnail_paths:
+        st.session_state.thumbnail_paths[image_path] = get_thumbnail_cache().for_file(image_path)
+    return st.session_state.thumbnail_paths[image_path]
+
+# One pooled HTTP downloader for the whole process
+@st.cache_resource
+def get_downloader() -> Downloader:
+    """Creates the shared downloader (pooled connections, per-host limits, timeouts)."""
+    return Downloader(max_workers=download_workers, per_host_limit=download_per_host_limit)
 
 # Compute embedding for an image
-@st.cache_data(ttl=3600, show_spinner=False)
-def compute_image_embedding(base64_img: str, _cohere_client) -> np.ndarray | None:
+# Cached under its content digest (computed once from the image bytes), so the multi-megabyte
+# base64 payload is only built on a miss and never hashed or copied into a cache
+def compute_image_embedding(img_bytes: bytes, cohere_client) -> np.ndarray | None:
     """Computes an embedding for an image using Cohere's Embed-4 model."""
+    telemetry = get_telemetry()
     try:
-        api_response = _cohere_client.embed(
-            model="embed-v4.0",
-            input_type="search_document",
-            embedding_types=["float"],
-            images=[base64_img],
-        )
-        
+        with telemetry.time("encode"):
+            base64_img = base64_from_bytes(img_bytes)
+        with telemetry.time("embed_image"):
+            api_response = cohere_client.embed(
+                model="embed-v4.0",
+                input_type="search_document",
+                embedding_types=["float"],
+                images=[base64_img],
+            )
+
         if api_response.embeddings and api_response.embeddings.float:
             return np.asarray(api_response.embeddings.float[0])
         else:
@@ -148,82 +205,135 @@ def compute_image_embedding(base64_img: str, _cohere_client) -> np.ndarray | Non
         st.error(f"Error computing embedding: {e}")
         return None
 
+# Embed an encoded image, reusing stored vectors for identical or near-duplicate content
+def embed_image_bytes(img_bytes: bytes, source: str, img_path: str, cohere_client,
+                      img_key: str | None = None) -> np.ndarray | None:
+    """Returns the embedding for an image, calling Cohere only for content not seen before."""
+    store = get_embedding_store()
+    cache = get_image_embedding_cache()
+    img_key = img_key or content_key(img_bytes) # Computed once; every later lookup uses this digest
+    st.session_state.thumbnail_paths[img_path] = get_thumbnail_cache().add_bytes(img_key, img_bytes)
+    emb = cache.get(img_key, "embed-v4.0")
+    if emb is not None:
+        return emb
+    emb = store.get(img_key)
+    if emb is not None:
+        return cache.put(img_key, "embed-v4.0", emb)
+
+    detector = get_duplicate_detector()
+    fingerprint = page_fingerprint(Image.open(io.BytesIO(img_bytes)))
+    duplicate_key = detector.match(fingerprint)
+    if duplicate_key is not None:
+        emb = store.get(duplicate_key)
+        if emb is not None:
+            st.session_state.embed_calls_saved += 1
+            store.add(img_key, emb, source=source, page=None, image_path=img_path)
+            return cache.put(img_key, "embed-v4.0", emb)
+
+    # The cache was already looked up above: compute and put, without a second (missing) lookup
+    emb = compute_image_embedding(img_bytes, cohere_client)
+    if emb is not None:
+        store.add(img_key, emb, source=source, page=None, image_path=img_path)
+        detector.add(fingerprint, img_key)
+        emb = cache.put(img_key, "embed-v4.0", emb)
+    return emb
+
 # Process a PDF file: extract pages as images and embed them
 # Note: Caching PDF processing might be complex due to potential large file sizes and streams
 # We will process it directly for now, but show progress.
-def process_pdf_file(pdf_file, cohere_client, base_output_folder="pdf_pages") -> tuple[list[str], list[np.ndarray] | None]:
+def process_pdf_file(pdf_file, cohere_client, digest: str, base_output_folder="pdf_pages",
+                     pages: list[int] | None = None) -> tuple[list[str], list[np.ndarray] | None, list[str]]:
     """Extracts pages from a PDF as images, embeds them, and saves them.
 
     Args:
         pdf_file: UploadedFile object from Streamlit.
         cohere_client: Initialized Cohere client.
+        digest: Content digest of the PDF bytes; it names the page folder and records the upload.
         base_output_folder: Directory to save page images.
+        pages: 1-based numbers of the only pages to process (those that failed before), or None for all.
 
     Returns:
         A tuple containing: 
           - list of paths to the saved page images.
           - list of numpy array embeddings for each page, or None if embedding fails.
+          - list of embedding store keys for each page.
     """
-    page_image_paths = []
-    page_embeddings = []
     pdf_filename = pdf_file.name
-    output_folder = os.path.join(base_output_folder, os.path.splitext(pdf_filename)[0])
-    os.makedirs(output_folder, exist_ok=True)
+    # Same-named PDFs with different content get separate folders
+    output_folder = os.path.join(base_output_folder, os.path.splitext(pdf_filename)[0], digest[:12])
 
     try:
-        # Open PDF from stream
-        doc = fitz.open(stream=pdf_file.read(), filetype="pdf")
-        st.write(f"Processing PDF: {pdf_filename} ({len(doc)} pages)")
-        pdf_progress = st.progress(0.0)
-
-        for i, page in enumerate(doc.pages()):
-            page_num = i + 1
-            page_img_path = os.path.join(output_folder, f"page_{page_num}.png")
-            page_image_paths.append(page_img_path)
-
-            # Render page to pixmap (image)
-            pix = page.get_pixmap(dpi=150) # Adjust DPI as needed for quality/performance
-            pil_image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            # Save the page image temporarily
-            pil_image.save(page_img_path, "PNG")
-            
-            # Convert PIL image to base64
-            base64_img = pil_to_base64(pil_image)
-            
-            # Compute embedding for the page image
-            emb = compute_image_embedding(base64_img, _cohere_client=cohere_client)
-            if emb is not None:
-                page_embeddings.append(emb)
-            else:
-                st.warning(f"Could not embed page {page_num} from {pdf_filename}. Skipping.")
-                # Add a placeholder to keep lists aligned, will be filtered later
-                page_embeddings.append(None)
-
-            # Update progress
-            pdf_progress.progress((i + 1) / len(doc))
+        pipeline = PdfIngestPipeline(
+            pdf_file.getvalue(),
+            output_folder,
+            embedder=BatchEmbedder(cohere_client, batch_size=embed_batch_size, max_in_flight=embed_max_in_flight),
+            store=get_embedding_store(),
+            workers=render_workers,
+            memory_budget_mb=render_memory_budget_mb,
+            source=pdf_filename,
+            img_format=page_image_format,
+            detector=get_duplicate_detector(),
+            thumbnails=get_thumbnail_cache(),
+            pages=[page - 1 for page in pages] if pages else None,
+        )
+        st.write(f"Retrying {len(pages)} failed pages of {pdf_filename}" if pages else f"Processing PDF: {pdf_filename}")
+        render_progress = st.progress(0.0, text="Rendering pages...")
+        embed_progress = st.progress(0.0, text="Embedding pages...")
+
+        def on_progress(stage: str, done: int, total: int) -> None:
+            bar = render_progress if stage == "render" else embed_progress
+            bar.progress(done / total, text=f"{'Rendering' if stage == 'render' else 'Embedding'} pages... {done}/{total}")
+
+        result = pipeline.run(on_progress=on_progress)
+        telemetry = get_telemetry()
+        telemetry.record("process_pdf", result.total_seconds, pages=len(result.image_paths))
+        for stage, seconds in result.timings:
+            telemetry.record(stage, seconds)
+        telemetry.count("pdf_pages_reused", result.reused)
+        telemetry.count("pdf_pages_deduplicated", result.deduplicated)
+        render_progress.empty() # Remove progress bars after completion
+        embed_progress.empty()
+
+        for failed_pages, error in result.errors:
+            st.warning(f"Could not embed pages {failed_pages} from {pdf_filename}: {error}. Skipping.")
+        st.caption(
+            f"{pdf_filename}: rendered {result.render.summary()}, embedded {result.embed.summary()}, "
+            f"reused {result.reused} stored embeddings, skipped {result.deduplicated} duplicate pages, "
+            f"total {result.total_seconds:.2f}s."
+        )
+        st.session_state.embed_calls_saved += result.deduplicated
+        st.session_state.thumbnail_paths.update(
+            (path, thumb) for path, thumb in zip(result.image_paths, result.thumbnails) if thumb
+        )
 
-        doc.close()
-        pdf_progress.empty() # Remove progress bar after completion
-        
         # Filter out pages where embedding failed
-        valid_paths = [path for i, path in enumerate(page_image_paths) if page_embeddings[i] is not None]
-        valid_embeddings = [emb for emb in page_embeddings if emb is not None]
+        valid_paths = [path for path, emb in zip(result.image_paths, result.embeddings) if emb is not None]
+        valid_embeddings = [emb for emb in result.embeddings if emb is not None]
+        valid_keys = [key for key, emb in zip(result.keys, result.embeddings) if emb is not None]
         
         if not valid_embeddings:
              st.error(f"Failed to generate any embeddings for {pdf_filename}.")
-             return [], None
+             return [], None, []
 
-        return valid_paths, valid_embeddings
+        # Record the embedded pages (with those from earlier runs) and the failed ones, so a rerun retries only those
+        upload_index = get_upload_index()
+        recorded = {page["image_path"]: page["key"] for page in upload_index.pages(digest)} if pages else {}
+        recorded.update(zip(valid_paths, valid_keys))
+        attempted = pages or range(1, len(result.image_paths) + 1)
+        upload_index.record(digest, pdf_filename, [
+            {"image_path": path, "key": recorded[path]} for path in result.image_paths if path in recorded
+        ], failed_pages=[page for page in attempted if result.embeddings[page - 1] is None])
+
+        return valid_paths, valid_embeddings, valid_keys
 
     except Exception as e:
         st.error(f"Error processing PDF {pdf_filename}: {e}")
-        return [], None
+        return [], None, []
 
 # Download and embed sample images
 @st.cache_data(ttl=3600, show_spinner=False)
-def download_and_embed_sample_images(_cohere_client) -> tuple[list[str], np.ndarray | None]:
-    """Downloads sample images and computes their embeddings using Cohere's Embed-4 model."""
+def download_and_embed_sample_images(_cohere_client) -> tuple[list[str], np.ndarray | None, list[str]]:
+    """Downloads sample images and computes their embeddings (and store keys) using Cohere's Embed-4 model."""
     # Several images from https://www.appeconomyinsights.com/
     images = {
         "tesla.png": "https://substackcdn.com/image/fetch/w_1456,c_limit,f_webp,q_auto:good,fl_progressive:steep/https%3A%2F%2Fsubstack-post-media.s3.amazonaws.com%2Fpublic%2Fimages%2Fbef936e6-3efa-43b3-88d7-7ec620cdb33b_2744x1539.png",
@@ -236,122 +346,182 @@ def download_and_embed_sample_images(_cohere_client) -> tuple[list[str], np.ndar
 
     # Prepare folders
     img_folder = "img"
-    os.makedirs(img_folder, exist_ok=True)
 
     img_paths = []
     doc_embeddings = []
+    img_keys = []
+    store = get_embedding_store()
     
     # Wrap TQDM with st.spinner for better UI integration
     with st.spinner("Downloading and embedding sample images..."):
-        pbar = tqdm.tqdm(images.items(), desc="Processing sample images")
-        for name, url in pbar:
-            img_path = os.path.join(img_folder, name)
-            # Don't re-append if already processed (useful if function called multiple times)
-            if img_path not in img_paths:
-                img_paths.append(img_path)
-
-                # Download the image
-                if not os.path.exists(img_path):
-                    try:
-                        response = requests.get(url)
-                        response.raise_for_status()
-                        with open(img_path, "wb") as fOut:
-                            fOut.write(response.content)
-                    except requests.exceptions.RequestException as e:
-                        st.error(f"Failed to download {name}: {e}")
-                        # Optionally remove the path if download failed
-                        img_paths.pop()
-                        continue # Skip if download fails
-
-            # Get embedding for the image if it exists and we haven't computed one yet
-            # Find index corresponding to this path
-            current_index = -1
+        # Fetch (or revalidate) every image concurrently before embedding
+        downloads = get_downloader().fetch_all(images, img_folder)
+
+        pbar = tqdm.tqdm(images, desc="Processing sample images")
+        for name in pbar:
+            download = downloads[name]
+            if not download.ok:
+                st.error(f"Failed to download {name}: {download.error}")
+                continue # Skip if download fails
+            img_path = download.path
+
             try:
-                current_index = img_paths.index(img_path)
-            except ValueError:
-                continue # Should not happen if append logic is correct
-
-            # Check if embedding already exists for this index
-            if current_index >= len(doc_embeddings):
-                 try:
-                     # Ensure file exists before trying to embed
-                     if os.path.exists(img_path):
-                         base64_img = base64_from_image(img_path)
-                         emb = compute_image_embedding(base64_img, _cohere_client=_cohere_client)
-                         if emb is not None:
-                             # Placeholder to ensure list length matches paths before vstack
-                             while len(doc_embeddings) < current_index:
-                                 doc_embeddings.append(None) # Append placeholder if needed
-                             doc_embeddings.append(emb)
-                     else:
-                         # If file doesn't exist (maybe failed download), add placeholder
-                         while len(doc_embeddings) < current_index:
-                                 doc_embeddings.append(None)
-                         doc_embeddings.append(None)
-                 except Exception as e:
-                     st.error(f"Failed to embed {name}: {e}")
-                     # Add placeholder on error
-                     while len(doc_embeddings) < current_index:
-                             doc_embeddings.append(None)
-                     doc_embeddings.append(None)
-    
-    # Filter out None embeddings and corresponding paths before stacking
-    filtered_paths = [path for i, path in enumerate(img_paths) if i < len(doc_embeddings) and doc_embeddings[i] is not None]
-    filtered_embeddings = [emb for emb in doc_embeddings if emb is not None]
+                with open(img_path, "rb") as fIn:
+                    img_bytes = fIn.read()
+                img_key = content_key(img_bytes)
+                emb = embed_image_bytes(img_bytes, source=name, img_path=img_path, cohere_client=_cohere_client,
+                                        img_key=img_key)
+                if emb is not None:
+                    img_paths.append(img_path)
+                    doc_embeddings.append(emb)
+                    img_keys.append(img_key)
+            except Exception as e:
+                st.error(f"Failed to embed {name}: {e}")
 
-    if filtered_embeddings:
-        doc_embeddings_array = np.vstack(filtered_embeddings)
-        return filtered_paths, doc_embeddings_array
+    if doc_embeddings:
+        return img_paths, np.vstack(doc_embeddings), img_keys
         
-    return [], None
+    return [], None, []
 
 # Search function
-def search(question: str, co_client: cohere.Client, embeddings: np.ndarray, image_paths: list[str], max_img_size: int = 800) -> str | None:
-    """Finds the most relevant image path for a given question."""
-    if not co_client or embeddings is None or embeddings.size == 0 or not image_paths:
-        st.warning("Search prerequisites not met (client, embeddings, or paths missing/empty).")
-        return None
-    if embeddings.shape[0] != len(image_paths):
-         st.error(f"Mismatch between embeddings count ({embeddings.shape[0]}) and image paths count ({len(image_paths)}). Cannot perform search.")
-         return None
+def search(question: str, co_client: cohere.Client, index: VectorIndex, top_k: int = search_top_k) -> list[tuple[str, float]]:
+    """Finds the most relevant image paths for a given question, best first, with cosine scores."""
+    if not co_client or index is None or len(index) == 0:
+        st.warning("Search prerequisites not met (client or embeddings missing/empty).")
+        return []
 
-    try:
-        # Compute the embedding for the query
-        api_response = co_client.embed(
-            model="embed-v4.0",
-            input_type="search_query",
-            embedding_types=["float"],
-            texts=[question],
-        )
+    telemetry = get_telemetry()
 
+    def embed_query() -> np.ndarray | None:
+        # Compute the embedding for the query
+        with telemetry.time("embed_query"):
+            api_response = co_client.embed(
+                model="embed-v4.0",
+                input_type="search_query",
+                embedding_types=["float"],
+                texts=[question],
+            )
         if not api_response.embeddings or not api_response.embeddings.float:
-            st.error("Failed to get query embedding.")
             return None
+        return np.asarray(api_response.embeddings.float[0])
 
-        query_emb = np.asarray(api_response.embeddings.float[0])
-
-        # Ensure query embedding has the correct shape for dot product
-        if query_emb.shape[0] != embeddings.shape[1]:
-            st.error(f"Query embedding dimension ({query_emb.shape[0]}) does not match document embedding dimension ({embeddings.shape[1]}).")
-            return None
-
-        # Compute cosine similarities
-        cos_sim_scores = np.dot(query_emb, embeddings.T)
+    try:
+        started = time.perf_counter()
+        query_emb = get_query_cache().get_or_compute(question, "embed-v4.0", embed_query)
+        if query_emb is None:
+            st.error("Failed to get query embedding.")
+            return []
 
-        # Get the most relevant image
-        top_idx = np.argmax(cos_sim_scores)
-        hit_img_path = image_paths[top_idx]
+        # Top-k cosine similarities over the normalized index
+        with telemetry.time("similarity_search", docs=len(index)):
+            hits = index.search(query_emb, k=top_k)
+        telemetry.record("search", time.perf_counter() - started)
         print(f"Question: {question}") # Keep for debugging
-        print(f"Most relevant image: {hit_img_path}") # Keep for debugging
+        print(f"Most relevant images: {hits}") # Keep for debugging
 
-        return hit_img_path
+        return hits
     except Exception as e:
         st.error(f"Error during search: {e}")
+        return []
+
+def rescore_from_store(paths: list[str]) -> np.ndarray:
+    """Float32 vectors for a binary shortlist, read from the embedding store's memmap."""
+    return np.vstack(get_embedding_store().get_many([st.session_state.image_keys[path] for path in paths]))
+
+# Search index holding the session's embeddings, keyed by image path
+def get_search_index() -> VectorIndex:
+    """Returns the session's VectorIndex, creating an empty one on first use."""
+    if 'search_index' not in st.session_state:
+        if index_dtype == "binary":
+            # No full vectors in memory: the shortlist is rescored from the store on disk
+            st.session_state.search_index = VectorIndex(dtype="binary", ivf_threshold=index_ivf_threshold,
+                                                          rescore=None, rescore_source=rescore_from_store)
+        else:
+            st.session_state.search_index = VectorIndex(dtype=index_dtype, ivf_threshold=index_ivf_threshold)
+    return st.session_state.search_index
+
+def add_to_collection(paths: list[str], embeddings: list[np.ndarray] | np.ndarray, keys: list[str]) -> None:
+    """Appends images to the session collection; the index grows in place instead of re-stacking.
+
+    `keys` are the embedding store keys of the images, used to rescore binary search hits.
+    """
+    get_search_index().add(np.asarray(embeddings), ids=paths)
+    st.session_state.image_keys.update(zip(paths, keys))
+    st.session_state.image_paths.extend(paths)
+
+def remove_from_collection(paths: list[str]) -> int:
+    """Removes images from the session collection without rebuilding the index."""
+    index = get_search_index()
+    removed = index.remove(paths)
+    for path in paths:
+        st.session_state.image_keys.pop(path, None)
+    st.session_state.removed_paths.update(paths)
+    st.session_state.image_paths = index.ids
+    return removed
+
+# Streaming helpers for answer()
+def record_answer_stats(ttft: float, total: float, tokens: int, streamed: bool) -> None:
+    """Keeps time-to-first-token and throughput for each answer in the session."""
+    generation_time = total - ttft
+    st.session_state.setdefault("answer_stats", []).append({
+        "ttft_s": round(ttft, 3),
+        "total_s": round(total, 3),
+        "tokens": tokens,
+        "tokens_per_s": round(tokens / generation_time, 1) if streamed and generation_time > 0 else None,
+        "streamed": streamed,
+    })
+    telemetry = get_telemetry()
+    telemetry.record("groq_ttft", ttft, streamed=streamed)
+    telemetry.record("groq", total, tokens=tokens, streamed=streamed)
+
+def stream_answer(prompt: str, groq_client, placeholder) -> str | None:
+    """Streams the answer into `placeholder`, re-rendering at most every `answer_render_interval` seconds.
+
+    Returns None if streaming failed before any token arrived, so the caller can
+    fall back to a blocking call.
+    """
+    started = time.perf_counter()
+    first_token_at = None
+    last_render = 0.0
+    chunks = []
+    output_tokens = None
+    try:
+        for chunk in groq_client.stream(prompt):
+            text = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            usage = getattr(chunk, 'usage_metadata', None)
+            if usage and usage.get("output_tokens"):
+                output_tokens = usage["output_tokens"]
+            if not text:
+                continue
+            now = time.perf_counter()
+            if first_token_at is None:
+                first_token_at = now
+            chunks.append(text)
+            if now - last_render >= answer_render_interval:
+                placeholder.markdown("**Answer:**\n" + "".join(chunks) + "▌")
+                last_render = now
+    except Exception as e:
+        if first_token_at is None:
+            logger.warning("Streaming failed, falling back to a blocking call: %s", e)
+            return None
+        chunks.append(f"\n\n[Answer stream interrupted: {e}]")
+
+    if first_token_at is None:
         return None
+    llm_answer = "".join(chunks)
+    placeholder.markdown(f"**Answer:**\n{llm_answer}")
+    # Groq reports exact output tokens in the final chunk; otherwise count streamed chunks
+    record_answer_stats(ttft=first_token_at - started, total=time.perf_counter() - started,
+                        tokens=output_tokens or len(chunks), streamed=True)
+    return llm_answer
 
 # Answer function
-def answer(question: str, img_path: str, groq_client) -> str:
-    """Answers the question based on the retrieved image using Groq (text-only approach)."""
+def answer(question: str, img_path: str, groq_client, placeholder=None, stream: bool = answer_streaming) -> str:
+    """Answers the question based on the retrieved image using Groq (text-only approach).
+
+    With `stream=True` and a `placeholder`, tokens are rendered into the
+    placeholder as they arrive; otherwise the full answer is fetched in one call.
+    """
     if not groq_client or not img_path or not os.path.exists(img_path):
         missing = []
         if not groq_client: missing.append("Groq client")
@@ -389,35 +559,53 @@ Please provide a helpful answer based on what you can infer from the context. If
 
 Note: The actual image content cannot be directly analyzed by this model, but the image was selected as most relevant to your question from the embedded document collection."""
 
-        response = groq_client.invoke(prompt)
-        
-        llm_answer = response.content if hasattr(response, 'content') else str(response)
+        llm_answer = None
+        answer_started = time.perf_counter()
+        if stream and placeholder is not None:
+            llm_answer = stream_answer(prompt, groq_client, placeholder)
+
+        if llm_answer is None:
+            # Non-streaming fallback
+            started = time.perf_counter()
+            response = groq_client.invoke(prompt)
+            llm_answer = response.content if hasattr(response, 'content') else str(response)
+            elapsed = time.perf_counter() - started
+            usage = getattr(response, 'usage_metadata', None) or {}
+            record_answer_stats(ttft=elapsed, total=elapsed, tokens=usage.get("output_tokens") or len(llm_answer.split()), streamed=False)
+
+        get_telemetry().record("answer", time.perf_counter() - answer_started)
         print("LLM Answer:", llm_answer) # Keep for debugging
         return llm_answer
     except Exception as e:
         st.error(f"Error during answer generation: {e}")
         return f"Failed to generate answer: {e}"
 
+# --- Load the corpus built offline by indexer.py (once per session) ---
+if not st.session_state.get("corpus_loaded"):
+    st.session_state.corpus_loaded = True
+    if os.path.exists(corpus_index_path):
+        corpus_paths, corpus_embeddings, corpus_keys = CorpusIndex(corpus_index_path).load(get_embedding_store())
+        selected = select_new_paths(corpus_paths, set(st.session_state.image_paths), st.session_state.removed_paths)
+        if selected:
+            corpus_paths = [corpus_paths[idx] for idx in selected]
+            add_to_collection(corpus_paths, corpus_embeddings[selected], [corpus_keys[idx] for idx in selected])
+            st.sidebar.info(f"Loaded {len(corpus_paths)} indexed pages from {corpus_index_path}.")
+
 # --- Main UI Setup ---
 st.subheader("📊 Load Sample Images")
 if cohere_api_key and co:
     # If button clicked, load sample images into session state
     if st.button("Load Sample Images", key="load_sample_button"):
-        sample_img_paths, sample_doc_embeddings = download_and_embed_sample_images(_cohere_client=co)
+        sample_img_paths, sample_doc_embeddings, sample_keys = download_and_embed_sample_images(_cohere_client=co)
         if sample_img_paths and sample_doc_embeddings is not None:
             # Append sample images to session state (avoid duplicates if clicked again)
-            current_paths = set(st.session_state.image_paths)
-            new_paths = [p for p in sample_img_paths if p not in current_paths]
+            # Clicking the button is an explicit re-add of any sample image removed earlier
+            new_indices = select_new_paths(sample_img_paths, set(st.session_state.image_paths),
+                                           st.session_state.removed_paths, readded=True)
+            new_paths = [sample_img_paths[idx] for idx in new_indices]
             
             if new_paths:
-                new_indices = [i for i, p in enumerate(sample_img_paths) if p in new_paths]
-                st.session_state.image_paths.extend(new_paths)
-                new_embeddings_to_add = sample_doc_embeddings[[idx for idx, p in enumerate(sample_img_paths) if p in new_paths]]
-                
-                if st.session_state.doc_embeddings is None or st.session_state.doc_embeddings.size == 0:
-                    st.session_state.doc_embeddings = new_embeddings_to_add
-                else:
-                    st.session_state.doc_embeddings = np.vstack((st.session_state.doc_embeddings, new_embeddings_to_add))
+                add_to_collection(new_paths, sample_doc_embeddings[new_indices], [sample_keys[idx] for idx in new_indices])
                 st.success(f"Loaded {len(new_paths)} sample images.")
             else:
                  st.info("Sample images already loaded.")
@@ -448,55 +636,80 @@ if uploaded_files and co:
     
     newly_uploaded_paths = []
     newly_uploaded_embeddings = []
+    newly_uploaded_keys = []
+    current_paths = set(st.session_state.image_paths)
+    upload_index = get_upload_index()
+    reused_uploads = 0
 
     for i, uploaded_file in enumerate(uploaded_files):
-        # Check if already processed this session (simple name check)
-        img_path = os.path.join(upload_folder, uploaded_file.name)
-        if img_path not in st.session_state.image_paths:
-            try:
+        # Uploads are identified by a digest of their bytes, not their file name
+        file_bytes = uploaded_file.getvalue()
+        digest = content_key(file_bytes)
+        known_paths = upload_index.image_paths(digest)
+        failed_pages = upload_index.failed_pages(digest)
+        # A new uploader entry is the user adding the file (again); the same entry on a rerun is not
+        readded = uploaded_file.file_id not in st.session_state.upload_file_ids
+        st.session_state.upload_file_ids.add(uploaded_file.file_id)
+        if readded:
+            st.session_state.removed_paths.difference_update(known_paths)
+        skipped_paths = current_paths | st.session_state.removed_paths
+        if known_paths and all(p in skipped_paths for p in known_paths) and not failed_pages:
+            progress_bar.progress((i + 1) / len(uploaded_files))
+            continue # Already in this session's collection
+
+        try:
+            known = upload_index.load(digest, get_embedding_store())
+            if known is not None and not failed_pages:
+                # Identical content was ingested before: no rendering or API calls
+                paths, embeddings, keys = known
+                reused_uploads += 1
+            else:
+                # A partially ingested PDF keeps its embedded pages and retries only the failed ones
+                paths, embeddings, keys = (list(part) for part in known) if known is not None else ([], [], [])
                 # Check file type
                 file_type = uploaded_file.type
                 if file_type == "application/pdf":
                     # Process PDF - returns list of paths and list of embeddings
-                    pdf_page_paths, pdf_page_embeddings = process_pdf_file(uploaded_file, cohere_client=co)
+                    pdf_page_paths, pdf_page_embeddings, pdf_page_keys = process_pdf_file(
+                        uploaded_file, cohere_client=co, digest=digest, pages=failed_pages if known is not None else None)
                     if pdf_page_paths and pdf_page_embeddings:
-                         # Add only paths/embeddings not already in session state
-                         current_paths_set = set(st.session_state.image_paths)
-                         unique_new_paths = [p for p in pdf_page_paths if p not in current_paths_set]
-                         if unique_new_paths:
-                             indices_to_add = [i for i, p in enumerate(pdf_page_paths) if p in unique_new_paths]
-                             newly_uploaded_paths.extend(unique_new_paths)
-                             newly_uploaded_embeddings.extend([pdf_page_embeddings[idx] for idx in indices_to_add])
+                        paths, embeddings, keys = paths + pdf_page_paths, embeddings + pdf_page_embeddings, keys + pdf_page_keys
                 elif file_type in ["image/png", "image/jpeg"]:
                     # Process regular image
-                    # Save the uploaded file
+                    # Save the uploaded file (same-named images with different content get separate folders)
+                    img_path = os.path.join(upload_folder, digest[:12], uploaded_file.name)
+                    os.makedirs(os.path.dirname(img_path), exist_ok=True)
                     with open(img_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
-                    
-                    # Get embedding
-                    base64_img = base64_from_image(img_path)
-                    emb = compute_image_embedding(base64_img, _cohere_client=co)
-                    
+                        f.write(file_bytes)
+
+                    # Get embedding (the uploaded bytes are sent as-is unless the image is too large)
+                    emb = embed_image_bytes(file_bytes, source=uploaded_file.name, img_path=img_path,
+                                            cohere_client=co, img_key=digest)
+
                     if emb is not None:
-                        newly_uploaded_paths.append(img_path)
-                        newly_uploaded_embeddings.append(emb)
+                        paths, embeddings, keys = [img_path], [emb], [digest]
+                        upload_index.record(digest, uploaded_file.name, [{"image_path": img_path, "key": digest}])
                 else:
                      st.warning(f"Unsupported file type skipped: {uploaded_file.name} ({file_type})")
 
-            except Exception as e:
-                st.error(f"Error processing {uploaded_file.name}: {e}")
+            # Add only paths not already in the collection and not removed by the user
+            for idx in select_new_paths(paths, current_paths, st.session_state.removed_paths, readded=readded):
+                newly_uploaded_paths.append(paths[idx])
+                newly_uploaded_embeddings.append(embeddings[idx])
+                newly_uploaded_keys.append(keys[idx])
+
+        except Exception as e:
+            st.error(f"Error processing {uploaded_file.name}: {e}")
         # Update progress regardless of processing status for user feedback
         progress_bar.progress((i + 1) / len(uploaded_files))
 
+    if reused_uploads:
+        st.caption(f"Recognized {reused_uploads} previously ingested files by content; no rendering or embedding needed.")
+
     # Add newly processed files to session state
     if newly_uploaded_paths:
-        st.session_state.image_paths.extend(newly_uploaded_paths)
         if newly_uploaded_embeddings:
-            new_embeddings_array = np.vstack(newly_uploaded_embeddings)
-            if st.session_state.doc_embeddings is None or st.session_state.doc_embeddings.size == 0:
-                st.session_state.doc_embeddings = new_embeddings_array
-            else:
-                st.session_state.doc_embeddings = np.vstack((st.session_state.doc_embeddings, new_embeddings_array))
+            add_to_collection(newly_uploaded_paths, newly_uploaded_embeddings, newly_uploaded_keys)
             st.success(f"Successfully processed and added {len(newly_uploaded_paths)} new images.")
         else:
              st.warning("Failed to generate embeddings for newly uploaded images.")
@@ -511,30 +724,50 @@ if not st.session_state.image_paths:
     st.warning("Please load sample images or upload your own images first.")
 else:
     st.info(f"Ready to answer questions about {len(st.session_state.image_paths)} images.")
+    if st.session_state.embed_calls_saved:
+        st.caption(f"Duplicate detection saved {st.session_state.embed_calls_saved} embedding calls this session.")
 
     # Display thumbnails of all loaded images (optional)
     with st.expander("View Loaded Images", expanded=False):
         if st.session_state.image_paths:
-            num_images_to_show = len(st.session_state.image_paths)
-            cols = st.columns(5) # Show 5 thumbnails per row
-            for i in range(num_images_to_show):
-                with cols[i % 5]:
+            # Paginated, so each rerun only sends one page of small thumbnails
+            image_paths = st.session_state.image_paths
+            num_gallery_pages = (len(image_paths) + gallery_page_size - 1) // gallery_page_size
+            if st.session_state.get("gallery_page", 1) > num_gallery_pages:
+                st.session_state.gallery_page = num_gallery_pages # The collection shrank
+            gallery_page = 1
+            if num_gallery_pages > 1:
+                gallery_page = st.number_input("Page", min_value=1, max_value=num_gallery_pages, step=1, key="gallery_page")
+            start = (gallery_page - 1) * gallery_page_size
+            visible_paths = image_paths[start:start + gallery_page_size]
+            st.caption(f"Showing {start + 1}-{start + len(visible_paths)} of {len(image_paths)} images")
+            cols = st.columns(gallery_columns)
+            for i, image_path in enumerate(visible_paths):
+                with cols[i % gallery_columns]:
                     # Add try-except for missing files during display
                     try:
-                         # Display PDF pages differently? For now, just show the image
-                         st.image(st.session_state.image_paths[i], width=100, caption=os.path.basename(st.session_state.image_paths[i]))
+                         st.image(thumbnail_for(image_path), width=100, caption=os.path.basename(image_path))
                     except FileNotFoundError:
-                        st.error(f"Missing: {os.path.basename(st.session_state.image_paths[i])}")
+                        st.error(f"Missing: {os.path.basename(image_path)}")
         else:
             st.write("No images loaded yet.")
 
+    # Remove images from the collection (the search index drops them in place)
+    with st.expander("Remove Loaded Images", expanded=False):
+        paths_to_remove = st.multiselect("Images to remove", st.session_state.image_paths,
+                                         format_func=lambda p: os.path.relpath(p), key="paths_to_remove")
+        if st.button("Remove Selected", key="remove_images_button", disabled=not paths_to_remove):
+            removed = remove_from_collection(paths_to_remove)
+            st.success(f"Removed {removed} images.")
+            st.rerun()
+
 question = st.text_input("Ask a question about the loaded images:", 
                           key="main_question_input",
                           placeholder="E.g., What is Nike's net profit?",
                           disabled=not st.session_state.image_paths)
 
 run_button = st.button("Run Vision RAG", key="main_run_button", 
-                      disabled=not (cohere_api_key and groq_api_key and question and st.session_state.image_paths and st.session_state.doc_embeddings is not None and st.session_state.doc_embeddings.size > 0))
+                      disabled=not (cohere_api_key and groq_api_key and question and len(get_search_index()) > 0))
 
 # Output Area
 st.markdown("### Results")
@@ -543,29 +776,36 @@ answer_placeholder = st.empty()
 
 # Run search and answer logic
 if run_button:
-    if co and groq_client and st.session_state.doc_embeddings is not None and len(st.session_state.doc_embeddings) > 0:
+    if co and groq_client and len(get_search_index()) > 0:
          with st.spinner("Finding relevant image..."):
-            # Ensure embeddings and paths match before search
-             if len(st.session_state.image_paths) != st.session_state.doc_embeddings.shape[0]:
-                 st.error("Error: Mismatch between number of images and embeddings. Cannot proceed.")
-             else:
-                top_image_path = search(question, co, st.session_state.doc_embeddings, st.session_state.image_paths)
-
-                if top_image_path:
-                    caption = f"Retrieved content for: '{question}' (Source: {os.path.basename(top_image_path)})"
+                hits = search(question, co, get_search_index())
+                cache_stats = get_query_cache().stats()
+                st.caption(f"Query embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+                           f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} cached)")
+
+                if hits:
+                    top_image_path, top_score = hits[0]
+                    caption = f"Retrieved content for: '{question}' (Source: {os.path.basename(top_image_path)}, score {top_score:.3f})"
                     # Add source PDF name if it's a page image
                     if top_image_path.startswith("pdf_pages/"):
                          parts = top_image_path.split(os.sep)
                          if len(parts) >= 3:
                              pdf_name = parts[1]
                              page_name = parts[-1]
-                             caption = f"Retrieved content for: '{question}' (Source: {pdf_name}.pdf, {page_name.replace('.png','')})"
+                             caption = f"Retrieved content for: '{question}' (Source: {pdf_name}.pdf, {os.path.splitext(page_name)[0]}, score {top_score:.3f})"
 
                     retrieved_image_placeholder.image(top_image_path, caption=caption, use_column_width=True)
+                    if len(hits) > 1:
+                        st.caption("Other matches: " + ", ".join(f"{os.path.basename(path)} ({score:.3f})" for path, score in hits[1:]))
 
                     with st.spinner("Generating answer..."):
-                        final_answer = answer(question, top_image_path, groq_client)
+                        final_answer = answer(question, top_image_path, groq_client, placeholder=answer_placeholder)
                         answer_placeholder.markdown(f"**Answer:**\n{final_answer}")
+                        stats = st.session_state.get("answer_stats")
+                        if stats:
+                            latest = stats[-1]
+                            throughput = f", {latest['tokens_per_s']} tokens/s" if latest['tokens_per_s'] else ""
+                            st.caption(f"Time to first token {latest['ttft_s']:.2f}s, total {latest['total_s']:.2f}s{throughput}")
                 else:
                     retrieved_image_placeholder.warning("Could not find a relevant image for your question.")
                     answer_placeholder.text("") # Clear answer placeholder
@@ -573,6 +813,22 @@ if run_button:
         # This case should ideally be prevented by the disabled state of the button
         st.error("Cannot run RAG. Check API clients and ensure images are loaded with embeddings.")
 
+# --- Latency panel (rendered last so it includes this run's timings) ---
+with st.sidebar:
+    st.header("⏱️ Latency")
+    telemetry = get_telemetry()
+    latency_rows = telemetry.summary()
+    if latency_rows:
+        st.dataframe(latency_rows, hide_index=True, use_container_width=True)
+        image_cache_stats = get_image_embedding_cache().stats()
+        st.caption(f"Image embedding cache: {image_cache_stats['hits']} hits, {image_cache_stats['misses']} misses")
+        if telemetry.counters:
+            st.caption(", ".join(f"{name}: {n}" for name, n in telemetry.counters.items()))
+        st.download_button("Export timings (JSONL)", data=telemetry.to_jsonl(),
+                           file_name="vision_rag_latency.jsonl", mime="application/x-ndjson")
+    else:
+        st.caption("Stage timings (p50/p95) appear here once pages are ingested or questions asked.")
+
 # Footer
 st.markdown("---")
 st.caption("Vision RAG with Cohere Embed-4 | Built with Streamlit, Cohere Embed-4, and Groq")
\ No newline at end of file
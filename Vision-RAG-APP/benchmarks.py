@@ -0,0 +1,205 @@
+"""Offline benchmarks for the Vision RAG ingestion and search helpers.
+
+Usage:
+    python benchmarks.py encode [--pdf FILE] [--pages N]
+    python benchmarks.py search [--docs N] [--dim D] [--queries Q] [--k K] [--rescore-factor F]
+    python benchmarks.py hashing [--pdf FILE] [--pages N] [--lookups L]
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import fitz # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from embedding_store import content_key
+from image_utils import bytes_to_base64, encode_image, payload_formats, pil_to_base64, render_zoom
+from vector_index import VectorIndex
+
+
+def synthetic_pdf(num_pages: int) -> bytes:
+    """Builds a slide-like PDF with text, shapes and colour so encoders have real work to do."""
+    doc = fitz.open()
+    for i in range(num_pages):
+        page = doc.new_page(width=960, height=540)
+        page.draw_rect(fitz.Rect(0, 0, 960, 80), color=None, fill=(0.1, 0.2, 0.5))
+        page.insert_text((40, 55), f"Quarterly report - slide {i + 1}", fontsize=28, color=(1, 1, 1))
+        for bar in range(8):
+            height = 40 + (i * 37 + bar * 53) % 300
+            page.draw_rect(fitz.Rect(80 + bar * 90, 480 - height, 140 + bar * 90, 480),
+                           color=None, fill=(0.2 + bar * 0.08, 0.6, 0.3))
+        page.insert_text((40, 520), "Revenue, operating income and free cash flow by segment", fontsize=14)
+    return doc.tobytes()
+
+
+def legacy_page(page, out_path: str) -> int:
+    """The original path: 150 DPI PNG to disk, then downscale and PNG-encode again for the API."""
+    pix = page.get_pixmap(dpi=150)
+    pil_image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    pil_image.save(out_path, "PNG")
+    return len(pil_to_base64(pil_image))
+
+
+def single_encode_page(page, out_path: str, img_format: str) -> int:
+    """The size-targeted path: render under max_pixels, encode once, reuse the bytes."""
+    zoom = render_zoom(page.rect.width, page.rect.height, 150)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    pil_image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    img_bytes = encode_image(pil_image, img_format)
+    with open(out_path, "wb") as f:
+        f.write(img_bytes)
+    return len(bytes_to_base64(img_bytes, img_format))
+
+
+def bench_encode(args) -> None:
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = synthetic_pdf(args.pages)
+
+    variants = [("legacy PNG (render 150 DPI, encode twice)", "png", legacy_page)]
+    for img_format, ext in payload_formats.items():
+        variants.append((f"single-encode {img_format}", ext,
+                         lambda page, path, fmt=img_format: single_encode_page(page, path, fmt)))
+
+    print(f"{'variant':45} {'ms/page':>9} {'KB sent/page':>13}")
+    with tempfile.TemporaryDirectory() as out_dir, fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        for name, ext, fn in variants:
+            sent = 0
+            started = time.perf_counter()
+            for i, page in enumerate(doc):
+                sent += fn(page, os.path.join(out_dir, f"page_{i + 1}.{ext}"))
+            elapsed = time.perf_counter() - started
+            print(f"{name:45} {elapsed * 1000 / len(doc):9.1f} {sent / 1024 / len(doc):13.1f}")
+
+
+def synthetic_embeddings(num_docs: int, dim: int, num_queries: int, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Clustered document vectors plus queries that are noisy copies of random documents."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, num_docs // 50), dim))
+    docs = centers[rng.integers(0, centers.shape[0], num_docs)] + 0.5 * rng.normal(size=(num_docs, dim))
+    queries = docs[rng.integers(0, num_docs, num_queries)] + 0.5 * rng.normal(size=(num_queries, dim))
+    return docs, queries
+
+
+def recall_at_k(found: list[int], expected: np.ndarray) -> float:
+    return len(set(found) & set(expected.tolist())) / len(expected)
+
+
+def bench_search(args) -> None:
+    docs, queries = synthetic_embeddings(args.docs, args.dim, args.queries)
+
+    # Brute-force baseline: exact cosine over the full float64 matrix
+    docs_unit = docs / np.linalg.norm(docs, axis=1, keepdims=True)
+    started = time.perf_counter()
+    expected = [np.argsort(-(docs_unit @ q))[:args.k] for q in queries]
+    baseline_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+    # Full-precision vectors on disk, as in the embedding store, for rescoring binary shortlists
+    disk_dir = tempfile.TemporaryDirectory()
+    on_disk = np.memmap(os.path.join(disk_dir.name, "vectors.f32"), dtype=np.float32, mode="w+", shape=docs.shape)
+    on_disk[:] = docs
+    float32_mb = on_disk.nbytes / 2**20
+    variants = [
+        ("float16", dict(dtype="float16")),
+        ("int8", dict(dtype="int8")),
+        ("binary + int8 rescore", dict(dtype="binary", rescore="int8")),
+        ("binary + float16 rescore", dict(dtype="binary", rescore="float16")),
+        ("binary + float32 rescore (mmap)", dict(dtype="binary", rescore=None, rescore_source=lambda ids: on_disk[ids])),
+        ("binary only", dict(dtype="binary", rescore=None)),
+    ]
+    print(f"{'index':36} {'MB':>8} {'vs f32':>7} {'ms/query':>9} {f'recall@{args.k}':>10}")
+    print(f"{'brute force float64':36} {docs_unit.nbytes / 2**20:8.1f} {'':>7} {baseline_ms:9.2f} {1.0:10.3f}")
+    for name, options in variants:
+        for ivf in (False, True):
+            index = VectorIndex(**options, ivf_threshold=0 if ivf else args.docs + 1, nprobe=args.nprobe,
+                                rescore_factor=args.rescore_factor).build(docs)
+            started = time.perf_counter()
+            results = [[row for row, _ in index.search(q, k=args.k)] for q in queries]
+            elapsed_ms = (time.perf_counter() - started) * 1000 / len(queries)
+            recall = np.mean([recall_at_k(found, exp) for found, exp in zip(results, expected)])
+            mb = index.nbytes / 2**20
+            label = f"{name} {'IVF' if ivf else 'flat'}"
+            print(f"{label:36} {mb:8.1f} {float32_mb / mb:6.1f}x {elapsed_ms:9.2f} {recall:10.3f}")
+    del on_disk
+    disk_dir.cleanup()
+
+
+def bench_hashing(args) -> None:
+    if args.pdf:
+        with open(args.pdf, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        pdf_bytes = synthetic_pdf(args.pages)
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as doc:
+        pages = []
+        for page in doc:
+            zoom = render_zoom(page.rect.width, page.rect.height, 150)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+            pages.append(encode_image(Image.frombytes("RGB", [pix.width, pix.height], pix.samples), "PNG"))
+
+    # Before: st.cache_data keyed on the base64 string, so every lookup (each rerun) builds
+    # the payload and md5-hashes all of it, the way Streamlit hashes str arguments
+    started = time.perf_counter()
+    hashed = 0
+    for _ in range(args.lookups):
+        for img_bytes in pages:
+            payload = bytes_to_base64(img_bytes, "PNG")
+            hashlib.md5(payload.encode("utf-8")).digest()
+            hashed += len(payload)
+    before = time.perf_counter() - started
+
+    # After: one sha256 digest of the encoded bytes when the page is produced, then dict lookups
+    started = time.perf_counter()
+    keys = [content_key(img_bytes) for img_bytes in pages]
+    digest_seconds = time.perf_counter() - started
+    cache = dict.fromkeys(keys)
+    for _ in range(args.lookups):
+        for key in keys:
+            cache.get(key)
+    after = time.perf_counter() - started
+
+    total_mb = sum(len(p) for p in pages) / 2**20
+    print(f"{len(pages)} pages, {total_mb:.1f} MB encoded, {args.lookups} lookups per page")
+    print(f"{'cache key':36} {'total ms':>9} {'ms/page':>8} {'MB hashed':>10}")
+    print(f"{'base64 string (st.cache_data)':36} {before * 1000:9.1f} {before * 1000 / len(pages):8.2f} "
+          f"{hashed / 2**20:10.1f}")
+    print(f"{'content digest at render time':36} {after * 1000:9.1f} {after * 1000 / len(pages):8.2f} "
+          f"{total_mb:10.1f}")
+    print(f"(digesting once took {digest_seconds * 1000:.1f} ms; lookups after that are O(1))")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    encode = subparsers.add_parser("encode", help="bytes sent and ms per page for page rendering/encoding")
+    encode.add_argument("--pdf", help="PDF to benchmark (default: a synthetic slide deck)")
+    encode.add_argument("--pages", type=int, default=20, help="pages in the synthetic deck")
+    encode.set_defaults(func=bench_encode)
+
+    search = subparsers.add_parser("search", help="recall@k and latency of VectorIndex vs brute force")
+    search.add_argument("--docs", type=int, default=100_000)
+    search.add_argument("--dim", type=int, default=1536, help="embed-v4.0 returns 1536 dimensions by default")
+    search.add_argument("--queries", type=int, default=50)
+    search.add_argument("--k", type=int, default=10)
+    search.add_argument("--nprobe", type=int, default=8)
+    search.add_argument("--rescore-factor", type=int, default=10, help="binary shortlist size, in multiples of k")
+    search.set_defaults(func=bench_search)
+
+    hashing = subparsers.add_parser("hashing", help="cache-key hashing overhead: base64 string vs content digest")
+    hashing.add_argument("--pdf", help="PDF to benchmark (default: a synthetic slide deck)")
+    hashing.add_argument("--pages", type=int, default=100, help="pages in the synthetic deck")
+    hashing.add_argument("--lookups", type=int, default=3, help="cache lookups per page (reruns)")
+    hashing.set_defaults(func=bench_hashing)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
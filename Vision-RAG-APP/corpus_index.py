@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from embedding_engine import EMBED_MODEL
+from embedding_store import EmbeddingStore
+
+CORPUS_INDEX_FILE = "corpus_index.json"
+UPLOAD_INDEX_FILE = "upload_index.json"
+
+
+def load_pages(pages: list[dict], store: EmbeddingStore) -> tuple[list[str], np.ndarray | None, list[str]]:
+    """Returns `(image_paths, embeddings, keys)` for the `{"image_path", "key"}` pages still on disk and in the store."""
+    pages = [page for page in pages if os.path.exists(page["image_path"])]
+    embeddings = store.get_many([page["key"] for page in pages])
+    found = [(page, emb) for page, emb in zip(pages, embeddings) if emb is not None]
+    if not found:
+        return [], None, []
+    return ([page["image_path"] for page, _ in found], np.vstack([emb for _, emb in found]),
+            [page["key"] for page, _ in found])
+
+
+def select_new_paths(paths: list[str], current_paths: set[str], removed_paths: set[str],
+                     readded: bool = False) -> list[int]:
+    """Indices of the `paths` to add to a session collection, adding them to `current_paths`.
+
+    Paths already in the collection are skipped, and so are paths the user
+    removed: Streamlit keeps a file in its uploader across reruns, so the
+    upload loop would otherwise bring a removed image straight back. Pass
+    `readded=True` when the user explicitly adds the file again; its paths are
+    then cleared from `removed_paths`.
+    """
+    if readded:
+        removed_paths.difference_update(paths)
+    selected = []
+    for i, path in enumerate(paths):
+        if path not in current_paths and path not in removed_paths:
+            current_paths.add(path)
+            selected.append(i)
+    return selected
+
+
+class CorpusIndex:
+    """Journal of indexed source files, written by `indexer.py` and loaded by the app.
+
+    Each source file (PDF or image) maps to its size and modification time at
+    indexing time plus the page images it produced, each with the embedding
+    store key holding its vector. Entries are only written once a file is fully
+    embedded, and the journal is replaced atomically, so an interrupted run
+    never leaves a half-indexed file marked as done.
+    """
+
+    def __init__(self, path: str = CORPUS_INDEX_FILE):
+        self.path = path
+        self.files: dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            if manifest.get("model") == EMBED_MODEL:
+                self.files = manifest["files"]
+
+    def __len__(self) -> int:
+        return sum(len(entry["pages"]) for entry in self.files.values())
+
+    @staticmethod
+    def _signature(file_path: str) -> dict:
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def is_current(self, file_path: str) -> bool:
+        """True if `file_path` was fully indexed and has not changed since."""
+        entry = self.files.get(os.path.abspath(file_path))
+        return entry is not None and {k: entry[k] for k in ("size", "mtime_ns")} == self._signature(file_path)
+
+    def record(self, file_path: str, pages: list[dict], save: bool = True) -> None:
+        """Marks a file as indexed; `pages` holds one `{"image_path", "key"}` dict per page."""
+        self.files[os.path.abspath(file_path)] = {**self._signature(file_path), "pages": pages}
+        if save:
+            self.save()
+
+    def save(self) -> None:
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"model": EMBED_MODEL, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+    def load(self, store: EmbeddingStore) -> tuple[list[str], np.ndarray | None, list[str]]:
+        """Returns `(image_paths, embeddings, keys)` for every indexed page still on disk and in the store."""
+        return load_pages([page for entry in self.files.values() for page in entry["pages"]], store)
+
+
+class UploadIndex:
+    """Uploaded files by content digest, so identical bytes are never rendered or embedded twice.
+
+    Each digest maps to the uploaded file name and the pages it produced (one
+    page for an image), each with the embedding store key holding its vector.
+    A PDF with pages that failed to embed is recorded with the pages that
+    succeeded plus the numbers of the failed ones, so only those are retried.
+    The file name plays no part in matching: the same content under another
+    name is recognized, and different content under the same name is not. One
+    instance is shared by every session; the JSON file is replaced atomically.
+    """
+
+    def __init__(self, path: str = UPLOAD_INDEX_FILE):
+        self.path = path
+        self.uploads: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            if manifest.get("model") == EMBED_MODEL:
+                self.uploads = manifest["uploads"]
+
+    def __contains__(self, digest: str) -> bool:
+        return digest in self.uploads
+
+    def pages(self, digest: str) -> list[dict]:
+        """The `{"image_path", "key"}` pages recorded for an upload, empty if it is unknown."""
+        entry = self.uploads.get(digest)
+        return entry["pages"] if entry else []
+
+    def image_paths(self, digest: str) -> list[str]:
+        return [page["image_path"] for page in self.pages(digest)]
+
+    def failed_pages(self, digest: str) -> list[int]:
+        """1-based numbers of the pages of a known upload that still have no embedding."""
+        entry = self.uploads.get(digest)
+        return entry.get("failed_pages", []) if entry else []
+
+    def load(self, digest: str, store: EmbeddingStore) -> tuple[list[str], np.ndarray | None, list[str]] | None:
+        """Returns `(image_paths, embeddings, keys)` for a known upload, or None if it must be ingested (again)."""
+        entry = self.uploads.get(digest)
+        if entry is None:
+            return None
+        paths, embeddings, keys = load_pages(entry["pages"], store)
+        if len(paths) != len(entry["pages"]):
+            return None # Page images or vectors went missing since
+        return paths, embeddings, keys
+
+    def record(self, digest: str, name: str, pages: list[dict], failed_pages: list[int] | None = None) -> None:
+        """Records an ingested upload; `pages` holds one `{"image_path", "key"}` dict per embedded page.
+
+        `failed_pages` are the 1-based numbers of pages that could not be embedded yet.
+        """
+        with self._lock:
+            self.uploads[digest] = {"name": name, "pages": pages}
+            if failed_pages:
+                self.uploads[digest]["failed_pages"] = sorted(failed_pages)
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"model": EMBED_MODEL, "uploads": self.uploads}, f)
+            os.replace(tmp_path, self.path)
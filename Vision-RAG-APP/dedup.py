@@ -0,0 +1,83 @@
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from vector_index import EmbeddingBuffer
+
+HASH_SIZE = 16  # dHash grid: 16x16 = 256 bits
+DETAIL_SCALE = 4  # Confirmation image: grayscale at 1/4 of the page size, one pixel per 4x4 block
+
+
+def page_fingerprint(pil_image: Image.Image) -> tuple[bytes, tuple[int, int, bytes]]:
+    """Returns `(dhash, detail)` for an image.
+
+    The dHash is a 256-bit perceptual hash (horizontal brightness gradients on
+    a 17x16 grayscale grid), robust to re-rendering and compression noise. The
+    detail is the grayscale image with each 4x4 block averaged, as
+    `(height, width, zlib bytes)`. At that resolution a changed digit or word
+    still moves block means by well over 64 levels, while JPEG or resampling
+    noise averages out below 10, so a hash match can be confirmed without
+    merging pages whose text differs.
+    """
+    gray = pil_image.convert("L")
+    grid = np.asarray(gray.resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.int16)
+    dhash = np.packbits(grid[:, 1:] > grid[:, :-1]).tobytes()
+    size = (max(gray.width // DETAIL_SCALE, 1), max(gray.height // DETAIL_SCALE, 1))
+    detail = gray.resize(size, Image.BOX)
+    return dhash, (detail.height, detail.width, zlib.compress(detail.tobytes(), 1))
+
+
+class DuplicateDetector:
+    """Finds exact and near-duplicate images among those already registered.
+
+    A candidate is a duplicate of a registered image when their dHashes differ
+    in at most `max_hash_distance` bits, both have the same size, and no 4x4
+    block mean differs by more than `max_pixel_diff` (0-255). The block check
+    runs at a resolution where glyphs are still visible: pages that differ
+    only in a number or a few words are kept apart, while re-rendering and
+    compression noise is not. Each registered image carries a key (the
+    embedding store key), so a duplicate can reuse the embedding stored under
+    its original's key. Register an image only once that embedding exists.
+    """
+
+    def __init__(self, max_hash_distance: int = 6, max_pixel_diff: int = 32):
+        self.max_hash_distance = max_hash_distance
+        self.max_pixel_diff = max_pixel_diff
+        self._hashes = EmbeddingBuffer((HASH_SIZE * HASH_SIZE // 8,), np.uint8)
+        self._details: list[tuple[int, int, bytes]] = []  # Compressed; only hash matches are decompressed
+        self._keys: list[str] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def match(self, fingerprint: tuple[bytes, tuple[int, int, bytes]]) -> str | None:
+        """Returns the key of the closest registered duplicate, or None."""
+        dhash, (height, width, detail) = fingerprint
+        pixels = None
+        with self._lock:
+            if not self._keys:
+                return None
+            distances = np.unpackbits(self._hashes.data ^ np.frombuffer(dhash, dtype=np.uint8), axis=1).sum(axis=1)
+            for row in np.argsort(distances, kind="stable"):
+                if distances[row] > self.max_hash_distance:
+                    break
+                other_height, other_width, other_detail = self._details[row]
+                if (other_height, other_width) != (height, width):
+                    continue # Rendered at another size: not comparable block for block
+                if pixels is None:
+                    pixels = np.frombuffer(zlib.decompress(detail), dtype=np.uint8).astype(np.int16)
+                diff = np.abs(np.frombuffer(zlib.decompress(other_detail), dtype=np.uint8) - pixels).max()
+                if diff <= self.max_pixel_diff:
+                    return self._keys[row]
+        return None
+
+    def add(self, fingerprint: tuple[bytes, tuple[int, int, bytes]], key: str) -> None:
+        """Registers an image whose embedding is stored under `key`."""
+        dhash, detail = fingerprint
+        with self._lock:
+            self._hashes.append(np.frombuffer(dhash, dtype=np.uint8))
+            self._details.append(detail)
+            self._keys.append(key)
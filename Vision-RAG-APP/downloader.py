@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+@dataclass
+class DownloadResult:
+    path: str
+    status: str  # "downloaded", "not_modified", "stale" (revalidation failed, local copy kept) or "failed"
+    error: Exception | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status != "failed"
+
+
+class Downloader:
+    """Concurrent file downloader over one pooled `requests.Session`.
+
+    - Connections are pooled and reused across downloads (and across sessions
+      when the instance is shared).
+    - At most `max_workers` downloads run at once, and at most `per_host_limit`
+      of them against the same host.
+    - Bodies are streamed to a temporary file and moved into place, so a broken
+      transfer never leaves a truncated file behind.
+    - Existing files are revalidated with the `ETag` / `Last-Modified` values
+      saved next to them (`<file>.meta.json`); a 304 keeps the local copy.
+    """
+
+    def __init__(self, max_workers: int = 8, per_host_limit: int = 4,
+                 timeout: tuple[float, float] = (5.0, 30.0), chunk_size: int = 64 * 1024,
+                 retries: int = 2, session: requests.Session | None = None):
+        self.max_workers = max_workers
+        self.per_host_limit = per_host_limit
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.session = session or self._make_session(retries)
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._host_slots_lock = threading.Lock()
+
+    def _make_session(self, retries: int) -> requests.Session:
+        session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def _host_slot(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._host_slots_lock:
+            if host not in self._host_slots:
+                self._host_slots[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._host_slots[host]
+
+    @staticmethod
+    def _meta_path(path: str) -> str:
+        return path + ".meta.json"
+
+    def _read_meta(self, path: str) -> dict:
+        try:
+            with open(self._meta_path(path)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def fetch(self, url: str, path: str) -> DownloadResult:
+        """Downloads `url` to `path`, or confirms the local copy is still current."""
+        headers = {}
+        meta = self._read_meta(path) if os.path.exists(path) else {}
+        if meta.get("url") == url:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        tmp_path = f"{path}.part-{threading.get_ident()}"
+        try:
+            with self._host_slot(url):
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 304 and headers:
+                        return DownloadResult(path, "not_modified")
+                    response.raise_for_status()
+                    with open(tmp_path, "wb") as f:
+                        for chunk in response.iter_content(chunk_size=self.chunk_size):
+                            f.write(chunk)
+                    os.replace(tmp_path, path)
+                    new_meta = {"url": url, "etag": response.headers.get("ETag"),
+                                "last_modified": response.headers.get("Last-Modified")}
+            with open(self._meta_path(path), "w") as f:
+                json.dump(new_meta, f)
+            return DownloadResult(path, "downloaded")
+        except (requests.exceptions.RequestException, OSError) as e:
+            # An unreachable server or a failed write should not throw away a copy we already have
+            return DownloadResult(path, "stale" if os.path.isfile(path) else "failed", e)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def fetch_all(self, files: dict[str, str], folder: str) -> dict[str, DownloadResult]:
+        """Downloads `{file name: url}` into `folder` concurrently; returns results by file name.
+
+        Errors are reported per file in its `DownloadResult`; one failure never aborts the others.
+        """
+        os.makedirs(folder, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {name: pool.submit(self.fetch, url, os.path.join(folder, name)) for name, url in files.items()}
+            results = {}
+            for name, future in futures.items():
+                try:
+                    results[name] = future.result()
+                except Exception as e:
+                    path = os.path.join(folder, name)
+                    results[name] = DownloadResult(path, "stale" if os.path.isfile(path) else "failed", e)
+            return results
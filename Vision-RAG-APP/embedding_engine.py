@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable
+
+import numpy as np
+
+EMBED_MODEL = "embed-v4.0"
+# HTTP statuses that mean "slow down and try again" rather than "this request is broken"
+THROTTLE_STATUS_CODES = {429, 503}
+
+
+def is_throttled(error: Exception) -> bool:
+    """Returns True if the error is a rate-limit / overload response worth retrying."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code in THROTTLE_STATUS_CODES or "TooManyRequests" in type(error).__name__
+
+
+class BatchEmbedder:
+    """Embeds many images with a bounded number of concurrent multi-image `embed` calls.
+
+    Images are grouped into batches of `batch_size`. Each batch is sent as one
+    `embed` request (one `inputs` entry per image, so every image gets its own
+    vector) and at most `max_in_flight` batches are waiting on the network at
+    any time. Throttled batches are retried with exponential backoff and jitter.
+
+    The client only needs an `embed(**kwargs)` method returning an object with
+    `.embeddings.float`, so a local fake client can stand in for Cohere.
+    """
+
+    def __init__(self, client, batch_size: int = 8, max_in_flight: int = 4,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 30.0,
+                 model: str = EMBED_MODEL, input_type: str = "search_document",
+                 sleep: Callable[[float], None] = time.sleep):
+        if batch_size < 1 or max_in_flight < 1:
+            raise ValueError("batch_size and max_in_flight must be at least 1")
+        self.client = client
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.model = model
+        self.input_type = input_type
+        self.sleep = sleep
+        self.errors: list[tuple[int, Exception]] = []
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+
+    def embed_images(self, images: list[str],
+                     on_progress: Callable[[int, int], None] | None = None) -> list[np.ndarray | None]:
+        """Embeds base64 data-URI images, keeping the output aligned with the input.
+
+        Args:
+            images: base64 encoded images (data URIs), in page order.
+            on_progress: optional callback `(done, total)` invoked from the calling
+                thread each time a batch finishes, so it is safe to update Streamlit.
+
+        Returns:
+            A list with one embedding per input image, in input order. Entries are
+            None for images whose batch failed after all retries; the failures are
+            recorded in `self.errors` as `(batch_start_index, exception)`.
+        """
+        total = len(images)
+        results: list[np.ndarray | None] = [None] * total
+        self.errors = []
+        if total == 0:
+            return results
+
+        done = 0
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {
+                pool.submit(self.embed_batch, images[start:start + self.batch_size]): start
+                for start in range(0, total, self.batch_size)
+            }
+            for future in as_completed(futures):
+                start = futures[future]
+                batch_len = min(self.batch_size, total - start)
+                try:
+                    results[start:start + batch_len] = future.result()
+                except Exception as e:
+                    self.errors.append((start, e))
+                done += batch_len
+                if on_progress:
+                    on_progress(done, total)
+
+        return results
+
+    def embed_batch(self, batch: list[str]) -> list[np.ndarray]:
+        """Sends one batch, retrying throttled responses with capped exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._request(batch)
+            except Exception as e:
+                if attempt == self.max_retries or not is_throttled(e):
+                    raise
+                with self._retries_lock:  # Batches retry from several pool threads
+                    self.retries += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                self.sleep(delay * random.uniform(0.5, 1.0))
+        raise RuntimeError("unreachable")
+
+    def _request(self, batch: list[str]) -> list[np.ndarray]:
+        api_response = self.client.embed(
+            model=self.model,
+            input_type=self.input_type,
+            embedding_types=["float"],
+            inputs=[{"content": [{"type": "image_url", "image_url": {"url": img}}]} for img in batch],
+        )
+        vectors = api_response.embeddings.float if api_response.embeddings else None
+        if not vectors or len(vectors) != len(batch):
+            raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors) if vectors else 0}.")
+        return [np.asarray(v) for v in vectors]
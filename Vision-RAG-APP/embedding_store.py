@@ -0,0 +1,147 @@
+import hashlib
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError: # Windows: appends are only serialized within one process
+    fcntl = None
+
+import numpy as np
+
+from embedding_engine import EMBED_MODEL
+
+MANIFEST_FILE = "manifest.json"
+MATRIX_FILE = "embeddings.f32"
+LOCK_FILE = "store.lock"
+
+
+def content_key(data: bytes | memoryview, model: str = EMBED_MODEL) -> str:
+    """Returns the store key for a page's pixels or an image file's bytes."""
+    digest = hashlib.sha256(model.encode("utf-8") + b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class EmbeddingStore:
+    """Persistent, content-addressed embedding store shared by all sessions.
+
+    Layout on disk:
+      - `embeddings.f32`: a flat float32 matrix, one row per stored image.
+      - `manifest.json`: the embedding dimension plus one entry per row with the
+        content key, source file, page number and image path.
+
+    The matrix is opened read-only through `np.memmap`, so lookups only page in
+    the rows they touch. Rows are appended to the file and then published by
+    atomically replacing the manifest; rows past the manifest count are ignored,
+    which keeps a half-written append from corrupting the store. Appends hold
+    an exclusive `flock` on `store.lock`, so the app and `indexer.py` can add
+    to the same store at the same time.
+    """
+
+    def __init__(self, root: str = "embedding_store"):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_FILE)
+        self.matrix_path = os.path.join(root, MATRIX_FILE)
+        self.lock_path = os.path.join(root, LOCK_FILE)
+        self._lock = threading.Lock()
+        self._manifest_mtime = None
+        self._matrix = None
+        self.dim = None
+        self.rows: list[dict] = []
+        self.key_to_row: dict[str, int] = {}
+        os.makedirs(root, exist_ok=True)
+        self._reload()
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(self, key: str) -> bool:
+        self._refresh()
+        return key in self.key_to_row
+
+    def get(self, key: str) -> np.ndarray | None:
+        """Returns the stored embedding for `key` (a read-only view into the mmap), or None."""
+        self._refresh()
+        row = self.key_to_row.get(key)
+        if row is None:
+            return None
+        return self._matrix[row]
+
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        """Looks up several keys at once; missing keys map to None."""
+        self._refresh()
+        return [self._matrix[self.key_to_row[k]] if k in self.key_to_row else None for k in keys]
+
+    def add_many(self, entries: list[tuple[str, np.ndarray, dict]]) -> None:
+        """Appends `(key, embedding, metadata)` entries, skipping keys already stored.
+
+        `metadata` should hold `source`, `page` and `image_path`.
+        """
+        with self._lock, self._process_lock():
+            self._reload() # Another process may have appended since our last look, even within one mtime tick
+            new_entries = []
+            seen = set(self.key_to_row)
+            for key, emb, meta in entries:
+                if key in seen or emb is None:
+                    continue
+                seen.add(key)
+                new_entries.append((key, np.asarray(emb, dtype=np.float32).ravel(), meta))
+            if not new_entries:
+                return
+
+            dim = self.dim or new_entries[0][1].shape[0]
+            for key, emb, _ in new_entries:
+                if emb.shape[0] != dim:
+                    raise ValueError(f"Embedding for {key} has dimension {emb.shape[0]}, store expects {dim}.")
+
+            # Append after the last published row, dropping any unpublished tail
+            with open(self.matrix_path, "ab") as f:
+                f.truncate(len(self.rows) * dim * 4)
+                f.seek(0, os.SEEK_END)
+                f.write(np.vstack([emb for _, emb, _ in new_entries]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+            rows = self.rows + [{"key": key, **meta} for key, _, meta in new_entries]
+            tmp_path = f"{self.manifest_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"model": EMBED_MODEL, "dim": dim, "rows": rows}, f)
+            os.replace(tmp_path, self.manifest_path)
+            self._reload()
+
+    @contextmanager
+    def _process_lock(self):
+        with open(self.lock_path, "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX) # Released when the file is closed
+            yield
+
+    def add(self, key: str, embedding: np.ndarray, source: str, page: int | None, image_path: str) -> None:
+        """Stores a single embedding."""
+        self.add_many([(key, embedding, {"source": source, "page": page, "image_path": image_path})])
+
+    def _refresh(self) -> None:
+        """Reloads the manifest if another session or process has published new rows."""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._manifest_mtime:
+            with self._lock:
+                self._reload()
+
+    def _reload(self) -> None:
+        if not os.path.exists(self.manifest_path):
+            self._manifest_mtime = None
+            return
+        self._manifest_mtime = os.path.getmtime(self.manifest_path)
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        self.dim = manifest["dim"]
+        self.rows = manifest["rows"]
+        self.key_to_row = {row["key"]: i for i, row in enumerate(self.rows)}
+        self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r",
+                                 shape=(len(self.rows), self.dim)) if self.rows else None
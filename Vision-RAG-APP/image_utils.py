@@ -0,0 +1,77 @@
+import base64
+import io
+
+import PIL
+from PIL import Image
+
+# Some helper functions to resize images and to convert them to base64 format
+max_pixels = 1568*1568  #Max resolution for images
+
+# Resize too large images
+def resize_image(pil_image: PIL.Image.Image) -> None:
+    """Resizes the image in-place if it exceeds max_pixels."""
+    org_width, org_height = pil_image.size
+
+    # Resize image if too large
+    if org_width * org_height > max_pixels:
+        scale_factor = (max_pixels / (org_width * org_height)) ** 0.5
+        new_width = int(org_width * scale_factor)
+        new_height = int(org_height * scale_factor)
+        pil_image.thumbnail((new_width, new_height))
+
+# Formats the API accepts as page payloads, with the file extension used on disk
+payload_formats = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}
+
+def render_zoom(page_width: float, page_height: float, dpi: int = 150) -> float:
+    """Returns the PyMuPDF zoom that renders a page at `dpi`, capped so it fits under max_pixels.
+
+    Page sizes are in PDF points (1/72 inch). Rendering straight to the target
+    size avoids rasterizing a large pixmap only to downscale it afterwards.
+    """
+    zoom = dpi / 72
+    rendered_pixels = (page_width * zoom) * (page_height * zoom)
+    if rendered_pixels > max_pixels:
+        zoom *= (max_pixels / rendered_pixels) ** 0.5
+    return zoom
+
+def encode_image(pil_image: PIL.Image.Image, img_format: str = "PNG", quality: int = 85) -> bytes:
+    """Encodes a PIL image once; the bytes serve both the on-disk copy and the API payload."""
+    save_kwargs = {} if img_format == "PNG" else {"quality": quality}
+    if img_format == "JPEG" and pil_image.mode not in ("RGB", "L"):
+        pil_image = pil_image.convert("RGB")
+    with io.BytesIO() as img_buffer:
+        pil_image.save(img_buffer, format=img_format, **save_kwargs)
+        return img_buffer.getvalue()
+
+def bytes_to_base64(img_bytes: bytes, img_format: str) -> str:
+    """Wraps already-encoded image bytes in a base64 data URI."""
+    return f"data:image/{img_format.lower()};base64,"+base64.b64encode(img_bytes).decode("utf-8")
+
+def base64_from_bytes(img_bytes: bytes) -> str:
+    """Converts encoded image bytes to a base64 data URI, re-encoding only if the image is too large."""
+    pil_image = PIL.Image.open(io.BytesIO(img_bytes)) # Lazy: only the header is decoded here
+    img_format = pil_image.format if pil_image.format else "PNG"
+    width, height = pil_image.size
+    if width * height <= max_pixels:
+        return bytes_to_base64(img_bytes, img_format)
+
+    resize_image(pil_image)
+    return bytes_to_base64(encode_image(pil_image, img_format), img_format)
+
+# Convert images to a base64 string before sending it to the API
+def base64_from_image(img_path: str) -> str:
+    """Converts an image file to a base64 encoded string."""
+    with open(img_path, "rb") as f:
+        return base64_from_bytes(f.read())
+
+# Convert PIL image to base64 string
+def pil_to_base64(pil_image: PIL.Image.Image) -> str:
+    """Converts a PIL image to a base64 encoded string."""
+    if pil_image.format is None:
+        img_format = "PNG"
+    else:
+        img_format = pil_image.format
+    
+    resize_image(pil_image)
+
+    return bytes_to_base64(encode_image(pil_image, img_format), img_format)
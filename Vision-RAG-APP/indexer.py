@@ -0,0 +1,232 @@
+"""Headless indexer: embeds a directory of PDFs and images for the Vision RAG app.
+
+Pages are rendered and embedded with the same pipeline the app uses, vectors
+go to the shared embedding store, and the indexed files are recorded in a
+corpus index that the app loads at startup. Re-running the command resumes:
+files already indexed (and unchanged) are skipped, and pages embedded before
+an interruption are reused from the store.
+
+Usage:
+    COHERE_API_KEY=... python indexer.py DOCS_DIR [--index corpus_index.json] [--workers N]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import cohere
+from PIL import Image
+
+from corpus_index import CORPUS_INDEX_FILE, CorpusIndex
+from dedup import DuplicateDetector, page_fingerprint
+from embedding_engine import BatchEmbedder
+from embedding_store import EmbeddingStore, content_key
+from image_utils import base64_from_bytes
+from render_pipeline import PdfIngestPipeline
+from thumbnails import ThumbnailCache
+
+PDF_EXTENSIONS = (".pdf",)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+def find_documents(root: str) -> list[str]:
+    """PDFs and images under `root`, in a stable order."""
+    found = []
+    for folder, _, names in os.walk(root):
+        for name in names:
+            if name.lower().endswith(PDF_EXTENSIONS + IMAGE_EXTENSIONS):
+                found.append(os.path.join(folder, name))
+    return sorted(found)
+
+
+def pages_folder(pdf_path: str, pages_dir: str, taken: set[str]) -> str:
+    """Folder for a PDF's page images, named like the app's (`pages_dir/<stem>`) but never shared."""
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    folder = os.path.join(pages_dir, stem)
+    suffix = 2
+    while folder in taken:
+        folder = os.path.join(pages_dir, f"{stem}_{suffix}")
+        suffix += 1
+    taken.add(folder)
+    return folder
+
+
+class Indexer:
+    """Indexes documents one file at a time, recording each in the corpus index once it is fully embedded."""
+
+    def __init__(self, embedder: BatchEmbedder, store: EmbeddingStore, corpus: CorpusIndex,
+                 pages_dir: str = "pdf_pages", workers: int = 2, memory_budget_mb: int = 512,
+                 img_format: str = "PNG", checkpoint_pages: int = 64, thumbnails: ThumbnailCache | None = None):
+        self.embedder = embedder
+        self.store = store
+        self.corpus = corpus
+        self.pages_dir = pages_dir
+        self.workers = workers
+        self.memory_budget_mb = memory_budget_mb
+        self.img_format = img_format
+        self.checkpoint_pages = checkpoint_pages
+        self.thumbnails = thumbnails
+        self.detector = DuplicateDetector()
+        # (pages, wall seconds) per stage, summed over files
+        self.render = [0, 0.0]
+        self.embed = [0, 0.0]
+        self.pages = self.reused = self.deduplicated = self.failed_pages = 0
+        self.skipped_files = self.indexed_files = self.failed_files = 0
+        self._folders = {os.path.dirname(page["image_path"])
+                         for entry in corpus.files.values() for page in entry["pages"]}
+
+    def index_pdf(self, pdf_path: str) -> None:
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+        previous = self.corpus.files.get(os.path.abspath(pdf_path))
+        # A changed file keeps its folder; a new one gets a fresh folder
+        folder = (os.path.dirname(previous["pages"][0]["image_path"]) if previous and previous["pages"]
+                  else pages_folder(pdf_path, self.pages_dir, self._folders))
+        pipeline = PdfIngestPipeline(
+            pdf_bytes, folder, embedder=self.embedder, store=self.store, workers=self.workers,
+            memory_budget_mb=self.memory_budget_mb, source=os.path.basename(pdf_path),
+            img_format=self.img_format, detector=self.detector, checkpoint_pages=self.checkpoint_pages,
+            thumbnails=self.thumbnails,
+        )
+        result = pipeline.run()
+        self.render[0] += result.render.items
+        self.render[1] += result.render.wall_seconds
+        self.embed[0] += result.embed.items
+        self.embed[1] += result.embed.wall_seconds
+        self.pages += len(result.image_paths)
+        self.reused += result.reused
+        self.deduplicated += result.deduplicated
+        for failed_pages, error in result.errors:
+            print(f"  {pdf_path}: pages {failed_pages} failed: {error}", file=sys.stderr)
+            self.failed_pages += len(failed_pages)
+        if result.errors:
+            raise RuntimeError("some pages could not be embedded; rerun to retry them")
+        self.corpus.record(pdf_path, [{"image_path": path, "key": key}
+                                      for path, key in zip(result.image_paths, result.keys)])
+
+    def index_images(self, image_paths: list[str]) -> None:
+        """Embeds standalone images, skipping stored and near-duplicate content.
+
+        Images are read in chunks of `batch_size * max_in_flight`, so every
+        chunk keeps all embed requests in flight while memory stays bounded.
+        """
+        chunk_size = self.embedder.batch_size * self.embedder.max_in_flight
+        for start in range(0, len(image_paths), chunk_size):
+            to_embed = []
+            for path in image_paths[start:start + chunk_size]:
+                with open(path, "rb") as f:
+                    img_bytes = f.read()
+                key = content_key(img_bytes)
+                self.pages += 1
+                if self.thumbnails is not None:
+                    self.thumbnails.add_bytes(key, img_bytes)
+                if key not in self.store:
+                    fingerprint = page_fingerprint(Image.open(io.BytesIO(img_bytes)))
+                    duplicate_key = self.detector.match(fingerprint)
+                    if duplicate_key is None or duplicate_key not in self.store:
+                        to_embed.append((path, key, fingerprint, base64_from_bytes(img_bytes)))
+                        continue
+                    self.store.add(key, self.store.get(duplicate_key), source=os.path.basename(path),
+                                   page=None, image_path=path)
+                    self.deduplicated += 1
+                else:
+                    self.reused += 1
+                self.indexed_files += 1
+                self.corpus.record(path, [{"image_path": path, "key": key}], save=False)
+
+            if to_embed:
+                started = time.perf_counter()
+                vectors = self.embedder.embed_images([b64 for *_, b64 in to_embed])
+                embedded = [(item, emb) for item, emb in zip(to_embed, vectors) if emb is not None]
+                self.embed[0] += len(embedded)
+                self.embed[1] += time.perf_counter() - started
+                for _, error in self.embedder.errors:
+                    print(f"  image batch failed: {error}", file=sys.stderr)
+                self.failed_pages += len(to_embed) - len(embedded)
+                self.failed_files += len(to_embed) - len(embedded)
+                self.store.add_many([(key, emb, {"source": os.path.basename(path), "page": None, "image_path": path})
+                                     for (path, key, _, _), emb in embedded])
+                for (path, key, fingerprint, _), _ in embedded:
+                    self.detector.add(fingerprint, key)
+                    self.corpus.record(path, [{"image_path": path, "key": key}], save=False)
+                self.indexed_files += len(embedded)
+            self.corpus.save()
+
+    def run(self, documents: list[str]) -> None:
+        pending = []
+        for path in documents:
+            if self.corpus.is_current(path):
+                self.skipped_files += 1
+            else:
+                pending.append(path)
+        pdfs = [p for p in pending if p.lower().endswith(PDF_EXTENSIONS)]
+        images = [p for p in pending if p.lower().endswith(IMAGE_EXTENSIONS)]
+
+        for i, pdf_path in enumerate(pdfs, 1):
+            print(f"[{i}/{len(pdfs)}] {pdf_path}")
+            try:
+                self.index_pdf(pdf_path)
+                self.indexed_files += 1
+            except Exception as e:
+                print(f"  skipped: {e}", file=sys.stderr)
+                self.failed_files += 1
+        if images:
+            print(f"Embedding {len(images)} images")
+            self.index_images(images)
+
+    @staticmethod
+    def _rate(stage: list) -> str:
+        pages, seconds = stage
+        return f"{pages} pages in {seconds:.1f}s ({pages / seconds if seconds else 0:.1f} pages/s)"
+
+    def report(self, total_seconds: float) -> str:
+        embedded = self.pages - self.reused - self.deduplicated - self.failed_pages
+        return "\n".join([
+            f"Files: {self.indexed_files} indexed, {self.skipped_files} already up to date, {self.failed_files} failed",
+            f"Pages: {self.pages} processed, {embedded} embedded, {self.reused} reused from the store, "
+            f"{self.deduplicated} duplicates skipped, {self.failed_pages} failed",
+            f"Render: {self._rate(self.render)}",
+            f"Embed:  {self._rate(self.embed)}",
+            f"Total:  {total_seconds:.1f}s, {self.pages / total_seconds if total_seconds else 0:.2f} pages/s",
+            f"Corpus index: {self.corpus.path} ({len(self.corpus)} pages)",
+        ])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("docs_dir", help="directory searched recursively for PDFs and PNG/JPEG images")
+    parser.add_argument("--index", default=CORPUS_INDEX_FILE, help="corpus index the app loads at startup")
+    parser.add_argument("--store", default="embedding_store", help="embedding store shared with the app")
+    parser.add_argument("--pages-dir", default="pdf_pages", help="where rendered page images are written")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="render processes")
+    parser.add_argument("--batch-size", type=int, default=8, help="images per embed request")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="concurrent embed requests")
+    parser.add_argument("--memory-budget-mb", type=int, default=512)
+    parser.add_argument("--format", default="PNG", choices=["PNG", "JPEG", "WEBP"], help="page image format")
+    parser.add_argument("--thumbnails-dir", default="thumbnails", help="gallery thumbnails shared with the app")
+    parser.add_argument("--checkpoint-pages", type=int, default=64,
+                        help="save embeddings to the store every N pages within a PDF")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("COHERE_API_KEY")
+    if not api_key:
+        parser.error("set COHERE_API_KEY")
+    embedder = BatchEmbedder(cohere.ClientV2(api_key=api_key), batch_size=args.batch_size,
+                             max_in_flight=args.max_in_flight)
+    indexer = Indexer(embedder, EmbeddingStore(args.store), CorpusIndex(args.index), pages_dir=args.pages_dir,
+                      workers=args.workers, memory_budget_mb=args.memory_budget_mb, img_format=args.format,
+                      checkpoint_pages=args.checkpoint_pages, thumbnails=ThumbnailCache(args.thumbnails_dir))
+
+    documents = find_documents(args.docs_dir)
+    print(f"Found {len(documents)} documents under {args.docs_dir}")
+    started = time.perf_counter()
+    try:
+        indexer.run(documents)
+    except KeyboardInterrupt:
+        print("\nInterrupted; rerun the same command to resume.", file=sys.stderr)
+    print(indexer.report(time.perf_counter() - started))
+
+
+if __name__ == "__main__":
+    main()
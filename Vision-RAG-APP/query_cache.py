@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Cache key form of a question: case-folded with whitespace collapsed."""
+    return " ".join(question.casefold().split())
+
+
+class EmbeddingCache:
+    """Thread-safe LRU cache of embeddings with a time-to-live.
+
+    Keys are `(model, key)`, where `key` is a cheap content digest or a
+    normalized question. The least recently used entry is evicted once
+    `max_entries` is reached, and entries older than `ttl_seconds` are treated
+    as misses. One instance is meant to be shared by every session in the
+    process; stored arrays are read-only so sessions cannot mutate each other's
+    results.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: OrderedDict[tuple[str, str], tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cache_key(self, key: str, model: str) -> tuple[str, str]:
+        return model, key
+
+    def get(self, key: str, model: str) -> np.ndarray | None:
+        cache_key = self._cache_key(key, model)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and self.clock() - entry[0] <= self.ttl_seconds:
+                self._entries.move_to_end(cache_key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[cache_key] # Expired
+            self.misses += 1
+            return None
+
+    def put(self, key: str, model: str, embedding: np.ndarray) -> np.ndarray:
+        """Caches a read-only copy of `embedding` and returns it; the caller's array is left writable."""
+        cache_key = self._cache_key(key, model)
+        embedding = np.array(embedding)
+        embedding.flags.writeable = False # Shared across sessions: nobody may mutate it
+        with self._lock:
+            self._entries[cache_key] = (self.clock(), embedding)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return embedding
+
+    def discard(self, key: str, model: str) -> bool:
+        """Evicts one entry explicitly; returns whether it was cached."""
+        with self._lock:
+            return self._entries.pop(self._cache_key(key, model), None) is not None
+
+    def get_or_compute(self, key: str, model: str,
+                       compute: Callable[[], np.ndarray | None]) -> np.ndarray | None:
+        """Returns the cached embedding, or calls `compute()` and caches a non-None result."""
+        embedding = self.get(key, model)
+        if embedding is None:
+            embedding = compute()
+            if embedding is not None:
+                embedding = self.put(key, model, embedding)
+        return embedding
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class QueryEmbeddingCache(EmbeddingCache):
+    """Embedding cache for questions: keys are `(model, normalized question)`."""
+
+    def _cache_key(self, question: str, model: str) -> tuple[str, str]:
+        return model, normalize_question(question)
@@ -0,0 +1,317 @@
+import multiprocessing
+import os
+import queue
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+import fitz # PyMuPDF
+import numpy as np
+from PIL import Image
+
+from dedup import DuplicateDetector, page_fingerprint
+from embedding_engine import BatchEmbedder
+from embedding_store import EmbeddingStore, content_key
+from image_utils import bytes_to_base64, encode_image, payload_formats, render_zoom
+from thumbnails import ThumbnailCache
+
+# Per-worker state, set once by _init_worker so the PDF bytes cross the process boundary only once
+_worker_doc = None
+_worker_dpi = 150
+_worker_format = "PNG"
+_worker_quality = 85
+_worker_thumbnails = None
+
+
+def _init_worker(pdf_bytes: bytes, dpi: int, img_format: str, quality: int,
+                 thumbnails: ThumbnailCache | None = None) -> None:
+    global _worker_doc, _worker_dpi, _worker_format, _worker_quality, _worker_thumbnails
+    _worker_doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    _worker_dpi = dpi
+    _worker_format = img_format
+    _worker_quality = quality
+    _worker_thumbnails = thumbnails
+
+
+def _render_page(page_index: int, page_img_path: str) -> tuple[int, str, tuple[bytes, bytes], str, str | None, dict]:
+    """Renders one page in a worker process: rasterize, encode once, save, hash pixels.
+
+    The pixmap is rendered directly at a size under `max_pixels` and encoded a
+    single time; the same bytes are written to disk and sent to the API. The
+    gallery thumbnail is made from the same decoded pixels.
+
+    Returns `(page_index, content_key, fingerprint, base64_image, thumbnail_path, timings)`,
+    where `timings` holds the seconds spent rasterizing, encoding (image and
+    base64) and in total.
+    """
+    started = time.perf_counter()
+    page = _worker_doc[page_index]
+    zoom = render_zoom(page.rect.width, page.rect.height, _worker_dpi)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+    pil_image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    rasterized = time.perf_counter()
+    img_bytes = encode_image(pil_image, _worker_format, _worker_quality)
+    base64_img = bytes_to_base64(img_bytes, _worker_format)
+    encoded = time.perf_counter()
+    with open(page_img_path, "wb") as f:
+        f.write(img_bytes)
+    page_key = content_key(pix.samples)
+    fingerprint = page_fingerprint(pil_image)
+    thumbnail_path = _worker_thumbnails.add(page_key, pil_image) if _worker_thumbnails is not None else None
+    timings = {"rasterize": rasterized - started, "encode": encoded - rasterized,
+               "total": time.perf_counter() - started}
+    return page_index, page_key, fingerprint, base64_img, thumbnail_path, timings
+
+
+@dataclass
+class StageStats:
+    """Throughput of one pipeline stage."""
+    items: int = 0
+    busy_seconds: float = 0.0
+    first_start: float | None = None
+    last_end: float | None = None
+
+    def record(self, items: int, seconds: float) -> None:
+        now = time.perf_counter()
+        self.items += items
+        self.busy_seconds += seconds
+        if self.first_start is None:
+            self.first_start = now - seconds
+        self.last_end = now
+
+    @property
+    def wall_seconds(self) -> float:
+        if self.first_start is None:
+            return 0.0
+        return self.last_end - self.first_start
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def summary(self) -> str:
+        return f"{self.items} pages in {self.wall_seconds:.2f}s ({self.items_per_second:.1f} pages/s)"
+
+
+@dataclass
+class PipelineResult:
+    image_paths: list[str]
+    embeddings: list[np.ndarray | None]
+    keys: list[str | None]
+    thumbnails: list[str | None] = field(default_factory=list)
+    # (stage, seconds) samples: "rasterize" and "encode" per page, "embed_batch" per request
+    timings: list[tuple[str, float]] = field(default_factory=list)
+    errors: list[tuple[list[int], Exception]] = field(default_factory=list)
+    render: StageStats = field(default_factory=StageStats)
+    embed: StageStats = field(default_factory=StageStats)
+    reused: int = 0
+    deduplicated: int = 0
+    total_seconds: float = 0.0
+
+
+class PdfIngestPipeline:
+    """Producer/consumer PDF ingestion: a process pool renders, a queue feeds the embedder.
+
+    Worker processes rasterize pages from the same PDF bytes while embed
+    batches for earlier pages are already on the network, so CPU rendering
+    overlaps network I/O. The number of rendered-but-not-yet-embedded pages is
+    capped by `memory_budget_mb`, using the raw pixel size of the largest page
+    as the per-page estimate, so a long PDF never sits fully in memory.
+
+    With a `detector`, exact and near-duplicate pages (repeated title slides,
+    headers, blank pages) are not embedded again: they reuse the vector of the
+    page they duplicate, once that one is embedded.
+
+    With `thumbnails`, each render worker also writes the page's gallery
+    thumbnail while it still holds the decoded pixels.
+
+    With `pages` (0-based indices), only those pages are rendered and embedded,
+    e.g. to retry the pages that failed in an earlier run; the result still
+    has one slot per page of the PDF.
+
+    With a `store`, embeddings are written to it at the end of the run, and
+    additionally every `checkpoint_pages` newly embedded pages when set, so an
+    interrupted run over a long PDF can resume without re-embedding them.
+
+    Coordination happens on the calling thread, which is the only thread that
+    invokes `on_progress`, so the callback may safely update Streamlit widgets.
+    """
+
+    def __init__(self, pdf_bytes: bytes, output_folder: str, embedder: BatchEmbedder,
+                 store: EmbeddingStore | None = None, workers: int = 2,
+                 memory_budget_mb: int = 512, dpi: int = 150, source: str | None = None,
+                 img_format: str = "PNG", quality: int = 85, detector: DuplicateDetector | None = None,
+                 checkpoint_pages: int | None = None, thumbnails: ThumbnailCache | None = None,
+                 pages: list[int] | None = None):
+        if img_format not in payload_formats:
+            raise ValueError(f"Unsupported page image format {img_format!r}; use one of {list(payload_formats)}.")
+        self.pdf_bytes = pdf_bytes
+        self.source = source or os.path.basename(output_folder)
+        self.output_folder = output_folder
+        self.embedder = embedder
+        self.store = store
+        self.workers = max(1, workers)
+        self.memory_budget_mb = memory_budget_mb
+        self.dpi = dpi
+        self.img_format = img_format
+        self.quality = quality
+        self.detector = detector
+        self.checkpoint_pages = checkpoint_pages
+        self.thumbnails = thumbnails
+        self.pages = pages
+
+    def _save(self, result: PipelineResult, pages) -> None:
+        """Writes the embedded pages among `pages` (indices) to the store."""
+        self.store.add_many([
+            (result.keys[i], result.embeddings[i], {"source": self.source, "page": i + 1,
+                                                    "image_path": result.image_paths[i]})
+            for i in pages if result.embeddings[i] is not None
+        ])
+
+    def _max_pages_in_memory(self, doc) -> int:
+        largest_page = max((p.rect.width * p.rect.height) * render_zoom(p.rect.width, p.rect.height, self.dpi) ** 2 * 3
+                           for p in doc)
+        budget_pages = int(self.memory_budget_mb * 1024 * 1024 // max(largest_page, 1))
+        # Keep at least one embed batch buildable, otherwise the pipeline would stall
+        return max(budget_pages, self.embedder.batch_size, 1)
+
+    def run(self, on_progress: Callable[[str, int, int], None] | None = None) -> PipelineResult:
+        """Renders and embeds every page; `on_progress(stage, done, total)` reports progress."""
+        started = time.perf_counter()
+        with fitz.open(stream=self.pdf_bytes, filetype="pdf") as doc:
+            num_pages = len(doc)
+            max_in_memory = self._max_pages_in_memory(doc) if num_pages else 1
+        os.makedirs(self.output_folder, exist_ok=True)
+
+        result = PipelineResult(
+            image_paths=[os.path.join(self.output_folder, f"page_{i + 1}.{payload_formats[self.img_format]}") for i in range(num_pages)],
+            embeddings=[None] * num_pages,
+            keys=[None] * num_pages,
+            thumbnails=[None] * num_pages,
+        )
+        todo = sorted({i for i in self.pages if 0 <= i < num_pages}) if self.pages is not None else list(range(num_pages))
+        total = len(todo)
+        if total == 0:
+            return result
+
+        # Render completions and embed completions both land on this queue
+        events: queue.Queue = queue.Queue()
+        batch_size = self.embedder.batch_size
+        next_page = 0
+        in_memory = 0
+        rendered = embedded = 0
+        pending_batch: list[tuple[int, str]] = []
+        # Pages queued for embedding by content key, duplicate pages waiting on them,
+        # and vectors already embedded during this run
+        queued_keys: dict[str, int] = {}
+        waiting_duplicates: dict[int, list[int]] = {}
+        embedded_by_key: dict[str, np.ndarray] = {}
+        # Queued pages are matched here; they join `self.detector` only once their embedding lands
+        in_flight = (DuplicateDetector(self.detector.max_hash_distance, self.detector.max_pixel_diff)
+                     if self.detector is not None else None)
+        queued_fingerprints: dict[int, tuple] = {}
+        unsaved: list[int] = []
+
+        def submit_embed(pages: list[tuple[int, str]]) -> None:
+            batch_started = time.perf_counter()
+            future = embed_pool.submit(self.embedder.embed_batch, [img for _, img in pages])
+            future.add_done_callback(
+                lambda f: events.put(("embedded", ([idx for idx, _ in pages], f, time.perf_counter() - batch_started)))
+            )
+
+        mp_context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=mp_context,
+                                 initializer=_init_worker, initargs=(self.pdf_bytes, self.dpi, self.img_format, self.quality, self.thumbnails)) as render_pool, \
+                ThreadPoolExecutor(max_workers=self.embedder.max_in_flight) as embed_pool:
+
+            while embedded < total:
+                # Producer: keep the render pool busy within the memory budget
+                while next_page < total and in_memory < max_in_memory:
+                    page_index = todo[next_page]
+                    future = render_pool.submit(_render_page, page_index, result.image_paths[page_index])
+                    future.add_done_callback(lambda f: events.put(("rendered", f)))
+                    next_page += 1
+                    in_memory += 1
+
+                kind, payload = events.get()
+                if kind == "rendered":
+                    # Rendering errors are fatal for the PDF and propagate to the caller
+                    page_index, page_key, fingerprint, base64_img, thumbnail_path, timings = payload.result()
+                    result.render.record(1, timings["total"])
+                    result.timings += [("rasterize", timings["rasterize"]), ("encode", timings["encode"])]
+                    result.keys[page_index] = page_key
+                    result.thumbnails[page_index] = thumbnail_path
+                    rendered += 1
+                    stored_emb = self.store.get(page_key) if self.store is not None else None
+                    duplicate_key = None
+                    if stored_emb is None and self.detector is not None:
+                        duplicate_key = self.detector.match(fingerprint)
+                        if duplicate_key is not None:
+                            stored_emb = embedded_by_key.get(duplicate_key)
+                            if stored_emb is None and self.store is not None:
+                                stored_emb = self.store.get(duplicate_key)
+                        if stored_emb is None:
+                            duplicate_key = in_flight.match(fingerprint)
+
+                    if stored_emb is not None:
+                        result.embeddings[page_index] = stored_emb
+                        if duplicate_key is not None:
+                            result.deduplicated += 1
+                        else:
+                            result.reused += 1
+                        embedded += 1
+                        in_memory -= 1
+                    elif duplicate_key in queued_keys:
+                        # Its original is still being embedded; share the vector once it arrives
+                        # Counted as deduplicated only if that embedding succeeds
+                        waiting_duplicates.setdefault(queued_keys[duplicate_key], []).append(page_index)
+                        in_memory -= 1
+                    else:
+                        if in_flight is not None:
+                            in_flight.add(fingerprint, page_key)
+                            queued_fingerprints[page_index] = fingerprint
+                        queued_keys[page_key] = page_index
+                        pending_batch.append((page_index, base64_img))
+                    if on_progress:
+                        on_progress("render", rendered, total)
+                else:
+                    page_indices, future, seconds = payload
+                    duplicates = {idx: waiting_duplicates.pop(idx, []) for idx in page_indices}
+                    duplicate_pages = [dup for dups in duplicates.values() for dup in dups]
+                    try:
+                        vectors = future.result()
+                        for idx, emb in zip(page_indices, vectors):
+                            result.embeddings[idx] = emb
+                            embedded_by_key[result.keys[idx]] = emb
+                            for dup in duplicates[idx]:
+                                result.embeddings[dup] = emb
+                            if self.detector is not None:
+                                self.detector.add(queued_fingerprints[idx], result.keys[idx])
+                        result.deduplicated += len(duplicate_pages)
+                        result.embed.record(len(page_indices), seconds)
+                        result.timings.append(("embed_batch", seconds))
+                        unsaved.extend(page_indices + duplicate_pages)
+                    except Exception as e:
+                        result.errors.append(([idx + 1 for idx in page_indices + duplicate_pages], e))
+                    for idx in page_indices:
+                        queued_keys.pop(result.keys[idx], None)
+                        queued_fingerprints.pop(idx, None)
+                    embedded += len(page_indices) + len(duplicate_pages)
+                    in_memory -= len(page_indices)
+                    if on_progress:
+                        on_progress("embed", embedded, total)
+                    if self.store is not None and self.checkpoint_pages and len(unsaved) >= self.checkpoint_pages:
+                        self._save(result, unsaved)
+                        unsaved = []
+
+                # Consumer: send full batches, or the remainder once rendering is done
+                all_rendered = rendered == total
+                while len(pending_batch) >= batch_size or (all_rendered and pending_batch):
+                    submit_embed(pending_batch[:batch_size])
+                    pending_batch = pending_batch[batch_size:]
+
+        if self.store is not None:
+            self._save(result, range(num_pages)) # Already stored keys are skipped
+        result.total_seconds = time.perf_counter() - started
+        return result
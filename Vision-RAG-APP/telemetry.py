@@ -0,0 +1,61 @@
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class LatencyRecorder:
+    """Per-stage latency samples and counters for one session.
+
+    Every timing is kept as an event (`stage`, `seconds`, wall-clock `ts`, plus
+    any extra fields), so the session can be exported as JSON lines and
+    summarized as p50/p95 per stage. Only the most recent `max_events` are
+    kept, which bounds memory on long sessions.
+    """
+
+    def __init__(self, max_events: int = 10_000):
+        self.events: deque[dict] = deque(maxlen=max_events)
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, **fields) -> None:
+        with self._lock:
+            self.events.append({"stage": stage, "seconds": round(seconds, 6), "ts": time.time(), **fields})
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def time(self, stage: str, **fields):
+        """Times the body of a `with` block as one sample of `stage` (recorded even if it raises)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, **fields)
+
+    def summary(self) -> list[dict]:
+        """One row per stage, in first-seen order: count, p50/p95/max and total in milliseconds."""
+        with self._lock:
+            samples: dict[str, list[float]] = {}
+            for event in self.events:
+                samples.setdefault(event["stage"], []).append(event["seconds"])
+        rows = []
+        for stage, seconds in samples.items():
+            ms = np.asarray(seconds) * 1000
+            p50, p95 = np.percentile(ms, [50, 95])
+            rows.append({"stage": stage, "count": len(ms), "p50_ms": round(float(p50), 1),
+                         "p95_ms": round(float(p95), 1), "max_ms": round(float(ms.max()), 1),
+                         "total_s": round(float(ms.sum()) / 1000, 2)})
+        return rows
+
+    def to_jsonl(self) -> str:
+        """All events, one JSON object per line, followed by one line with the counters."""
+        with self._lock:
+            lines = [json.dumps(event) for event in self.events]
+            lines.append(json.dumps({"counters": dict(self.counters), "ts": time.time()}))
+        return "\n".join(lines) + "\n"
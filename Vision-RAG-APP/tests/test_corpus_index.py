@@ -0,0 +1,31 @@
+from corpus_index import select_new_paths
+
+
+def upload_run(paths, collection: list[str], removed_paths: set[str], readded: bool) -> None:
+    """One script run of the app's upload loop for a file still held by the uploader."""
+    current_paths = set(collection)
+    collection.extend(paths[idx] for idx in select_new_paths(paths, current_paths, removed_paths, readded=readded))
+
+
+def test_removed_upload_stays_removed_across_reruns():
+    pages = ["pdf_pages/report/page_1.png", "pdf_pages/report/page_2.png"]
+    collection, removed_paths = [], set()
+    upload_run(pages, collection, removed_paths, readded=True)  # First upload
+    assert collection == pages
+
+    # "Remove Selected", then st.rerun(): the file is still in the uploader
+    collection.remove(pages[0])
+    removed_paths.add(pages[0])
+    upload_run(pages, collection, removed_paths, readded=False)
+    upload_run(pages, collection, removed_paths, readded=False)
+    assert collection == [pages[1]]
+
+    # Uploading the file again brings the removed page back
+    upload_run(pages, collection, removed_paths, readded=True)
+    assert collection == [pages[1], pages[0]] and not removed_paths
+
+
+def test_already_loaded_paths_are_skipped():
+    current_paths = {"a.png"}
+    assert select_new_paths(["a.png", "b.png", "b.png"], current_paths, set()) == [1]
+    assert current_paths == {"a.png", "b.png"}
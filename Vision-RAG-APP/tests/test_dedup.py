@@ -0,0 +1,109 @@
+import io
+import threading
+import time
+from types import SimpleNamespace
+
+import fitz # PyMuPDF
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from dedup import DuplicateDetector, page_fingerprint
+from embedding_engine import BatchEmbedder
+from render_pipeline import PdfIngestPipeline
+
+REPORT = ["Quarterly report", "Total revenue: $5,120 million", "Revenue grew across all segments",
+          "Outlook remains stable"]
+
+
+def text_page(lines: list[str], size=(1240, 1754)) -> Image.Image:
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=28)
+    for i, line in enumerate(lines):
+        draw.text((100, 150 + i * 60), line, fill="black", font=font)
+    return image
+
+
+def recompressed(image: Image.Image, quality: int = 85) -> Image.Image:
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+
+
+def detector_with(image: Image.Image, key: str = "original") -> DuplicateDetector:
+    detector = DuplicateDetector()
+    detector.add(page_fingerprint(image), key)
+    return detector
+
+
+def test_identical_and_recompressed_pages_match():
+    page = text_page(REPORT)
+    detector = detector_with(page)
+    assert detector.match(page_fingerprint(page)) == "original"
+    assert detector.match(page_fingerprint(recompressed(page))) == "original"
+
+
+def test_pages_differing_only_in_numbers_are_not_merged():
+    detector = detector_with(text_page(REPORT))
+    changed = text_page([REPORT[0], "Total revenue: $9,870 million", *REPORT[2:]])
+    assert detector.match(page_fingerprint(changed)) is None
+
+
+def test_pages_differing_only_in_wording_are_not_merged():
+    detector = detector_with(text_page(REPORT))
+    changed = text_page([*REPORT[:2], "Revenue fell across most regions", REPORT[3]])
+    assert detector.match(page_fingerprint(changed)) is None
+
+
+def test_pages_rendered_at_another_size_are_not_merged():
+    detector = detector_with(text_page(REPORT))
+    assert detector.match(page_fingerprint(text_page(REPORT, size=(1000, 1414)))) is None
+
+
+class SlowClient:
+    """Cohere stand-in: answers after a delay, so later pages queue up behind the first batch."""
+
+    def __init__(self, fail: bool = False, delay: float = 1.0):
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed(self, inputs, **kwargs):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ValueError("embedding failed")
+        return SimpleNamespace(embeddings=SimpleNamespace(float=[[1.0, 0.0, 0.0] for _ in inputs]))
+
+
+def repeated_page_pdf(copies: int = 2) -> bytes:
+    doc = fitz.open()
+    for _ in range(copies):
+        doc.new_page().insert_text((72, 72), "Same title slide on every page")
+    return doc.tobytes()
+
+
+def run_pipeline(tmp_path, client) -> tuple:
+    detector = DuplicateDetector()
+    pipeline = PdfIngestPipeline(repeated_page_pdf(), str(tmp_path / "pages"), BatchEmbedder(client, batch_size=1),
+                                 workers=1, detector=detector)
+    return pipeline.run(), detector
+
+
+def test_duplicate_pages_share_the_embedding(tmp_path):
+    client = SlowClient()
+    result, detector = run_pipeline(tmp_path, client)
+    assert client.calls == 1
+    assert result.deduplicated == 1
+    assert all(np.array_equal(emb, [1.0, 0.0, 0.0]) for emb in result.embeddings)
+    assert len(detector) == 1
+
+
+def test_failed_batch_fails_its_waiting_duplicates(tmp_path):
+    result, detector = run_pipeline(tmp_path, SlowClient(fail=True))
+    assert result.deduplicated == 0
+    assert result.embeddings == [None, None]
+    assert sorted(page for pages, _ in result.errors for page in pages) == [1, 2]
+    assert len(detector) == 0 # Nothing registered without an embedding to reuse
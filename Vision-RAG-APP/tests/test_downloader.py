@@ -0,0 +1,102 @@
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloader import Downloader
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+BODY = b"\x89PNG fake image bytes"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves /report.png with validators and answers conditional requests; everything else is a 404."""
+
+    requests_seen: list[tuple[str, dict]] = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, dict(self.headers)))
+        if self.path != "/report.png":
+            self.send_error(404)
+            return
+        if self.headers.get("If-None-Match") == ETAG or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    StandInHandler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def closed_port_url() -> str:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    return f"http://127.0.0.1:{port}/report.png"
+
+
+def leftovers(folder) -> list[str]:
+    return [name for name in os.listdir(folder) if ".part-" in name]
+
+
+def test_download_then_revalidate_with_etag_and_last_modified(server, tmp_path):
+    downloader = Downloader(retries=0)
+    first = downloader.fetch_all({"report.png": f"{server}/report.png"}, str(tmp_path))["report.png"]
+    assert first.status == "downloaded" and first.ok
+    assert (tmp_path / "report.png").read_bytes() == BODY
+
+    second = downloader.fetch_all({"report.png": f"{server}/report.png"}, str(tmp_path))["report.png"]
+    assert second.status == "not_modified"
+    _, headers = StandInHandler.requests_seen[-1]
+    assert headers["If-None-Match"] == ETAG and headers["If-Modified-Since"] == LAST_MODIFIED
+    assert (tmp_path / "report.png").read_bytes() == BODY
+
+
+def test_404_fails_without_leaving_a_file(server, tmp_path):
+    result = Downloader(retries=0).fetch_all({"missing.png": f"{server}/missing.png"}, str(tmp_path))["missing.png"]
+    assert result.status == "failed" and not result.ok
+    assert result.error is not None
+    assert not (tmp_path / "missing.png").exists() and not leftovers(tmp_path)
+
+
+def test_offline_server_falls_back_to_the_stale_copy(server, tmp_path):
+    downloader = Downloader(retries=0)
+    downloader.fetch_all({"report.png": f"{server}/report.png"}, str(tmp_path))
+    # Same URL as recorded in the metadata, but nothing is listening any more
+    offline_url = closed_port_url()
+    (tmp_path / "report.png.meta.json").write_text(
+        (tmp_path / "report.png.meta.json").read_text().replace(f"{server}/report.png", offline_url))
+
+    result = downloader.fetch_all({"report.png": offline_url}, str(tmp_path))["report.png"]
+    assert result.status == "stale" and result.ok
+    assert (tmp_path / "report.png").read_bytes() == BODY
+
+
+def test_write_error_removes_the_partial_file_and_is_reported_per_url(server, tmp_path):
+    (tmp_path / "blocked.png").mkdir() # os.replace onto a directory fails with an OSError
+    results = Downloader(retries=0).fetch_all({"blocked.png": f"{server}/report.png",
+                                               "report.png": f"{server}/report.png"}, str(tmp_path))
+    assert results["blocked.png"].status == "failed"
+    assert isinstance(results["blocked.png"].error, OSError)
+    assert results["report.png"].status == "downloaded"
+    assert not leftovers(tmp_path)
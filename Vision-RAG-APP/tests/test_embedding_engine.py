@@ -0,0 +1,94 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from embedding_engine import BatchEmbedder
+
+
+class TooManyRequestsError(Exception):
+    pass
+
+
+class FakeClient:
+    """Cohere stand-in that embeds image "img-<n>" as `[n]`.
+
+    `script` maps an image to the exceptions its batch raises, one per call,
+    before it succeeds. With `hold_first`, the batch starting at image 0 waits
+    until that many other batches have been answered, so it finishes last.
+    """
+
+    def __init__(self, script=None, hold_first: int = 0):
+        self.script = {image: list(errors) for image, errors in (script or {}).items()}
+        self.hold_first = hold_first
+        self.calls = []
+        self.finished = []
+        self._others_done = threading.Semaphore(0)
+        self._lock = threading.Lock()
+
+    def embed(self, inputs, **kwargs):
+        images = [item["content"][0]["image_url"]["url"] for item in inputs]
+        with self._lock:
+            self.calls.append(images)
+            errors = self.script.get(images[0])
+            error = errors.pop(0) if errors else None
+        if error is not None:
+            raise error
+        if self.hold_first and images[0] == "img-0":
+            for _ in range(self.hold_first):
+                assert self._others_done.acquire(timeout=5)
+        with self._lock:
+            self.finished.append(images[0])
+        self._others_done.release()
+        return SimpleNamespace(embeddings=SimpleNamespace(float=[[float(img.split("-")[1])] for img in images]))
+
+
+def images(count: int) -> list[str]:
+    return [f"img-{n}" for n in range(count)]
+
+
+def test_results_stay_in_input_order_when_batches_finish_out_of_order():
+    client = FakeClient(hold_first=4)
+    progress = []
+    embedder = BatchEmbedder(client, batch_size=2, max_in_flight=5)
+    results = embedder.embed_images(images(10), on_progress=lambda done, total: progress.append(done))
+    assert client.finished[-1] == "img-0"
+    assert [float(r[0]) for r in results] == list(range(10))
+    assert progress == [2, 4, 6, 8, 10] and embedder.errors == []
+
+
+def test_throttled_batches_back_off_then_give_up():
+    delays = []
+    script = {
+        "img-0": [TooManyRequestsError(), type("ApiError", (Exception,), {"status_code": 429})()],
+        "img-2": [TooManyRequestsError()] * 4,
+    }
+    embedder = BatchEmbedder(FakeClient(script), batch_size=2, max_in_flight=1, max_retries=2,
+                             base_delay=1.0, max_delay=30.0, sleep=delays.append)
+    results = embedder.embed_images(images(4))
+    assert [float(r[0]) for r in results[:2]] == [0.0, 1.0]  # Succeeded on its third attempt
+    assert results[2:] == [None, None]  # Still throttled after max_retries
+    assert [start for start, _ in embedder.errors] == [2]
+    assert isinstance(embedder.errors[0][1], TooManyRequestsError)
+    assert embedder.retries == 4
+    # Exponential backoff with jitter between half and all of base_delay * 2 ** attempt
+    for delay, attempt in zip(delays, [0, 1, 0, 1]):
+        assert 0.5 * 2 ** attempt <= delay <= 2 ** attempt
+
+
+def test_other_errors_are_not_retried():
+    delays = []
+    client = FakeClient({"img-2": [ValueError("bad image")]})
+    embedder = BatchEmbedder(client, batch_size=2, max_in_flight=2, sleep=delays.append)
+    results = embedder.embed_images(images(6))
+    assert delays == [] and embedder.retries == 0
+    assert sum(call[0] == "img-2" for call in client.calls) == 1
+    assert [start for start, _ in embedder.errors] == [2]
+    assert str(embedder.errors[0][1]) == "bad image"
+    # Failed images stay None in their input positions
+    assert [None if r is None else float(r[0]) for r in results] == [0.0, 1.0, None, None, 4.0, 5.0]
+
+
+def test_batch_size_must_be_positive():
+    with pytest.raises(ValueError):
+        BatchEmbedder(FakeClient(), batch_size=0)
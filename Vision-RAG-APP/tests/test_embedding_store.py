@@ -0,0 +1,39 @@
+import multiprocessing
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+
+def append_rows(root: str, writer: int, count: int) -> None:
+    store = EmbeddingStore(root)
+    for i in range(count):
+        store.add(f"{writer}-{i}", np.full(8, writer * 1000 + i, dtype=np.float32),
+                  source=f"writer {writer}", page=i, image_path=f"{writer}/{i}.png")
+
+
+def test_two_processes_append_to_one_store(tmp_path):
+    # The app and indexer.py appending at the same time, each through its own store instance
+    root = str(tmp_path)
+    context = multiprocessing.get_context("fork")
+    writers = [context.Process(target=append_rows, args=(root, writer, 50)) for writer in (1, 2)]
+    for process in writers:
+        process.start()
+    for process in writers:
+        process.join()
+        assert process.exitcode == 0
+
+    store = EmbeddingStore(root)
+    assert len(store) == 100
+    for writer in (1, 2):
+        for i in range(50):
+            assert store.get(f"{writer}-{i}")[0] == writer * 1000 + i
+
+
+def test_two_instances_see_each_others_rows(tmp_path):
+    first, second = EmbeddingStore(str(tmp_path)), EmbeddingStore(str(tmp_path))
+    first.add("a", np.ones(4), source="a.png", page=None, image_path="a.png")
+    second.add("b", np.full(4, 2.0), source="b.png", page=None, image_path="b.png")
+    first.add("c", np.full(4, 3.0), source="c.png", page=None, image_path="c.png")
+    assert [second.get(key)[0] for key in "abc"] == [1.0, 2.0, 3.0]
+    assert [row["key"] for row in EmbeddingStore(str(tmp_path)).rows] == ["a", "b", "c"]
@@ -0,0 +1,82 @@
+import hashlib
+import io
+from types import SimpleNamespace
+
+import fitz # PyMuPDF
+from PIL import Image
+
+from corpus_index import CorpusIndex
+from embedding_engine import BatchEmbedder
+from embedding_store import EmbeddingStore
+from indexer import Indexer, find_documents
+from vector_index import VectorIndex
+
+
+class HashClient:
+    """Cohere stand-in embedding each image as a vector derived from its bytes; can fail chosen calls."""
+
+    def __init__(self, fail_calls=()):
+        self.fail_calls = set(fail_calls)
+        self.calls = 0
+        self.images = 0
+
+    def embed(self, inputs, **kwargs):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise ValueError("embedding service unavailable")
+        self.images += len(inputs)
+        vectors = [[float(b) - 127.5 for b in hashlib.sha256(item["content"][0]["image_url"]["url"].encode()).digest()]
+                   for item in inputs]
+        return SimpleNamespace(embeddings=SimpleNamespace(float=vectors))
+
+
+def write_documents(docs):
+    docs.mkdir()
+    pdf = fitz.open()
+    for number in range(1, 4):
+        pdf.new_page().insert_text((72, 72), f"Page {number} of the quarterly report")
+    pdf.save(str(docs / "report.pdf"))
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (200, 30, 30)).save(buffer, format="PNG")
+    (docs / "chart.png").write_bytes(buffer.getvalue())
+
+
+def run_indexer(tmp_path, client) -> Indexer:
+    embedder = BatchEmbedder(client, batch_size=1, max_in_flight=1)
+    indexer = Indexer(embedder, EmbeddingStore(str(tmp_path / "store")), CorpusIndex(str(tmp_path / "corpus.json")),
+                      pages_dir=str(tmp_path / "pages"), workers=1)
+    indexer.run(find_documents(str(tmp_path / "docs")))
+    return indexer
+
+
+def test_resume_embeds_only_the_missing_pages_and_the_index_loads_into_the_app(tmp_path):
+    write_documents(tmp_path / "docs")
+
+    # An interrupted first run: one PDF page fails, so the PDF is not recorded as done
+    first = run_indexer(tmp_path, HashClient(fail_calls={2}))
+    assert (first.indexed_files, first.failed_files, first.failed_pages) == (1, 1, 1)
+    assert len(CorpusIndex(str(tmp_path / "corpus.json"))) == 1  # Just the image
+
+    # Resuming: the image is up to date, and the PDF's stored pages are reused
+    client = HashClient()
+    second = run_indexer(tmp_path, client)
+    assert client.images == 1
+    assert (second.skipped_files, second.indexed_files, second.reused) == (1, 1, 2)
+
+    # A third run has nothing left to do
+    client = HashClient()
+    third = run_indexer(tmp_path, client)
+    assert client.images == 0 and third.skipped_files == 2
+
+    # The app's startup load: every page into a binary VectorIndex rescored from the store
+    store = EmbeddingStore(str(tmp_path / "store"))
+    paths, embeddings, keys = CorpusIndex(str(tmp_path / "corpus.json")).load(store)
+    assert len(paths) == 4 and embeddings.shape == (4, 32)
+    key_by_path = dict(zip(paths, keys))
+    index = VectorIndex(dtype="binary", rescore=None,
+                        rescore_source=lambda ids: embeddings[[paths.index(p) for p in ids]])
+    index.add(embeddings, ids=paths)
+    for path, emb in zip(paths, embeddings):
+        hit, score = index.search(emb, k=1)[0]
+        assert hit == path and abs(score - 1.0) < 1e-5
+        assert store.get(key_by_path[path]).tolist() == emb.tolist()
@@ -0,0 +1,65 @@
+import numpy as np
+
+from query_cache import EmbeddingCache, QueryEmbeddingCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_entries_expire_after_the_ttl():
+    clock = Clock()
+    cache = EmbeddingCache(ttl_seconds=60, clock=clock)
+    cache.put("page", "embed-v4.0", np.ones(2))
+    clock.now = 60
+    assert cache.get("page", "embed-v4.0") is not None
+    clock.now = 60.1
+    assert cache.get("page", "embed-v4.0") is None
+    assert len(cache) == 0  # The expired entry was dropped, not just skipped
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1, "evictions": 0, "hit_rate": 0.5}
+
+
+def test_least_recently_used_entry_is_evicted_first():
+    cache = EmbeddingCache(max_entries=2, clock=Clock())
+    cache.put("a", "m", np.zeros(2))
+    cache.put("b", "m", np.zeros(2))
+    cache.get("a", "m")  # "b" is now the least recently used
+    cache.put("c", "m", np.zeros(2))
+    assert cache.get("b", "m") is None
+    assert cache.get("a", "m") is not None and cache.get("c", "m") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_get_or_compute_counts_one_lookup_per_call():
+    cache = EmbeddingCache(clock=Clock())
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.ones(2)
+
+    cache.get_or_compute("a", "m", compute)
+    cache.get_or_compute("a", "m", compute)
+    cache.get_or_compute("b", "m", lambda: None)  # Failed computations are not cached
+    cache.get_or_compute("b", "m", lambda: None)
+    stats = cache.stats()
+    assert len(calls) == 1
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 1)
+    assert stats["hit_rate"] == 0.25
+
+
+def test_models_are_cached_separately_and_questions_are_normalized():
+    cache = QueryEmbeddingCache(clock=Clock())
+    cache.put("What is Nike's  net profit?", "embed-v4.0", np.ones(2))
+    assert cache.get("what is nike's net profit?", "embed-v4.0") is not None
+    assert cache.get("What is Nike's net profit?", "embed-v3.0") is None
+
+
+def test_put_stores_a_read_only_copy():
+    embedding = np.ones(2)
+    stored = EmbeddingCache().put("a", "m", embedding)
+    assert embedding.flags.writeable and not stored.flags.writeable
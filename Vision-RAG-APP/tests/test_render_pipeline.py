@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import fitz # PyMuPDF
+
+from corpus_index import UploadIndex
+from embedding_engine import BatchEmbedder
+from embedding_store import EmbeddingStore
+from render_pipeline import PdfIngestPipeline
+
+
+class PageClient:
+    """Cohere stand-in that embeds each image as a one-hot vector and counts images sent."""
+
+    def __init__(self):
+        self.images = 0
+
+    def embed(self, inputs, **kwargs):
+        self.images += len(inputs)
+        return SimpleNamespace(embeddings=SimpleNamespace(float=[[1.0, 0.0] for _ in inputs]))
+
+
+def numbered_pdf(num_pages: int) -> bytes:
+    doc = fitz.open()
+    for number in range(1, num_pages + 1):
+        doc.new_page().insert_text((72, 72), f"Page {number} of the quarterly report")
+    return doc.tobytes()
+
+
+def test_only_the_requested_pages_are_processed(tmp_path):
+    client = PageClient()
+    pipeline = PdfIngestPipeline(numbered_pdf(5), str(tmp_path / "pages"), BatchEmbedder(client, batch_size=2),
+                                 workers=1, pages=[1, 3])
+    result = pipeline.run()
+    assert client.images == 2
+    assert [emb is not None for emb in result.embeddings] == [False, True, False, True, False]
+    assert len(result.image_paths) == 5
+
+
+def test_partial_upload_is_recorded_with_its_failed_pages(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "store"))
+    image_path = tmp_path / "page_1.png"
+    image_path.write_bytes(b"png")
+    store.add("key-1", [1.0, 0.0], source="report.pdf", page=1, image_path=str(image_path))
+
+    upload_index = UploadIndex(str(tmp_path / "upload_index.json"))
+    upload_index.record("digest", "report.pdf", [{"image_path": str(image_path), "key": "key-1"}], failed_pages=[3, 2])
+
+    reopened = UploadIndex(str(tmp_path / "upload_index.json"))
+    assert reopened.failed_pages("digest") == [2, 3]
+    paths, _, keys = reopened.load("digest", store)
+    assert paths == [str(image_path)] and keys == ["key-1"]
+    reopened.record("digest", "report.pdf", reopened.pages("digest"))
+    assert reopened.failed_pages("digest") == []
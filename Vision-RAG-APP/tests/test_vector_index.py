@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from vector_index import VectorIndex
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((200, 64)).astype(np.float32)
+
+
+@pytest.mark.parametrize("rescore", ["int8", None])
+def test_binary_search_returns_k_live_hits_after_removals(vectors, rescore):
+    index = VectorIndex(dtype="binary", rescore=rescore, rescore_factor=1,
+                        rescore_source=(lambda ids: vectors[ids]) if rescore is None else None)
+    index.build(vectors)
+    query = vectors[0]
+    # Remove the nearest neighbours, but fewer than the live rows, so no compaction happens
+    nearest = [doc_id for doc_id, _ in index.search(query, k=20)]
+    assert index.remove(nearest) == 20 and index._dead == 20
+    hits = index.search(query, k=10)
+    assert len(hits) == 10
+    assert not set(doc_id for doc_id, _ in hits) & set(nearest)
+
+
+def test_binary_rescore_from_source_keeps_no_vectors_in_memory(vectors):
+    index = VectorIndex(dtype="binary", rescore=None, rescore_source=lambda ids: vectors[ids]).build(vectors)
+    assert index.nbytes == vectors.shape[0] * vectors.shape[1] // 8
+    doc_id, score = index.search(vectors[7], k=1)[0]
+    assert doc_id == 7 and score == pytest.approx(1.0, abs=1e-5)
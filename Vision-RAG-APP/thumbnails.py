@@ -0,0 +1,71 @@
+import io
+import os
+import threading
+
+from PIL import Image
+
+from embedding_store import content_key
+
+THUMBNAIL_EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+
+
+class ThumbnailCache:
+    """Small gallery previews on disk, keyed by the same content hash as the embedding store.
+
+    Thumbnails are written once, at ingest time, by whoever already holds the
+    decoded image (render workers, the upload path), so the gallery only ever
+    sends files of a few KB. Identical content shares one thumbnail, and files
+    are written to a temporary name and moved into place so a reader never sees
+    a partial file. The class is plain data, so it can be handed to worker
+    processes.
+    """
+
+    def __init__(self, root: str = "thumbnails", size: int = 256, img_format: str = "WEBP", quality: int = 70):
+        if img_format not in THUMBNAIL_EXTENSIONS:
+            raise ValueError(f"Unsupported thumbnail format {img_format!r}; use one of {list(THUMBNAIL_EXTENSIONS)}.")
+        self.root = root
+        self.size = size
+        self.img_format = img_format
+        self.quality = quality
+
+    def path_for(self, key: str) -> str:
+        # Two-level fan-out keeps directories small with thousands of pages
+        return os.path.join(self.root, key[:2], f"{key}.{THUMBNAIL_EXTENSIONS[self.img_format]}")
+
+    def get(self, key: str) -> str | None:
+        path = self.path_for(key)
+        return path if os.path.exists(path) else None
+
+    def add(self, key: str, pil_image: Image.Image) -> str:
+        """Writes the thumbnail for `key` unless it already exists; returns its path."""
+        path = self.path_for(key)
+        if os.path.exists(path):
+            return path
+        thumb = pil_image.copy()
+        thumb.thumbnail((self.size, self.size))
+        if thumb.mode not in ("RGB", "L"):
+            thumb = thumb.convert("RGB")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Unique per process and thread: render workers and upload threads may write the same page
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            thumb.save(tmp_path, format=self.img_format, quality=self.quality)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return path
+
+    def add_bytes(self, key: str, img_bytes: bytes) -> str:
+        path = self.get(key)
+        if path is None:
+            with Image.open(io.BytesIO(img_bytes)) as pil_image:
+                pil_image.draft("RGB", (self.size, self.size)) # JPEG: decode at reduced size
+                path = self.add(key, pil_image)
+        return path
+
+    def for_file(self, image_path: str) -> str:
+        """Thumbnail of an image file that was not thumbnailed at ingest (hashes the file once)."""
+        with open(image_path, "rb") as f:
+            img_bytes = f.read()
+        return self.add_bytes(content_key(img_bytes), img_bytes)
@@ -0,0 +1,350 @@
+from typing import Callable, Hashable, Iterable
+
+import numpy as np
+
+# Rows scored per block, so float16/int8 storage is only widened a slice at a time
+SCORE_BLOCK_ROWS = 8192
+
+# Set bits per byte value, for Hamming distances on NumPy versions without bitwise_count
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalizes rows (or a single vector) in float32; zero vectors are left as zeros."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first, via argpartition (O(n) instead of a full sort)."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def binary_codes(unit: np.ndarray) -> np.ndarray:
+    """Packs the sign of each component into bits (the same codes as Cohere's `ubinary` embeddings)."""
+    return np.packbits(unit > 0, axis=-1)
+
+
+def hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    """Number of differing bits between each row of packed `codes` and `query_code`."""
+    diff = codes ^ query_code
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diff).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[diff].sum(axis=1, dtype=np.int32)
+
+
+class EmbeddingBuffer:
+    """Capacity-doubling array of rows with amortized O(1) append.
+
+    Appending never copies the existing rows unless the capacity is exhausted,
+    in which case the backing array doubles. `data` is a view of the filled
+    rows, so readers use the buffer directly without copying it.
+    """
+
+    def __init__(self, row_shape: tuple[int, ...], dtype, initial_capacity: int = 64):
+        self.row_shape = tuple(row_shape)
+        self._data = np.empty((max(1, initial_capacity), *self.row_shape), dtype=dtype)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def data(self) -> np.ndarray:
+        return self._data[:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def append(self, rows: np.ndarray) -> None:
+        rows = np.asarray(rows, dtype=self._data.dtype).reshape(-1, *self.row_shape)
+        needed = self.size + rows.shape[0]
+        if needed > self._data.shape[0]:
+            capacity = self._data.shape[0]
+            while capacity < needed:
+                capacity *= 2
+            grown = np.empty((capacity, *self.row_shape), dtype=self._data.dtype)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:needed] = rows
+        self.size = needed
+
+    def compact(self, keep: np.ndarray) -> None:
+        """Keeps only the rows where the boolean mask `keep` is True, in place and in order."""
+        kept = self.data[keep]
+        self._data[:kept.shape[0]] = kept
+        self.size = kept.shape[0]
+
+
+class VectorIndex:
+    """Growable cosine-similarity index over L2-normalized, compactly stored embeddings.
+
+    Vectors are stored as float16 (half the memory of float32) or int8 (a
+    quarter; each row is scaled so its largest component maps to 127, and the
+    per-row scale is kept as a float32). They live in capacity-doubling
+    `EmbeddingBuffer`s, so adding documents is amortized O(1) and searches read
+    the buffers directly.
+
+    With `dtype="binary"`, every vector is also kept as one sign bit per
+    dimension (1/32 of float32). Search is two-stage: a Hamming-distance pass
+    over the bit codes shortlists `rescore_factor * k` candidates, which are
+    then rescored exactly with the `rescore` vectors ("int8" or "float16").
+    With `rescore=None` only the bit codes are kept in memory (32x smaller than
+    float32). The shortlist is then rescored with vectors fetched by
+    `rescore_source(ids)`, e.g. rows of a memory-mapped store on disk. Without a
+    source, scores are the cosine estimated from the Hamming distance.
+
+    Each row carries an id (e.g. an image path) and search returns ids. Removing
+    ids only marks their rows dead; dead rows are skipped at search time and
+    compacted away once they outnumber the live ones.
+
+    Small corpora are scanned exhaustively. Once the corpus reaches
+    `ivf_threshold` vectors, an inverted-file (IVF) layer is trained: vectors
+    are bucketed under k-means centroids and a query only scores the `nprobe`
+    closest buckets. New vectors join their nearest bucket; the centroids are
+    retrained whenever the corpus has doubled since the last training.
+    """
+
+    def __init__(self, dtype: str = "float16", ivf_threshold: int = 50_000,
+                 nlist: int | None = None, nprobe: int = 8, seed: int = 0,
+                 rescore: str | None = "int8", rescore_factor: int = 10,
+                 rescore_source: Callable[[list[Hashable]], np.ndarray] | None = None):
+        if dtype not in ("float16", "int8", "binary"):
+            raise ValueError("dtype must be 'float16', 'int8' or 'binary'")
+        if rescore not in ("float16", "int8", None):
+            raise ValueError("rescore must be 'float16', 'int8' or None")
+        self.dtype = dtype
+        self.rescore = rescore
+        self.rescore_factor = rescore_factor
+        self.rescore_source = rescore_source
+        # Dtype of the full vectors kept for scoring; None keeps bit codes only
+        self._vector_dtype = rescore if dtype == "binary" else dtype
+        self.ivf_threshold = ivf_threshold
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.seed = seed
+        self.dim = None
+        self._vectors: EmbeddingBuffer | None = None
+        self._scales: EmbeddingBuffer | None = None
+        self._bits: EmbeddingBuffer | None = None
+        self._live = EmbeddingBuffer((), bool)
+        self._row_ids: list[Hashable] = []
+        self._id_to_row: dict[Hashable, int] = {}
+        self._dead = 0
+        self._centroids = None
+        self._lists: list[EmbeddingBuffer] = []
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._id_to_row)
+
+    def __contains__(self, doc_id: Hashable) -> bool:
+        return doc_id in self._id_to_row
+
+    @property
+    def ids(self) -> list[Hashable]:
+        """Ids of the live documents, in insertion order."""
+        return [doc_id for doc_id, live in zip(self._row_ids, self._live.data) if live]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in (self._vectors, self._scales, self._bits) if buffer is not None)
+
+    @property
+    def uses_ivf(self) -> bool:
+        return self._centroids is not None
+
+    def build(self, embeddings: np.ndarray, ids: Iterable[Hashable] | None = None) -> "VectorIndex":
+        """Resets the index to exactly `embeddings`; ids default to the row numbers."""
+        self.__init__(self.dtype, self.ivf_threshold, self.nlist, self.nprobe, self.seed,
+                      self.rescore, self.rescore_factor, self.rescore_source)
+        self.add(embeddings, ids)
+        return self
+
+    def add(self, embeddings: np.ndarray, ids: Iterable[Hashable] | None = None) -> None:
+        """Appends embeddings (one row per document) under unique ids."""
+        unit = normalize(np.atleast_2d(embeddings))
+        if unit.shape[0] == 0:
+            return
+        ids = list(range(len(self._row_ids), len(self._row_ids) + unit.shape[0])) if ids is None else list(ids)
+        if len(ids) != unit.shape[0]:
+            raise ValueError(f"Got {unit.shape[0]} embeddings but {len(ids)} ids.")
+        duplicates = [doc_id for doc_id in ids if doc_id in self._id_to_row]
+        if duplicates or len(set(ids)) != len(ids):
+            raise ValueError(f"Ids already in the index or repeated: {duplicates[:5]}")
+        if self.dim is None:
+            self.dim = unit.shape[1]
+            if self._vector_dtype is not None:
+                self._vectors = EmbeddingBuffer((self.dim,), np.int8 if self._vector_dtype == "int8" else np.float16)
+                self._scales = EmbeddingBuffer((), np.float32) if self._vector_dtype == "int8" else None
+            if self.dtype == "binary":
+                self._bits = EmbeddingBuffer(((self.dim + 7) // 8,), np.uint8)
+        elif unit.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {unit.shape[1]} does not match index dimension {self.dim}.")
+
+        first_row = len(self._row_ids)
+        if self._vectors is not None:
+            codes, scales = self._encode(unit)
+            self._vectors.append(codes)
+            if self._scales is not None:
+                self._scales.append(scales)
+        if self._bits is not None:
+            self._bits.append(binary_codes(unit))
+        self._live.append(np.ones(unit.shape[0], dtype=bool))
+        for offset, doc_id in enumerate(ids):
+            self._id_to_row[doc_id] = first_row + offset
+        self._row_ids.extend(ids)
+
+        if self._centroids is not None and len(self) < 2 * self._trained_size:
+            assignment = np.argmax(unit @ self._centroids.T, axis=1)
+            for offset, c in enumerate(assignment):
+                self._lists[c].append(np.array([first_row + offset]))
+        elif len(self) >= self.ivf_threshold:
+            self._train_ivf()
+
+    def remove(self, ids: Iterable[Hashable]) -> int:
+        """Removes documents by id without rebuilding; returns how many were removed."""
+        removed = 0
+        for doc_id in ids:
+            row = self._id_to_row.pop(doc_id, None)
+            if row is not None:
+                self._live.data[row] = False
+                removed += 1
+        self._dead += removed
+        if self._dead > len(self):
+            self._compact()
+        return removed
+
+    def search(self, query: np.ndarray, k: int = 5) -> list[tuple[Hashable, float]]:
+        """Returns up to k `(id, cosine_similarity)` pairs, best first."""
+        if len(self) == 0:
+            return []
+        q = normalize(query).ravel()
+        if q.shape[0] != self.dim:
+            raise ValueError(f"Query dimension {q.shape[0]} does not match index dimension {self.dim}.")
+
+        live = self._live.data
+        candidates = None
+        if self._centroids is not None:
+            probes = top_k(self._centroids @ q, self.nprobe)
+            candidates = np.concatenate([self._lists[p].data for p in probes])
+            candidates = candidates[live[candidates]]
+
+        if self._bits is not None:
+            if candidates is None and self._dead:
+                candidates = np.flatnonzero(live) # Dead rows never take a shortlist slot
+            # First pass: Hamming distance on the bit codes shortlists candidates for rescoring
+            bits = self._bits.data if candidates is None else self._bits.data[candidates]
+            distances = self._hamming(bits, binary_codes(q))
+            exact = self._vectors is not None or self.rescore_source is not None
+            shortlist = top_k(-distances, k * self.rescore_factor if exact else k)
+            candidates = shortlist if candidates is None else candidates[shortlist]
+            if self._vectors is not None:
+                scores = self._score_rows(candidates, q)
+            elif self.rescore_source is not None:
+                fetched = self.rescore_source([self._row_ids[row] for row in candidates])
+                scores = normalize(fetched).reshape(len(candidates), self.dim) @ q
+            else:
+                scores = np.cos(np.pi * distances[shortlist] / self.dim).astype(np.float32)
+        else:
+            scores = self._score_rows(candidates, q)
+            if candidates is None and self._dead:
+                scores[~live] = -np.inf
+
+        hits = []
+        for i in top_k(scores, k):
+            if not np.isfinite(scores[i]):
+                break
+            row = i if candidates is None else candidates[i]
+            hits.append((self._row_ids[row], float(scores[i])))
+        return hits
+
+    def _encode(self, unit: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        if self._vector_dtype == "int8":
+            max_abs = np.abs(unit).max(axis=1)
+            scales = np.where(max_abs == 0, 1, max_abs / 127).astype(np.float32)
+            codes = np.clip(np.rint(unit / scales[:, None]), -127, 127).astype(np.int8)
+            return codes, scales
+        return unit.astype(np.float16), None
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        """Approximate float32 unit vectors for stored rows (used for IVF training)."""
+        if self._vectors is None:
+            signs = np.unpackbits(self._bits.data[rows], axis=1, count=self.dim).astype(np.float32) * 2 - 1
+            return signs / np.sqrt(self.dim)
+        vectors = self._vectors.data[rows].astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales.data[rows][:, None]
+        return vectors
+
+    def _score_rows(self, rows: np.ndarray | None, q: np.ndarray) -> np.ndarray:
+        """Scores the given rows (all rows when None) against the query with the full vectors."""
+        vectors = self._vectors.data if rows is None else self._vectors.data[rows]
+        scales = None
+        if self._scales is not None:
+            scales = self._scales.data if rows is None else self._scales.data[rows]
+        return self._score(vectors, scales, q)
+
+    @staticmethod
+    def _hamming(bits: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+        distances = np.empty(bits.shape[0], dtype=np.int32)
+        for start in range(0, bits.shape[0], SCORE_BLOCK_ROWS):
+            distances[start:start + SCORE_BLOCK_ROWS] = hamming_distances(bits[start:start + SCORE_BLOCK_ROWS], query_code)
+        return distances
+
+    def _score(self, stored: np.ndarray, scales: np.ndarray | None, q: np.ndarray) -> np.ndarray:
+        scores = np.empty(stored.shape[0], dtype=np.float32)
+        for start in range(0, stored.shape[0], SCORE_BLOCK_ROWS):
+            block = stored[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_BLOCK_ROWS] = block @ q
+        return scores * scales if scales is not None else scores
+
+    def _compact(self) -> None:
+        """Drops dead rows from every buffer and renumbers the surviving rows."""
+        keep = self._live.data.copy()
+        for buffer in (self._vectors, self._scales, self._bits):
+            if buffer is not None:
+                buffer.compact(keep)
+        self._live.compact(keep)
+        self._row_ids = [doc_id for doc_id, k in zip(self._row_ids, keep) if k]
+        self._id_to_row = {doc_id: row for row, doc_id in enumerate(self._row_ids)}
+        self._dead = 0
+        if self._centroids is not None:
+            self._train_ivf()
+
+    def _train_ivf(self, iterations: int = 10, sample_size: int = 50_000) -> None:
+        """Spherical k-means on a sample of live rows, then assigns every live row to its nearest centroid."""
+        rng = np.random.default_rng(self.seed)
+        live_rows = np.flatnonzero(self._live.data)
+        n = live_rows.shape[0]
+        nlist = self.nlist or max(1, int(np.sqrt(n)))
+        sample = self._decode(rng.choice(live_rows, size=min(n, sample_size), replace=False))
+        centroids = sample[rng.choice(sample.shape[0], size=min(nlist, sample.shape[0]), replace=False)]
+
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            for c in range(centroids.shape[0]):
+                members = sample[assignment == c]
+                if len(members):
+                    centroids[c] = members.sum(axis=0)
+            centroids = normalize(centroids)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, SCORE_BLOCK_ROWS):
+            block = self._decode(live_rows[start:start + SCORE_BLOCK_ROWS])
+            assignment[start:start + SCORE_BLOCK_ROWS] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(centroids.shape[0] + 1))
+        self._centroids = centroids
+        self._lists = []
+        for c in range(centroids.shape[0]):
+            bucket = EmbeddingBuffer((), np.int64, initial_capacity=bounds[c + 1] - bounds[c])
+            bucket.append(live_rows[order[bounds[c]:bounds[c + 1]]])
+            self._lists.append(bucket)
+        self._trained_size = n